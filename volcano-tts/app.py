@@ -1,40 +1,46 @@
 from fastapi import FastAPI, HTTPException, Response, Header, Depends, Request, File, UploadFile
-from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, HTMLResponse
+from fastapi.responses import StreamingResponse, JSONResponse, HTMLResponse
 from pydantic import BaseModel
 import uvicorn
-import requests
-import base64
 import json
 import re
 import io
 import asyncio
 import concurrent.futures
 import time
-from typing import List, Generator, Dict, Any
-from functools import lru_cache
+from typing import List, Generator, AsyncGenerator, Dict, Any, Optional
 import warnings
-import urllib3
 import uuid
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from fastapi.staticfiles import StaticFiles
+from starlette.background import BackgroundTask
+from starlette.concurrency import iterate_in_threadpool
 import traceback
-import datetime
 
 # 导入配置和日志模块
 import config
 from logger import get_logger
 from text_filter import filter_text, text_filter
-from debug_utils import save_request_text, save_audio_data, get_debug_info
+from debug_utils import start_capture, finish_capture, get_debug_info, query_captures, debug_writer, DebugCapture
+from audio_cache import audio_cache
+from deadline import Deadline, DeadlineExceeded
+from text_pipeline import split_text, clean_text, resolve_voice
+from synthesis import get_segment_audio_cached, iter_segment_audio_cached, SILENT_MP3
+from scheduler import synthesis_scheduler, classify_priority, SchedulerFull, Ticket
+from tenants import tenant_registry, Tenant, QuotaExceeded
+from jobs import JobManager, JOB_COMPLETED
+from file_response import RangeFileResponse
+from prewarm import prewarmer
+from loop_monitor import loop_monitor
+import metrics
+import upstream
 
 # 设置日志
 logger = get_logger()
 request_logger = get_logger('request')
 error_logger = get_logger('error')
 
-# 禁用不安全请求警告
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
 app = FastAPI(title="Volcano TTS API")
 
 # 添加CORS中间件
@@ -46,15 +52,6 @@ app.add_middleware(
     allow_headers=["*"],  # 允许所有头
 )
 
-# 创建持久会话
-session = requests.Session()
-adapter = requests.adapters.HTTPAdapter(
-    pool_connections=10,
-    pool_maxsize=10,
-    max_retries=3
-)
-session.mount('https://', adapter)
-
 class TTSRequest(BaseModel):
     model: str = "tts-1"  # OpenAI 格式
     input: str           # 要转换的文本
@@ -62,6 +59,16 @@ class TTSRequest(BaseModel):
     response_format: str = "mp3"  # 输出格式
     stream: bool = False  # 是否使用流式响应
 
+class BatchItem(BaseModel):
+    input: str           # 要转换的文本
+    voice: str           # 声音选择
+    id: Optional[str] = None  # 调用方的条目标识，原样返回
+
+class BatchTTSRequest(BaseModel):
+    model: str = "tts-1"
+    items: List[BatchItem]
+    response_format: str = "mp3"
+
 # 验证API密钥的依赖函数
 async def verify_api_key(authorization: str = Header(None)):
     """验证 API 密钥"""
@@ -73,256 +80,377 @@ async def verify_api_key(authorization: str = Header(None)):
         )
 
     provided_key = authorization.replace("Bearer ", "")
-    if provided_key != config.API_KEY:
+    tenant = tenant_registry.get(provided_key)
+    if tenant is None:
         request_logger.warning(f"Invalid API key provided: {provided_key}")
         raise HTTPException(
             status_code=401,
             detail="Invalid API key"
         )
-    return True
+    return tenant
 
-# 文本分段函数
-def split_text(text: str, max_length: int = config.MAX_TEXT_LENGTH) -> List[str]:
-    """
-    将长文本分割成适合TTS处理的短段落
-
-    参数:
-        text: 要分割的文本
-        max_length: 每段最大长度
+# 单段请求的合成线程池：线程数按调度器的并发上限设置（两倍余量供缓存命中和等待合并的请求使用），
+# 其余任务在线程池队列中等待，不为每个排队的段落创建一个阻塞在调度器中的线程
+single_segment_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=max(1, config.SCHEDULER_MAX_CONCURRENCY) * 2, thread_name_prefix="tts-single"
+)
 
-    返回:
-        分割后的文本段落列表
+metrics.registry.gauge("tts_executor_queue_depth", "单段请求线程池中等待执行的任务数",
+                       lambda: metrics.executor_queue_depth(single_segment_executor))
+metrics.registry.gauge("tts_scheduler_running", "正在执行的段落合成数", lambda: synthesis_scheduler.running)
+metrics.registry.gauge("tts_scheduler_queue_depth", "调度器中等待合成名额的段落数",
+                       lambda: synthesis_scheduler.snapshot()["queued"])
+metrics.registry.gauge("tts_scheduler_outstanding_segments", "已准入但尚未完成的段落数",
+                       lambda: synthesis_scheduler.outstanding)
+
+# 记录请求的阶段耗时
+def record_stages(deadline: Deadline) -> None:
+    """把各阶段耗时和总耗时记录到直方图，总耗时超过 SLOW_REQUEST_THRESHOLD 时输出完整的阶段耗时"""
+    stages = deadline.snapshot()
+    total = deadline.elapsed()
+    for stage, seconds in stages.items():
+        metrics.stage_duration.observe(seconds, stage=stage)
+    metrics.stage_duration.observe(total, stage="total")
+    if config.SLOW_REQUEST_THRESHOLD > 0 and total >= config.SLOW_REQUEST_THRESHOLD:
+        breakdown = ", ".join(f"{stage}={seconds:.3f}秒"
+                              for stage, seconds in sorted(stages.items(), key=lambda item: -item[1]))
+        logger.warning(f"慢请求 [{deadline.request_id}]: 总耗时 {total:.3f}秒，阶段耗时: {breakdown or '无'}")
+
+# 请求结束：保存调试记录并记录阶段耗时
+def finish_request(capture: Optional[DebugCapture], deadline: Optional[Deadline], **kwargs) -> None:
+    """调用 finish_capture（附带阶段耗时），保存调试记录的耗时计入 debug 阶段"""
+    if deadline is None:
+        finish_capture(capture, **kwargs)
+        return
+    debug_start = time.time()
+    finish_capture(capture, stages=deadline.snapshot(), **kwargs)
+    if capture is not None:
+        deadline.add("debug", time.time() - debug_start)
+    record_stages(deadline)
+
+# 并行处理多个文本段落，按原始顺序逐个产出结果
+async def iter_segments_ordered(segments: List[str], speaker: str, lang: str,
+                                deadline: Optional[Deadline] = None,
+                                ticket: Optional[Ticket] = None) -> AsyncGenerator[bytes, None]:
     """
-    # 如果文本长度小于最大长度，直接返回
-    if len(text) <= max_length:
-        return [text]
-
-    # 分段结果
-    segments = []
-
-    # 按标点符号分割
-    # 优先级：句号/问号/感叹号 > 逗号/分号/冒号 > 其他
-    patterns = [
-        r'[.!?。！？]', # 句末标点
-        r'[,;:，；：]', # 句中标点
-        r'[ \n\t]'     # 空格和换行
-    ]
-
-    # 当前处理的文本
-    remaining_text = text
-
-    while len(remaining_text) > max_length:
-        # 在最大长度范围内寻找合适的分割点
-        segment = remaining_text[:max_length]
-        split_pos = -1
-
-        # 按优先级尝试不同的分割模式
-        for pattern in patterns:
-            # 从后向前查找最后一个匹配的标点
-            matches = list(re.finditer(pattern, segment))
-            if matches:
-                # 找到最后一个匹配的位置
-                split_pos = matches[-1].end()
-                break
-
-        # 如果没有找到合适的分割点，强制在最大长度处分割
-        if split_pos == -1:
-            split_pos = max_length
+    并行处理多个文本段落，并按原始顺序产出每个段落的音频
 
-        # 添加分段并更新剩余文本
-        segments.append(remaining_text[:split_pos].strip())
-        remaining_text = remaining_text[split_pos:].strip()
-
-    # 添加最后一段
-    if remaining_text:
-        segments.append(remaining_text)
-
-    return segments
-
-# 使用LRU缓存来缓存TTS结果，提高性能
-@lru_cache(maxsize=200)  # 增加缓存容量
-def get_segment_audio_cached(text: str, speaker: str, lang: str) -> bytes:
-    """获取单个文本段落的音频数据（带缓存）"""
-    config.PERFORMANCE_METRICS["cache_hits"] += 1
-    return get_segment_audio(text, speaker, lang)
-
-# 获取单个文本段落的音频数据
-def get_segment_audio(text: str, speaker: str, lang: str) -> bytes:
-    """获取单个文本段落的音频数据"""
-    config.PERFORMANCE_METRICS["cache_misses"] += 1
-    start_time = time.time()
-
-    # 预处理文本，确保没有特殊字符
-    text = text.strip()
-    if not text:
-        logger.warning("文本为空，返回空音频")
-        return b''
-
-    # 构建火山引擎请求头
-    headers = {
-        "authority": "translate.volcengine.com",
-        "origin": "chrome-extension://klgfhbdadaspgppeadghjjemk",
-        "accept": "application/json, text/plain, */*",
-        "content-type": "application/json",
-        "sec-fetch-dest": "empty",
-        "sec-fetch-mode": "cors",
-        "sec-fetch-site": "none",
-        "cookie": "hasUserBehavior=1",
-        "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/106.0.0.0 Safari/537.36"
-    }
-
-    # 构建请求负载
-    payload = {
-        "text": text,
-        "speaker": speaker,
-        "language": lang
-    }
-
-    logger.debug(f"请求负载: {json.dumps(payload)}")
+    所有段落同时提交到线程池，生成器按顺序等待结果，
+    因此只要前缀段落已完成就会立即产出，无需等待最慢的段落。
+    失败、为空或超过截止时间的段落产出 b''。
+    """
+    # 根据段落数量动态调整工作线程数
+    optimal_workers = max(1, min(len(segments), config.MAX_WORKERS))
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=optimal_workers)
+    loop = asyncio.get_event_loop()
+
+    # 创建任务列表
+    tasks = []
+    for segment in segments:
+        # 跳过空段落
+        if not segment or segment.isspace():
+            logger.warning("跳过空段落")
+            tasks.append(None)
+            continue
+        tasks.append(loop.run_in_executor(executor, get_segment_audio_cached,
+                                          segment, speaker, lang, deadline, ticket))
 
     try:
-        # 发送请求
-        response = session.post(
-            "https://translate.volcengine.com/web/tts/v1/",
-            headers=headers,
-            json=payload,
-            timeout=10,
-            verify=False
-        )
-
-        # 检查响应状态
-        logger.debug(f"响应状态: {response.status_code}, 内容类型: {response.headers.get('content-type', 'unknown')}")
-        response.raise_for_status()
-
-        # 解析响应
-        result = response.json()
-        if "audio" in result:
+        for i, task in enumerate(tasks):
+            if task is None:
+                yield b''
+                continue
             try:
-                # 检查audio是否为字符串（Base64编码）
-                if isinstance(result["audio"], str):
-                    # 解码Base64音频数据
-                    audio_data = base64.b64decode(result["audio"])
-                elif isinstance(result["audio"], dict) and "data" in result["audio"]:
-                    # 兼容旧版API格式
-                    audio_data = base64.b64decode(result["audio"]["data"])
+                if deadline is not None:
+                    result = await asyncio.wait_for(asyncio.shield(task), max(0.0, deadline.remaining()))
                 else:
-                    logger.error(f"未知的音频数据格式: {type(result['audio'])}")
-                    return b''
-
-                # 确保音频数据是有效的MP3格式
-                if not audio_data.startswith(b'\xFF\xFB') and not audio_data.startswith(b'ID3'):
-                    logger.warning("返回的音频数据不是有效的MP3格式，尝试修复")
-                    # 添加MP3头
-                    audio_data = b'\xFF\xFB\x90\x44\x00' + audio_data
-
-                # 确保音频数据以MP3结尾标记结束
-                if not audio_data.endswith(b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'):
-                    logger.warning("添加MP3结尾标记")
-                    audio_data += b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
-
-                # 验证音频数据大小
-                if len(audio_data) < 100:
-                    logger.warning(f"生成的音频数据过小 ({len(audio_data)} 字节)，可能无效")
-                    # 生成一个简单的静音MP3
-                    audio_data = b'\xFF\xFB\x90\x44\x00' + b'\x00' * 1000 + b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
-
-                logger.info(f"成功生成音频段落, 大小: {len(audio_data)} 字节, 耗时: {time.time() - start_time:.2f}秒")
-                return audio_data
+                    result = await task
+            except asyncio.TimeoutError:
+                logger.warning(f"段落 {i+1} 超过请求截止时间，已放弃")
+                result = b''
             except Exception as e:
-                logger.error(f"处理音频数据失败: {str(e)}")
-                return b''
-        else:
-            logger.error(f"响应中没有音频数据: {result}")
-            return b''
-    except Exception as e:
-        logger.error(f"获取音频数据失败: {str(e)}")
-        return b''
+                logger.error(f"段落 {i+1} 处理失败: {str(e)}")
+                result = b''
+            if not result:
+                logger.warning(f"段落 {i+1} 返回空音频")
+            yield result or b''
+    finally:
+        # 客户端提前断开时取消尚未开始的任务
+        for task in tasks:
+            if task is not None and not task.done():
+                task.cancel()
+        executor.shutdown(wait=False)
 
 # 并行处理多个文本段落
-async def process_segments_parallel(segments: List[str], speaker: str, lang: str) -> List[bytes]:
+async def process_segments_parallel(segments: List[str], speaker: str, lang: str,
+                                    deadline: Optional[Deadline] = None,
+                                    ticket: Optional[Ticket] = None) -> List[bytes]:
     """并行处理多个文本段落"""
-    # 根据CPU核心数和段落数量动态调整工作线程数
-    optimal_workers = min(len(segments), config.MAX_WORKERS)
+    return [audio_data async for audio_data in iter_segments_ordered(segments, speaker, lang, deadline, ticket)]
+
+# 按顺序尽早输出并行处理的结果（非流式请求）
+async def generate_audio_ordered(text_segments: List[str], speaker: str, lang: str,
+                                 request_id: str, start_time: float,
+                                 deadline: Optional[Deadline] = None,
+                                 ticket: Optional[Ticket] = None,
+                                 capture: Optional[DebugCapture] = None) -> AsyncGenerator[bytes, None]:
+    """
+    非流式长文本的分块响应：并行合成所有段落，
+    每当连续的前缀段落完成时立即输出，最终字节与一次性返回完全相同
+    """
+    all_audio_data = bytearray()
+    empty_segments = 0
+    # 拼接完整音频（用于统计和调试记录）的累计耗时
+    assembly_time = 0.0
+    # 客户端在响应结束前断开时，生成器在 yield 处收到 GeneratorExit 或 CancelledError
+    disconnected = False
+    try:
+        async for audio_data in iter_segments_ordered(text_segments, speaker, lang, deadline, ticket):
+            if audio_data:
+                assembly_start = time.time()
+                all_audio_data.extend(audio_data)
+                assembly_time += time.time() - assembly_start
+                yield audio_data
+            else:
+                empty_segments += 1
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=optimal_workers) as executor:
-        loop = asyncio.get_event_loop()
-        # 创建任务列表
-        tasks = []
-        for segment in segments:
-            # 跳过空段落
-            if not segment or segment.isspace():
-                logger.warning("跳过空段落")
-                tasks.append(loop.create_task(asyncio.sleep(0, result=b'')))
-                continue
+        # 检查是否成功生成音频
+        if not all_audio_data:
+            logger.warning("未能生成有效音频，返回静音MP3")
+            all_audio_data.extend(SILENT_MP3)
+            yield SILENT_MP3
+    except (GeneratorExit, asyncio.CancelledError):
+        disconnected = True
+        raise
+    finally:
+        if ticket is not None:
+            ticket.close()
 
-            # 检查缓存
-            try:
-                # 尝试从缓存获取
-                if get_segment_audio_cached.cache_info().currsize > 0:
-                    audio_data = get_segment_audio_cached(segment, speaker, lang)
-                    tasks.append(loop.create_task(asyncio.sleep(0, result=audio_data)))
-                    continue
-            except Exception:
-                pass
-
-            # 如果缓存未命中，创建新的处理任务
-            task = loop.run_in_executor(
-                executor,
-                get_segment_audio_cached,
-                segment,
-                speaker,
-                lang
-            )
-            tasks.append(task)
-
-        # 等待所有任务完成
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-
-        # 过滤掉异常和空结果
-        valid_results = []
-        for i, result in enumerate(results):
-            if isinstance(result, Exception):
-                logger.error(f"段落 {i+1} 处理失败: {str(result)}")
-                valid_results.append(b'')
-            elif not result:
-                logger.warning(f"段落 {i+1} 返回空音频")
-                valid_results.append(b'')
-            else:
-                valid_results.append(result)
+        # 更新性能指标
+        process_time = time.time() - start_time
+        metrics.increment("total_audio_size", len(all_audio_data))
 
-        return valid_results
+        errors = []
+        if disconnected:
+            logger.warning(f"客户端在响应结束前断开连接 [{request_id}], 已发送: {len(all_audio_data)} 字节")
+            errors.append("客户端在响应结束前断开连接")
+        else:
+            logger.info(f"成功生成完整音频 [{request_id}], 大小: {len(all_audio_data)} 字节, 耗时: {process_time:.2f}秒")
+        if empty_segments:
+            errors.append(f"{empty_segments} 个段落返回空音频")
+        if deadline is not None:
+            deadline.mark("synthesis")
+            deadline.add("assembly", assembly_time)
+
+        # 保存调试记录（按采集策略，客户端断开的请求同样保存）
+        finish_request(
+            capture,
+            deadline,
+            error="; ".join(errors) if errors else None,
+            # 只在确实记录调试信息时复制完整音频
+            audio_data=bytes(all_audio_data) if capture is not None else None,
+            audio_size=len(all_audio_data)
+        )
 
 # 流式生成音频数据
-def generate_audio_stream(text_segments: List[str], speaker: str, lang: str) -> Generator[bytes, None, None]:
-    """流式生成音频数据"""
-    for segment in text_segments:
-        try:
-            # 尝试从缓存获取
-            audio_data = get_segment_audio_cached(segment, speaker, lang)
-            # 分块发送音频数据
-            chunk_size = 32768  # 32KB chunks
-            for i in range(0, len(audio_data), chunk_size):
-                yield audio_data[i:i + chunk_size]
-        except Exception as e:
-            error_logger.error(f"生成段落音频时出错: {str(e)}", exc_info=True)
-            # 继续处理下一段，而不是中断整个流
-
-# 预热服务
-def warm_up_service():
-    """预热服务，提前加载模型和建立连接"""
-    common_phrases = ["你好", "谢谢", "欢迎使用"]
-    for phrase in common_phrases:
+def generate_audio_stream(text_segments: List[str], speaker: str, lang: str,
+                          deadline: Optional[Deadline] = None,
+                          ticket: Optional[Ticket] = None,
+                          capture: Optional[DebugCapture] = None) -> Generator[bytes, None, None]:
+    """流式生成音频数据，超过截止时间后放弃剩余段落"""
+    audio_size = 0
+    errors = []
+    try:
+        for i, segment in enumerate(text_segments):
+            if deadline is not None and deadline.expired():
+                logger.warning(f"超过请求截止时间，放弃剩余 {len(text_segments) - i} 个段落")
+                errors.append(f"超过截止时间，放弃剩余 {len(text_segments) - i} 个段落")
+                break
+            try:
+                # 缓存命中时分块发送，未命中时边下载边发送上游音频
+                for chunk in iter_segment_audio_cached(segment, speaker, lang, deadline, ticket):
+                    audio_size += len(chunk)
+                    yield chunk
+            except DeadlineExceeded as e:
+                logger.warning(f"放弃段落 {i+1}: {str(e)}")
+                errors.append(f"段落 {i+1}: {str(e)}")
+            except Exception as e:
+                error_logger.error(f"生成段落音频时出错: {str(e)}", exc_info=True)
+                errors.append(f"段落 {i+1}: {str(e)}")
+                # 继续处理下一段，而不是中断整个流
+    except GeneratorExit:
+        # 客户端在流式响应结束前断开，生成器在 yield 处被关闭
+        logger.warning(f"客户端在流式响应结束前断开连接，已发送: {audio_size} 字节")
+        errors.append("客户端在流式响应结束前断开连接")
+        raise
+    finally:
+        if ticket is not None:
+            ticket.close()
+        if deadline is not None:
+            deadline.mark("synthesis")
+
+        # 保存调试记录（流式响应不保留完整音频，客户端断开的请求同样保存）
+        finish_request(
+            capture,
+            deadline,
+            error="; ".join(errors) if errors else None,
+            audio_size=audio_size
+        )
+
+# 在线程池中迭代同步生成器，响应结束时（包括客户端断开）关闭生成器
+async def iterate_and_close(generator: Generator[bytes, None, None]) -> AsyncGenerator[bytes, None]:
+    """
+    客户端断开时 StreamingResponse 取消发送任务，同步生成器停在 yield 处，
+    要等到被垃圾回收才会关闭。这里在取消传播时立即关闭，
+    使生成器的 finally（归还调度预算、保存调试记录）确定执行
+    """
+    try:
+        async for chunk in iterate_in_threadpool(generator):
+            yield chunk
+    finally:
+        generator.close()
+
+# 批量合成：按完成顺序输出各条目
+async def generate_batch_parts(items: List[Dict[str, Any]], unique_segments: List[tuple], boundary: str,
+                               deadline: Optional[Deadline] = None,
+                               ticket: Optional[Ticket] = None) -> AsyncGenerator[bytes, None]:
+    """
+    批量合成的multipart/mixed响应
+
+    所有条目去重后的段落共用一个线程池和缓存，
+    每个条目的全部段落完成后立即作为一个part输出，不按提交顺序等待。
+    """
+    loop = asyncio.get_event_loop()
+    executor = None
+    segment_tasks = {}
+    if unique_segments:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(len(unique_segments), config.MAX_WORKERS)))
+        for key in unique_segments:
+            segment_tasks[key] = loop.run_in_executor(executor, get_segment_audio_cached, *key, deadline, ticket)
+
+    async def wait_item(index: int, item: Dict[str, Any]):
+        tasks = [segment_tasks[key] for key in item["segments"]]
+        if not tasks:
+            return index, b''
+        timeout = max(0.0, deadline.remaining()) if deadline is not None else None
         try:
-            get_segment_audio_cached(phrase, "zh_male_xiaoming", "zh")
-            logger.info(f"服务预热完成，使用短语: {phrase}")
-        except Exception as e:
-            error_logger.error(f"服务预热过程中出错: {str(e)}", exc_info=True)
+            results = await asyncio.wait_for(asyncio.gather(*[asyncio.shield(task) for task in tasks],
+                                                            return_exceptions=True), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"批量条目 {index} 超过请求截止时间，已放弃")
+            results = []
+        audio_data = b''.join(result for result in results if isinstance(result, bytes))
+        return index, audio_data or SILENT_MP3
+
+    item_tasks = [asyncio.ensure_future(wait_item(index, item)) for index, item in enumerate(items)]
+    try:
+        for completed in asyncio.as_completed(item_tasks):
+            index, audio_data = await completed
+            item = items[index]
+            headers = [
+                "Content-Type: audio/mpeg",
+                f"Content-Length: {len(audio_data)}",
+                f"X-Item-Index: {index}"
+            ]
+            if item["id"] is not None:
+                # 去掉换行符，避免伪造part头
+                item_id = re.sub(r'[\r\n]', ' ', item["id"])
+                headers.append(f"X-Item-Id: {item_id}")
+            if not item["segments"]:
+                headers.append("X-Filter-Result: empty_after_filtering")
+            yield (f"--{boundary}\r\n" + "\r\n".join(headers) + "\r\n\r\n").encode('utf-8')
+            yield audio_data
+            yield b"\r\n"
+        yield f"--{boundary}--\r\n".encode('utf-8')
+        if deadline is not None:
+            deadline.mark("synthesis")
+            record_stages(deadline)
+    finally:
+        for task in item_tasks + list(segment_tasks.values()):
+            if not task.done():
+                task.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False)
+        if ticket is not None:
+            ticket.close()
+
+# 后台任务管理器
+job_manager = JobManager(config.JOBS_DIR, get_segment_audio_cached, config.JOB_WORKERS)
+
+# 启动状态（用于 /readyz）
+startup_state = {"started_at": time.time(), "jobs_resumed": False}
+
+def resume_jobs():
+    """恢复重启前未完成的后台任务（在线程中运行，任务目录较大时不阻塞事件循环）"""
+    try:
+        resumed = job_manager.resume()
+        if resumed:
+            logger.info(f"已恢复 {resumed} 个未完成的后台任务")
+    except Exception as e:
+        logger.error(f"恢复后台任务失败: {str(e)}", exc_info=True)
+    startup_state["jobs_resumed"] = True
 
 @app.on_event("startup")
 async def startup_event():
-    """服务启动时执行的操作"""
-    # 预热服务
-    warm_up_service()
+    """服务启动时执行的操作（只做本地初始化，访问上游和磁盘的工作都放到后台）"""
+    # 监控事件循环延迟，阻塞时记录调用栈
+    loop_monitor.start()
+
+    # 调试文件由后台线程写入，启动时在后台加载已有文件的索引
+    if config.DEBUG_MODE:
+        debug_writer.start()
+
+    # 在后台建立上游连接，完成DNS解析和TLS握手
+    upstream.connection_warmer.start()
+
+    # 在后台根据历史流量预热缓存
+    prewarmer.start()
+
+    asyncio.get_running_loop().run_in_executor(None, resume_jobs)
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """服务停止时执行的操作"""
+    prewarmer.stop()
+    loop_monitor.stop()
+    debug_writer.flush()
+
+def _metric_labels(request: Request) -> Dict[str, str]:
+    """
+    请求的指标标签
+
+    路径使用路由模板（如 /v1/audio/jobs/{job_id}），避免路径参数产生大量标签；
+    合成接口在解析声音后把话者和流式模式写入 request.state。
+    """
+    route = request.scope.get("route")
+    stream = getattr(request.state, "stream", None)
+    return {
+        "path": getattr(route, "path", "other"),
+        "voice": getattr(request.state, "voice", ""),
+        "stream": "" if stream is None else str(bool(stream)).lower()
+    }
+
+def _observe_request(request: Request, status_code: int, start_time: float,
+                     first_byte_time: Optional[float] = None) -> None:
+    """记录请求计数、总耗时和首字节时间"""
+    end_time = time.time()
+    labels = _metric_labels(request)
+    metrics.http_requests.inc(status=status_code, **labels)
+    metrics.request_duration.observe(end_time - start_time, path=labels["path"], stream=labels["stream"])
+    metrics.request_ttfb.observe((first_byte_time or end_time) - start_time,
+                                 path=labels["path"], stream=labels["stream"])
+
+async def _timed_body(body_iterator, request: Request, status_code: int,
+                      start_time: float) -> AsyncGenerator[bytes, None]:
+    """转发响应体，发送完毕（或客户端断开）后记录首字节时间和总耗时"""
+    first_byte_time = None
+    try:
+        async for chunk in body_iterator:
+            if first_byte_time is None and chunk:
+                first_byte_time = time.time()
+            yield chunk
+    finally:
+        _observe_request(request, status_code, start_time, first_byte_time)
 
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
@@ -331,7 +459,7 @@ async def log_requests(request: Request, call_next):
     start_time = time.time()
 
     # 更新请求计数
-    config.PERFORMANCE_METRICS["total_requests"] += 1
+    metrics.increment("total_requests")
 
     # 记录请求信息
     request_id = str(time.time())
@@ -353,10 +481,12 @@ async def log_requests(request: Request, call_next):
 
         # 更新统计信息
         if response.status_code < 400:
-            config.PERFORMANCE_METRICS["successful_requests"] += 1
+            metrics.increment("successful_requests")
         else:
-            config.PERFORMANCE_METRICS["failed_requests"] += 1
+            metrics.increment("failed_requests")
 
+        # 流式响应在这里只返回了响应头，耗时在响应体发送完毕后记录
+        response.body_iterator = _timed_body(response.body_iterator, request, response.status_code, start_time)
         return response
     except Exception as e:
         # 记录异常
@@ -366,11 +496,37 @@ async def log_requests(request: Request, call_next):
             f"错误: {str(e)} - 耗时: {process_time:.4f}秒",
             exc_info=True
         )
-        config.PERFORMANCE_METRICS["failed_requests"] += 1
+        metrics.increment("failed_requests")
+        _observe_request(request, 500, start_time)
         raise
 
+def prepare_text(original_text: str, deadline: Optional[Deadline] = None) -> tuple:
+    """应用文本过滤和清理，返回 (过滤后的文本, 清理后的文本, 过滤命中的内容)"""
+    filtered_text, filtered_items = text_filter.filter_text(original_text)
+    if deadline is not None:
+        deadline.mark("filter")
+
+    # 如果有内容被过滤，记录日志
+    if filtered_items:
+        logger.info(f"已过滤 {len(filtered_items)} 处内容，原文本长度: {len(original_text)}，过滤后长度: {len(filtered_text)}")
+        for item in filtered_items:
+            logger.debug(f"过滤规则 '{item['rule_name']}' 匹配内容: {item['content'][:50]}...")
+
+    # 额外的文本清理步骤，处理特殊字符和格式
+    cleaned_text = clean_text(filtered_text)
+
+    # 记录清理结果
+    if cleaned_text != filtered_text:
+        logger.info(f"文本清理: 过滤后长度={len(filtered_text)}, 清理后长度={len(cleaned_text)}")
+    if deadline is not None:
+        deadline.mark("clean")
+    return filtered_text, cleaned_text, filtered_items
+
 @app.post("/v1/audio/speech")
-async def create_speech(request: TTSRequest, raw_request: Request, _: bool = Depends(verify_api_key)):
+async def create_speech(request: TTSRequest, raw_request: Request, tenant: Tenant = Depends(verify_api_key)):
+    capture = None
+    deadline = None
+    ticket = None
     try:
         # 生成请求ID
         request_id = str(uuid.uuid4())[:8]
@@ -378,83 +534,43 @@ async def create_speech(request: TTSRequest, raw_request: Request, _: bool = Dep
         # 记录请求开始时间
         start_time = time.time()
 
+        # 端到端截止时间，可通过 X-Request-Timeout 请求头（秒）指定
+        deadline = Deadline.from_header(raw_request.headers.get('X-Request-Timeout'), request_id)
+        raw_request.state.stream = request.stream
+
         # 记录请求
-        logger.info(f"收到TTS请求 [{request_id}]: voice={request.voice}, text_length={len(request.input)}, stream={request.stream}")
+        logger.info(f"收到TTS请求 [{request_id}]: tenant={tenant.name}, voice={request.voice}, text_length={len(request.input)}, stream={request.stream}")
 
-        # 获取并保存完全原始的请求体
+        # 获取完全原始的请求体
+        raw_body_text = ''
         try:
             raw_body = await raw_request.body()
             raw_body_text = raw_body.decode('utf-8')
             logger.info(f"原始请求体 [{request_id}]: {raw_body_text[:200]}...")
-
-            # 保存原始请求体
-            if config.DEBUG_MODE and config.DEBUG_SAVE_TEXT:
-                raw_data = {
-                    "timestamp": datetime.datetime.now().isoformat(),
-                    "request_id": request_id,
-                    "raw_request_body": raw_body_text,
-                    "parsed_request": request.dict()
-                }
-
-                # 确保目录存在
-                text_dir = os.path.join(config.DEBUG_DIR, 'text')
-                os.makedirs(text_dir, exist_ok=True)
-
-                # 生成文件名
-                timestamp = int(time.time())
-                filename = f"{timestamp}_{request_id}_raw.json"
-                filepath = os.path.join(text_dir, filename)
-
-                # 保存到文件
-                with open(filepath, 'w', encoding='utf-8') as f:
-                    json.dump(raw_data, f, ensure_ascii=False, indent=2)
-
-                logger.info(f"已保存原始请求体到 {filepath}")
         except Exception as e:
-            logger.error(f"保存原始请求体失败: {str(e)}")
+            logger.error(f"读取原始请求体失败: {str(e)}")
+        deadline.mark("body")
 
-        # 保存原始请求文本（调试模式）
-        save_request_text(request_id, request.dict())
+        # 调试记录（请求结束时按采集策略决定是否保存）
+        capture = start_capture(request_id, raw_body_text, request.dict())
+        if capture is not None:
+            deadline.mark("debug")
 
-        # 应用文本过滤（如果启用）
+        # 文本过滤和清理（长文本的正则处理耗时较长，在线程中执行）
+        loop = asyncio.get_event_loop()
         original_text = request.input
-        filtered_text, filtered_items = text_filter.filter_text(original_text)
-
-        # 如果有内容被过滤，记录日志
-        if filtered_items:
-            logger.info(f"已过滤 {len(filtered_items)} 处内容，原文本长度: {len(original_text)}，过滤后长度: {len(filtered_text)}")
-            for item in filtered_items:
-                logger.debug(f"过滤规则 '{item['rule_name']}' 匹配内容: {item['content'][:50]}...")
-
-        # 额外的文本清理步骤，处理特殊字符和格式
-        # 1. 移除所有HTML标签
-        cleaned_text = re.sub(r'<[^>]*>', '', filtered_text)
-
-        # 2. 规范化换行符
-        cleaned_text = re.sub(r'\r\n', '\n', cleaned_text)
-        cleaned_text = re.sub(r'\r', '\n', cleaned_text)
-
-        # 3. 移除连续的换行符
-        cleaned_text = re.sub(r'\n{3,}', '\n\n', cleaned_text)
-
-        # 4. 移除特殊Unicode字符
-        cleaned_text = re.sub(r'[\u2000-\u206F\u2E00-\u2E7F\\\'!"#$%&()*+,\-.\/:;<=>?@\[\]^_`{|}~]', ' ', cleaned_text)
-
-        # 5. 移除多余的空格
-        cleaned_text = re.sub(r' {2,}', ' ', cleaned_text)
-        cleaned_text = cleaned_text.strip()
-
-        # 记录清理结果
-        if cleaned_text != filtered_text:
-            logger.info(f"文本清理: 过滤后长度={len(filtered_text)}, 清理后长度={len(cleaned_text)}")
-
-        # 保存过滤后的文本（调试模式）
-        if filtered_text != original_text or cleaned_text != filtered_text:
-            save_request_text(request_id, {'original': original_text}, cleaned_text)
+        filtered_text, cleaned_text, filtered_items = await loop.run_in_executor(
+            None, prepare_text, original_text, deadline
+        )
+        if capture is not None:
+            capture.filtered_text = filtered_text
+            capture.cleaned_text = cleaned_text
+            capture.filter_hits = [item['rule_name'] for item in filtered_items]
 
         # 检查清理后的文本是否为空或只包含空白字符
         if not cleaned_text or cleaned_text.isspace():
             logger.warning("清理后文本为空，返回空响应")
+            finish_request(capture, deadline)
             # 返回空音频响应 - 完全模拟OpenAI的TTS API响应格式
             return Response(
                 content=b'',  # 空字节数组
@@ -465,7 +581,9 @@ async def create_speech(request: TTSRequest, raw_request: Request, _: bool = Dep
                     "Access-Control-Allow-Origin": "*",
                     "Access-Control-Allow-Headers": "*",
                     "Access-Control-Allow-Methods": "*",
-                    "X-Filter-Result": "empty_after_filtering"
+                    "X-Filter-Result": "empty_after_filtering",
+                    "Server-Timing": deadline.server_timing(),
+                    "Timing-Allow-Origin": "*"
                 }
             )
 
@@ -473,91 +591,111 @@ async def create_speech(request: TTSRequest, raw_request: Request, _: bool = Dep
         request.input = cleaned_text
 
         # 确定语言和说话人
-        lang = "zh"  # 默认中文
-        speaker = request.voice
-
-        # 如果传入的是语音名称而不是ID，尝试查找对应的ID
-        voice_id_found = False
-        for lang_code, voice_dict in config.VOICE_CONFIG.items():
-            # 通过名称查找ID
-            for voice_id, voice_name in voice_dict.items():
-                if voice_name == speaker:
-                    speaker = voice_id
-                    lang = config.LANGUAGE_MAP.get(lang_code, "zh")
-                    voice_id_found = True
-                    break
-            # 通过ID查找
-            if not voice_id_found and speaker in voice_dict:
-                lang = config.LANGUAGE_MAP.get(lang_code, "zh")
-                voice_id_found = True
-                break
-            if voice_id_found:
-                break
-
-        # 如果没找到指定的声音，使用默认话者
-        if not voice_id_found:
-            logger.warning(f"未找到声音 {speaker}，使用默认声音")
-            lang = "zh"
-            speaker = config.DEFAULT_SPEAKERS["zh_cn"]
+        speaker, lang = resolve_voice(request.voice)
+        raw_request.state.voice = speaker
+        deadline.mark("voice")
 
         # 分割长文本
-        text_segments = split_text(request.input)
+        text_segments = await loop.run_in_executor(None, split_text, request.input)
         logger.info(f"文本已分割为 {len(text_segments)} 个段落")
+        deadline.mark("split")
+        if capture is not None:
+            capture.segments = text_segments
+            capture.speaker = speaker
+            capture.lang = lang
+
+        # 准入控制：先扣除租户的字符配额，再进入调度队列
+        # 短文本和流式请求优先，配额不足或排队超出预算时返回429
+        priority = classify_priority(len(request.input), request.stream)
+        try:
+            tenant.charge_chars(len(request.input), len(text_segments))
+            try:
+                ticket = synthesis_scheduler.admit(len(text_segments), priority, tenant)
+            except SchedulerFull:
+                tenant.refund_chars(len(request.input), len(text_segments))
+                raise
+        except (QuotaExceeded, SchedulerFull) as e:
+            metrics.increment("rejected_requests")
+            raise HTTPException(
+                status_code=429,
+                detail=str(e),
+                headers={"Retry-After": str(e.retry_after)}
+            )
+        deadline.mark("admission")
 
         # 更新性能指标
         if request.stream:
-            config.PERFORMANCE_METRICS["stream_requests"] += 1
+            metrics.increment("stream_requests")
         if len(text_segments) > 1:
-            config.PERFORMANCE_METRICS["parallel_requests"] += 1
+            metrics.increment("parallel_requests")
 
-        # 流式响应
+        # 流式响应（响应头在合成前发送，Server-Timing 只包含合成前的阶段）
+        # 生成器结束时归还排队预算；客户端在响应开始前断开时响应体不会被迭代，由后台任务归还
         if request.stream:
             return StreamingResponse(
-                generate_audio_stream(text_segments, speaker, lang),
+                iterate_and_close(generate_audio_stream(text_segments, speaker, lang, deadline, ticket, capture)),
                 media_type="audio/mpeg",
+                background=BackgroundTask(ticket.close),
                 headers={
                     "Content-Type": "audio/mpeg",
                     "Content-Disposition": "attachment; filename=speech.mp3",
                     "Access-Control-Allow-Origin": "*",
                     "Access-Control-Allow-Headers": "*",
-                    "Access-Control-Allow-Methods": "*"
+                    "Access-Control-Allow-Methods": "*",
+                    "Server-Timing": deadline.server_timing(),
+                    "Timing-Allow-Origin": "*"
                 }
             )
 
-        # 非流式响应 - 并行处理所有段落
+        # 非流式响应 - 并行处理所有段落，按顺序分块输出已完成的前缀
+        # 客户端收到的字节与一次性返回完全相同，但首字节时间不再取决于最慢的段落
         if len(text_segments) > 1:
-            # 使用并行处理加速
-            audio_segments = await process_segments_parallel(text_segments, speaker, lang)
-            all_audio_data = bytearray()
-            for audio_data in audio_segments:
-                if audio_data:
-                    all_audio_data.extend(audio_data)
-        else:
-            # 单段处理
-            all_audio_data = get_segment_audio_cached(text_segments[0], speaker, lang)
+            return StreamingResponse(
+                generate_audio_ordered(text_segments, speaker, lang, request_id, start_time, deadline, ticket, capture),
+                media_type="audio/mpeg",
+                background=BackgroundTask(ticket.close),
+                headers={
+                    "Content-Type": "audio/mpeg",
+                    "Content-Disposition": "attachment; filename=speech.mp3",
+                    "Access-Control-Allow-Origin": "*",
+                    "Access-Control-Allow-Headers": "*",
+                    "Access-Control-Allow-Methods": "*",
+                    "Cache-Control": "no-cache",
+                    "Server-Timing": deadline.server_timing(),
+                    "Timing-Allow-Origin": "*"
+                }
+            )
+
+        # 单段处理（在线程中等待上游，不阻塞事件循环）
+        try:
+            all_audio_data = await loop.run_in_executor(
+                single_segment_executor, get_segment_audio_cached, text_segments[0], speaker, lang, deadline, ticket
+            )
+        finally:
+            ticket.close()
+        deadline.mark("synthesis")
 
         # 检查是否成功生成音频
+        synthesis_error = None
         if not all_audio_data:
             logger.warning("未能生成有效音频，返回静音MP3")
-            # 生成一个简单的静音MP3
-            all_audio_data = b'\xFF\xFB\x90\x44\x00' + b'\x00' * 1000 + b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+            synthesis_error = "未能生成有效音频，返回静音MP3"
+            all_audio_data = SILENT_MP3
 
         # 更新性能指标
         process_time = time.time() - start_time
-        config.PERFORMANCE_METRICS["total_audio_size"] += len(all_audio_data)
-        config.PERFORMANCE_METRICS["avg_segment_size"] = (
-            config.PERFORMANCE_METRICS["total_audio_size"] / config.PERFORMANCE_METRICS["successful_requests"]
-            if config.PERFORMANCE_METRICS["successful_requests"] > 0 else 0
-        )
+        metrics.increment("total_audio_size", len(all_audio_data))
 
         logger.info(f"成功生成完整音频 [{request_id}], 大小: {len(all_audio_data)} 字节, 耗时: {process_time:.2f}秒")
+        all_audio_data = bytes(all_audio_data)
+        deadline.mark("assembly")
 
-        # 保存生成的音频数据（调试模式）
-        save_audio_data(request_id, bytes(all_audio_data))
+        # 保存调试记录（按采集策略）
+        finish_request(capture, deadline, error=synthesis_error, audio_data=all_audio_data)
 
         # 返回合并后的MP3音频数据 - 完全模拟OpenAI的TTS API响应格式
         return Response(
-            content=bytes(all_audio_data),
+            content=all_audio_data,
             media_type="audio/mpeg",
             headers={
                 "Content-Type": "audio/mpeg",
@@ -566,14 +704,173 @@ async def create_speech(request: TTSRequest, raw_request: Request, _: bool = Dep
                 "Access-Control-Allow-Origin": "*",
                 "Access-Control-Allow-Headers": "*",
                 "Access-Control-Allow-Methods": "*",
-                "Cache-Control": "no-cache"
+                "Cache-Control": "no-cache",
+                "Server-Timing": deadline.server_timing(),
+                "Timing-Allow-Origin": "*"
             }
         )
 
+    except HTTPException as e:
+        # 准入之后出错时响应不会返回，在这里归还排队预算（Ticket.close 可重复调用）
+        if ticket is not None:
+            ticket.close()
+        finish_request(capture, deadline, status=e.status_code, error=str(e.detail))
+        raise
     except Exception as e:
         error_logger.exception("create_speech 方法出错:")
+        if ticket is not None:
+            ticket.close()
+        finish_request(capture, deadline, status=500, error=str(e))
         raise HTTPException(status_code=500, detail=str(e))
 
+def prepare_batch_items(batch_items: List[BatchItem]) -> tuple:
+    """
+    批量请求的每个条目过滤、清理、分段；相同的声音只解析一次
+
+    返回:
+        (条目列表, 去重后的段落字典, 总字符数, 总段落数)
+    """
+    voices = {}
+    items = []
+    unique_segments = {}
+    total_chars = 0
+    total_segments = 0
+    for item in batch_items:
+        filtered_text, _ = text_filter.filter_text(item.input)
+        cleaned_text = clean_text(filtered_text)
+        if item.voice not in voices:
+            voices[item.voice] = resolve_voice(item.voice)
+        speaker, lang = voices[item.voice]
+        segments = []
+        if cleaned_text:
+            total_chars += len(cleaned_text)
+            for segment in split_text(cleaned_text):
+                if not segment or segment.isspace():
+                    continue
+                key = (segment, speaker, lang)
+                segments.append(key)
+                unique_segments.setdefault(key, None)
+        total_segments += len(segments)
+        items.append({"id": item.id, "segments": segments})
+    return items, unique_segments, total_chars, total_segments
+
+@app.post("/v1/audio/batch")
+async def create_speech_batch(request: BatchTTSRequest, raw_request: Request, tenant: Tenant = Depends(verify_api_key)):
+    """
+    批量合成多个短文本
+
+    相同的段落（文本、话者、语言均相同）在所有条目间只合成一次；
+    响应为 multipart/mixed，每个条目完成后立即输出一个part。
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="items is empty")
+    if len(request.items) > config.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"items exceeds limit {config.BATCH_MAX_ITEMS}")
+
+    request_id = str(uuid.uuid4())[:8]
+    deadline = Deadline.from_header(raw_request.headers.get('X-Request-Timeout'), request_id)
+    metrics.increment("batch_requests")
+
+    # 每个条目过滤、清理、分段（在线程中执行，不阻塞事件循环）
+    loop = asyncio.get_event_loop()
+    items, unique_segments, total_chars, total_segments = await loop.run_in_executor(
+        None, prepare_batch_items, request.items
+    )
+    deduped = total_segments - len(unique_segments)
+    metrics.increment("batch_deduped_segments", deduped)
+    logger.info(f"收到批量TTS请求 [{request_id}]: tenant={tenant.name}, 条目数={len(items)}, "
+                f"段落数={total_segments}, 去重后={len(unique_segments)}")
+    deadline.mark("prepare")
+
+    # 准入控制：按去重后的段落数排队，条目都很短时按交互优先级调度
+    priority = classify_priority(max((len(''.join(key[0] for key in item["segments"])) for item in items), default=0), False)
+    try:
+        tenant.charge_chars(total_chars, len(unique_segments))
+        try:
+            ticket = synthesis_scheduler.admit(len(unique_segments), priority, tenant)
+        except SchedulerFull:
+            tenant.refund_chars(total_chars, len(unique_segments))
+            raise
+    except (QuotaExceeded, SchedulerFull) as e:
+        metrics.increment("rejected_requests")
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    boundary = uuid.uuid4().hex
+    # 响应体从未被迭代时（客户端在响应开始前断开）生成器的 finally 不会执行，由后台任务归还排队预算
+    return StreamingResponse(
+        generate_batch_parts(items, list(unique_segments), boundary, deadline, ticket),
+        media_type=f"multipart/mixed; boundary={boundary}",
+        background=BackgroundTask(ticket.close),
+        headers={
+            "Access-Control-Allow-Origin": "*",
+            "Access-Control-Allow-Headers": "*",
+            "Access-Control-Allow-Methods": "*",
+            "Cache-Control": "no-cache",
+            "Server-Timing": deadline.server_timing(),
+            "Timing-Allow-Origin": "*",
+            "X-Batch-Segments": str(total_segments),
+            "X-Batch-Unique-Segments": str(len(unique_segments))
+        }
+    )
+
+@app.post("/v1/audio/jobs", status_code=202)
+async def create_speech_job(request: TTSRequest, tenant: Tenant = Depends(verify_api_key)):
+    """提交后台合成任务，立即返回任务ID"""
+    # 后台任务的文本通常很长，过滤、清理和分段在线程中执行
+    loop = asyncio.get_event_loop()
+    _, cleaned_text, _ = await loop.run_in_executor(None, prepare_text, request.input)
+    if not cleaned_text:
+        raise HTTPException(status_code=400, detail="文本过滤后为空")
+
+    speaker, lang = resolve_voice(request.voice)
+    text_segments = await loop.run_in_executor(None, split_text, cleaned_text)
+    try:
+        tenant.charge_chars(len(cleaned_text), len(text_segments))
+    except QuotaExceeded as e:
+        metrics.increment("rejected_requests")
+        raise HTTPException(
+            status_code=429,
+            detail=str(e),
+            headers={"Retry-After": str(e.retry_after)}
+        )
+
+    # 创建任务目录和写入任务文件在线程池中执行，不阻塞事件循环
+    job = await loop.run_in_executor(None, job_manager.submit, text_segments, speaker, lang, tenant)
+    return job.describe()
+
+def _get_tenant_job(job_id: str, tenant: Tenant):
+    """获取属于该租户的任务，不存在时返回404"""
+    job = job_manager.get(job_id)
+    if job is None or job.tenant != tenant.name:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/v1/audio/jobs/{job_id}")
+async def get_speech_job(job_id: str, wait: float = 0, tenant: Tenant = Depends(verify_api_key)):
+    """查询后台任务状态，wait>0 时长轮询直到任务有新进度、结束或超时"""
+    job = _get_tenant_job(job_id, tenant)
+    wait = min(max(wait, 0), config.JOB_MAX_WAIT)
+    if wait > 0:
+        await job_manager.wait(job, job.version, wait)
+    return job.describe()
+
+@app.get("/v1/audio/jobs/{job_id}/content")
+async def get_speech_job_content(job_id: str, raw_request: Request, tenant: Tenant = Depends(verify_api_key)):
+    """下载后台任务生成的音频，支持Range请求"""
+    job = _get_tenant_job(job_id, tenant)
+    if job.status != JOB_COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return RangeFileResponse(
+        job.output_path,
+        range_header=raw_request.headers.get("range"),
+        media_type="audio/mpeg",
+        filename="speech.mp3"
+    )
+
 @app.get("/v1/voices")
 @app.get("/v1/audio/voices")  # 添加别名路径
 async def list_voices():  # 移除API密钥验证
@@ -602,18 +899,17 @@ async def list_voices():  # 移除API密钥验证
     }
 
 @app.get("/stats")
-async def get_stats(_: bool = Depends(verify_api_key)):
+async def get_stats(_: Tenant = Depends(verify_api_key)):
     """获取服务统计信息"""
-    cache_info = get_segment_audio_cached.cache_info()
     stats = {
-        "performance": config.PERFORMANCE_METRICS,
-        "cache": {
-            "hits": cache_info.hits,
-            "misses": cache_info.misses,
-            "maxsize": cache_info.maxsize,
-            "currsize": cache_info.currsize,
-            "hit_rate": cache_info.hits / (cache_info.hits + cache_info.misses) if (cache_info.hits + cache_info.misses) > 0 else 0
-        },
+        "performance": metrics.performance_snapshot(),
+        "cache": audio_cache.info(),
+        "upstream": upstream.get_upstream_stats(),
+        "scheduler": synthesis_scheduler.snapshot(),
+        "tenants": tenant_registry.snapshot(),
+        "jobs": job_manager.snapshot(),
+        "prewarm": prewarmer.snapshot(),
+        "event_loop": loop_monitor.snapshot(),
         "config": {
             "max_workers": config.MAX_WORKERS,
             "max_text_length": config.MAX_TEXT_LENGTH
@@ -621,6 +917,52 @@ async def get_stats(_: bool = Depends(verify_api_key)):
     }
     return stats
 
+@app.get("/metrics")
+async def get_metrics(_: Tenant = Depends(verify_api_key)):
+    """Prometheus 文本格式的指标"""
+    return Response(content=metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz")
+async def healthz():
+    """存活检查：进程能响应请求即返回200，不检查上游"""
+    return {"status": "ok", "uptime": round(time.time() - startup_state["started_at"], 3)}
+
+@app.get("/readyz")
+async def readyz():
+    """
+    就绪检查：本地初始化完成、上游连接池预热结束（成功、失败或未启用）后返回200，否则返回503
+
+    上游不可达时连接池预热在 UPSTREAM_WARM_TIMEOUT 后结束，服务仍然就绪，
+    缓存中的音频照常可用；上游状态通过 upstream 字段反映。
+    """
+    warm_pool = upstream.connection_warmer.snapshot()
+    cache_info = audio_cache.info()
+    prewarm = prewarmer.snapshot()
+    checks = {
+        "jobs_resumed": startup_state["jobs_resumed"],
+        "warm_pool": upstream.connection_warmer.finished
+    }
+    ready = all(checks.values())
+    body = {
+        "status": "ready" if ready else "starting",
+        "checks": checks,
+        "warm_pool": warm_pool,
+        "cache": {
+            "currsize": cache_info["currsize"],
+            "maxsize": cache_info["maxsize"],
+            "hit_rate": cache_info["hit_rate"],
+            "disk": cache_info["disk"] is not None
+        },
+        "prewarm": {
+            "status": prewarm["status"],
+            "progress": prewarm["progress"]
+        },
+        "upstream": {
+            "breaker": upstream.circuit_breaker.state
+        }
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
 @app.get("/")
 async def root():
     """API 文档"""
@@ -630,6 +972,7 @@ async def root():
         "docs_url": "/docs",
         "voices_url": "/v1/voices",
         "stats_url": "/stats",
+        "metrics_url": "/metrics",
         "supported_languages": list(config.LANGUAGE_MAP.keys()),
         "auth_required": True,
         "default_api_key": config.API_KEY,
@@ -642,117 +985,185 @@ async def root():
     }
 
 # 添加调试信息接口
-@app.get("/debug", response_class=HTMLResponse)
-async def debug_page():
-    """调试页面"""
-    if not config.DEBUG_MODE:
-        raise HTTPException(status_code=404, detail="Debug mode is disabled")
-
-    debug_info = get_debug_info()
+# 调试页面只包含页面框架和脚本，记录列表通过 /debug/captures 分页加载
+DEBUG_PAGE_HTML = """
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Volcano TTS 调试页面</title>
+    <meta charset="utf-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <style>
+        body { font-family: Arial, sans-serif; margin: 0; padding: 20px; }
+        h1, h2 { color: #333; }
+        .container { max-width: 1200px; margin: 0 auto; }
+        .card { background: #f9f9f9; border-radius: 5px; padding: 15px; margin-bottom: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
+        .filters label { display: inline-block; margin: 0 12px 8px 0; }
+        .filters input, .filters select { width: 110px; }
+        table { width: 100%; border-collapse: collapse; font-size: 14px; }
+        th, td { padding: 6px; border-bottom: 1px solid #eee; text-align: left; vertical-align: top; }
+        tr:hover { background: #f0f0f0; }
+        .preview { color: #555; max-width: 420px; }
+        .error { color: #c00; }
+        a { text-decoration: none; color: #0066cc; }
+        a:hover { text-decoration: underline; }
+        #more { margin-top: 10px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h1>Volcano TTS 调试页面</h1>
+
+        <div class="card">
+            <h2>调试信息</h2>
+            <div id="info">加载中...</div>
+        </div>
 
-    # 获取文本文件列表
-    text_dir = os.path.join(config.DEBUG_DIR, 'text')
-    text_files = []
-    if os.path.exists(text_dir):
-        text_files = [f for f in os.listdir(text_dir) if f.endswith('.json')]
-        text_files.sort(key=lambda f: os.path.getmtime(os.path.join(text_dir, f)), reverse=True)
+        <div class="card filters">
+            <form id="filters">
+                <label>开始时间 <input type="datetime-local" name="since" style="width: 190px"></label>
+                <label>结束时间 <input type="datetime-local" name="until" style="width: 190px"></label>
+                <label>声音 <select name="voice"><option value="">全部</option></select></label>
+                <label>最小长度 <input type="number" name="min_length" min="0"></label>
+                <label>最大长度 <input type="number" name="max_length" min="0"></label>
+                <label>最小耗时(秒) <input type="number" name="min_latency" min="0" step="0.1"></label>
+                <label>最大耗时(秒) <input type="number" name="max_latency" min="0" step="0.1"></label>
+                <label>过滤命中 <select name="filtered"><option value="">全部</option><option value="true">有命中</option><option value="false">无命中</option></select></label>
+                <label>过滤规则 <input type="text" name="rule"></label>
+                <label>状态码 <input type="number" name="status"></label>
+                <label>采集原因 <select name="reason"><option value="">全部</option><option>sampled</option><option>error</option><option>slow</option></select></label>
+                <label>文本包含 <input type="text" name="search"></label>
+                <button type="submit">查询</button>
+            </form>
+        </div>
 
-    # 获取音频文件列表
-    audio_dir = os.path.join(config.DEBUG_DIR, 'audio')
-    audio_files = []
-    if os.path.exists(audio_dir):
-        audio_files = [f for f in os.listdir(audio_dir) if f.endswith('.mp3')]
-        audio_files.sort(key=lambda f: os.path.getmtime(os.path.join(audio_dir, f)), reverse=True)
-
-    # 生成HTML页面
-    html = f"""
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Volcano TTS 调试页面</title>
-        <meta charset="utf-8">
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <style>
-            body {{ font-family: Arial, sans-serif; margin: 0; padding: 20px; }}
-            h1, h2, h3 {{ color: #333; }}
-            .container {{ max-width: 1200px; margin: 0 auto; }}
-            .card {{ background: #f9f9f9; border-radius: 5px; padding: 15px; margin-bottom: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }}
-            .file-list {{ max-height: 400px; overflow-y: auto; }}
-            .file-item {{ padding: 8px; border-bottom: 1px solid #eee; }}
-            .file-item:hover {{ background: #f0f0f0; }}
-            .file-link {{ text-decoration: none; color: #0066cc; }}
-            .file-link:hover {{ text-decoration: underline; }}
-            .audio-player {{ width: 100%; margin-top: 5px; }}
-            .tabs {{ display: flex; margin-bottom: 15px; }}
-            .tab {{ padding: 10px 15px; cursor: pointer; border: 1px solid #ddd; border-bottom: none; border-radius: 5px 5px 0 0; margin-right: 5px; }}
-            .tab.active {{ background: #f9f9f9; }}
-            .tab-content {{ display: none; }}
-            .tab-content.active {{ display: block; }}
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Volcano TTS 调试页面</h1>
-
-            <div class="card">
-                <h2>调试信息</h2>
-                <p>调试模式: {debug_info.get('debug_enabled', False)}</p>
-                <p>调试目录: {debug_info.get('debug_dir', '')}</p>
-                <p>保存文本: {debug_info.get('save_text', False)}</p>
-                <p>保存音频: {debug_info.get('save_audio', False)}</p>
-                <p>最大文件数: {debug_info.get('max_files', 0)}</p>
-                <p>文本文件数: {debug_info.get('text_files_count', 0)}</p>
-                <p>音频文件数: {debug_info.get('audio_files_count', 0)}</p>
-            </div>
-
-            <div class="tabs">
-                <div class="tab active" onclick="openTab(event, 'text-files')">文本文件</div>
-                <div class="tab" onclick="openTab(event, 'audio-files')">音频文件</div>
-            </div>
-
-            <div id="text-files" class="tab-content card active">
-                <h2>文本文件</h2>
-                <div class="file-list">
-                    {''.join([f'<div class="file-item"><a class="file-link" href="/debug/text/{file}" target="_blank">{file}</a></div>' for file in text_files])}
-                    {f'<div class="file-item">没有文本文件</div>' if not text_files else ''}
-                </div>
-            </div>
-
-            <div id="audio-files" class="tab-content card">
-                <h2>音频文件</h2>
-                <div class="file-list">
-                    {''.join([f'<div class="file-item"><a class="file-link" href="/debug/audio/{file}" target="_blank">{file}</a><audio class="audio-player" controls src="/debug/audio/{file}"></audio></div>' for file in audio_files])}
-                    {f'<div class="file-item">没有音频文件</div>' if not audio_files else ''}
-                </div>
-            </div>
+        <div class="card">
+            <h2>调试记录 <small id="total"></small></h2>
+            <table>
+                <thead><tr><th>时间</th><th>声音</th><th>长度</th><th>耗时</th><th>状态</th><th>过滤命中</th><th>文本</th><th>记录</th><th>音频</th></tr></thead>
+                <tbody id="rows"></tbody>
+            </table>
+            <button id="more" style="display: none">加载更多</button>
         </div>
+    </div>
 
-        <script>
-            function openTab(evt, tabName) {{
-                var i, tabContent, tabLinks;
-
-                // 隐藏所有标签内容
-                tabContent = document.getElementsByClassName("tab-content");
-                for (i = 0; i < tabContent.length; i++) {{
-                    tabContent[i].className = tabContent[i].className.replace(" active", "");
-                }}
-
-                // 移除所有标签的活动状态
-                tabLinks = document.getElementsByClassName("tab");
-                for (i = 0; i < tabLinks.length; i++) {{
-                    tabLinks[i].className = tabLinks[i].className.replace(" active", "");
-                }}
-
-                // 显示当前标签内容并添加活动状态
-                document.getElementById(tabName).className += " active";
-                evt.currentTarget.className += " active";
-            }}
-        </script>
-    </body>
-    </html>
-    """
+    <script>
+        var PAGE_SIZE = 50;
+        var offset = 0;
+        var query = "";
+
+        function escapeHtml(value) {
+            return String(value == null ? "" : value).replace(/[&<>"']/g, function (c) {
+                return {"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "'": "&#39;"}[c];
+            });
+        }
+
+        function buildQuery() {
+            var params = new URLSearchParams();
+            new FormData(document.getElementById("filters")).forEach(function (value, key) {
+                if (value === "") return;
+                if (key === "since" || key === "until") value = new Date(value).getTime() / 1000;
+                params.append(key, value);
+            });
+            return params.toString();
+        }
+
+        function playAudio(button, url) {
+            // 点击后才创建播放器，避免页面加载时请求所有音频
+            var audio = document.createElement("audio");
+            audio.controls = true;
+            audio.preload = "none";
+            audio.src = url;
+            button.replaceWith(audio);
+            audio.play();
+        }
 
-    return html
+        function renderRow(item) {
+            var time = new Date(item.timestamp * 1000).toLocaleString();
+            var hits = item.filter_hits ? item.filter_hits + " (" + escapeHtml(item.filter_rules) + ")" : "0";
+            var status = item.status == null ? "" : item.status;
+            if (item.error) status = '<span class="error" title="' + escapeHtml(item.error) + '">' + status + " 错误</span>";
+            return "<tr>" +
+                "<td>" + escapeHtml(time) + "<br><small>" + escapeHtml(item.capture_reason || "") + "</small></td>" +
+                "<td>" + escapeHtml(item.voice) + "</td>" +
+                "<td>" + escapeHtml(item.text_length) + "</td>" +
+                "<td>" + (item.latency == null ? "" : item.latency.toFixed(3)) + "</td>" +
+                "<td>" + status + "</td>" +
+                "<td>" + hits + "</td>" +
+                '<td class="preview">' + escapeHtml(item.preview) + "</td>" +
+                "<td>" + (item.text_url ? '<a href="' + item.text_url + '" target="_blank">查看</a>' : "") + "</td>" +
+                "<td>" + (item.audio_url ? '<button onclick="playAudio(this, \'' + item.audio_url + '\')">播放</button>' : "") + "</td>" +
+                "</tr>";
+        }
+
+        function load(reset) {
+            if (reset) {
+                offset = 0;
+                query = buildQuery();
+                document.getElementById("rows").innerHTML = "";
+            }
+            var url = "/debug/captures?limit=" + PAGE_SIZE + "&offset=" + offset + (query ? "&" + query : "");
+            fetch(url).then(function (r) { return r.json(); }).then(function (data) {
+                if (!data.ready) {
+                    document.getElementById("total").textContent = "（索引建立中，请稍后刷新）";
+                    return;
+                }
+                document.getElementById("rows").insertAdjacentHTML("beforeend", data.items.map(renderRow).join(""));
+                offset += data.items.length;
+                document.getElementById("total").textContent = "（共 " + data.total + " 条）";
+                document.getElementById("more").style.display = offset < data.total ? "" : "none";
+                var select = document.querySelector("select[name=voice]");
+                if (select.options.length === 1) {
+                    (data.voices || []).forEach(function (voice) { select.add(new Option(voice, voice)); });
+                }
+            });
+        }
+
+        fetch("/debug/info").then(function (r) { return r.json(); }).then(function (info) {
+            var writer = info.writer || {};
+            document.getElementById("info").innerHTML =
+                "<p>调试目录: " + escapeHtml(info.debug_dir) + "</p>" +
+                "<p>保存文本: " + info.save_text + "，保存音频: " + info.save_audio + "，最大文件数: " + info.max_files + "</p>" +
+                "<p>文本文件数: " + info.text_files_count + "，音频文件数: " + info.audio_files_count +
+                "，总大小: " + ((writer.total_bytes || 0) / 1048576).toFixed(1) + " MB</p>" +
+                "<p>已写入: " + writer.written + "，已丢弃: " + writer.dropped + "，待写入: " + writer.pending + "</p>";
+        });
+
+        document.getElementById("filters").addEventListener("submit", function (e) {
+            e.preventDefault();
+            load(true);
+        });
+        document.getElementById("more").addEventListener("click", function () { load(false); });
+        load(true);
+    </script>
+</body>
+</html>
+"""
+
+@app.get("/debug", response_class=HTMLResponse)
+async def debug_page():
+    """调试页面：只返回页面框架，记录列表通过 /debug/captures 分页加载"""
+    if not config.DEBUG_MODE:
+        raise HTTPException(status_code=404, detail="Debug mode is disabled")
+    return DEBUG_PAGE_HTML
+
+@app.get("/debug/captures")
+async def list_debug_captures(limit: int = 50, offset: int = 0, since: Optional[float] = None,
+                              until: Optional[float] = None, voice: Optional[str] = None,
+                              min_length: Optional[int] = None, max_length: Optional[int] = None,
+                              min_latency: Optional[float] = None, max_latency: Optional[float] = None,
+                              filtered: Optional[bool] = None, rule: Optional[str] = None,
+                              status: Optional[int] = None, reason: Optional[str] = None,
+                              search: Optional[str] = None):
+    """分页查询调试记录，按时间从新到旧排列，时间参数为Unix时间戳"""
+    if not config.DEBUG_MODE:
+        raise HTTPException(status_code=404, detail="Debug mode is disabled")
+    filters = dict(limit=limit, offset=offset, since=since, until=until, voice=voice,
+                   min_length=min_length, max_length=max_length, min_latency=min_latency,
+                   max_latency=max_latency, filtered=filtered, rule=rule, status=status,
+                   reason=reason, search=search)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, lambda: query_captures(**filters))
 
 @app.get("/debug/info")
 async def debug_info():
@@ -765,7 +1176,7 @@ async def get_debug_text(filename: str):
     if not config.DEBUG_MODE:
         raise HTTPException(status_code=404, detail="Debug mode is disabled")
 
-    filepath = os.path.join(config.DEBUG_DIR, 'text', filename)
+    filepath = os.path.join(config.DEBUG_DIR, 'text', os.path.basename(filename))
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="File not found")
 
@@ -777,16 +1188,20 @@ async def get_debug_text(filename: str):
         raise HTTPException(status_code=500, detail=f"Error reading file: {str(e)}")
 
 @app.get("/debug/audio/{filename}")
-async def get_debug_audio(filename: str):
-    """获取调试音频文件内容"""
+async def get_debug_audio(filename: str, raw_request: Request):
+    """获取调试音频文件内容，支持Range请求（播放器拖动进度时只读取需要的部分）"""
     if not config.DEBUG_MODE:
         raise HTTPException(status_code=404, detail="Debug mode is disabled")
 
-    filepath = os.path.join(config.DEBUG_DIR, 'audio', filename)
+    filepath = os.path.join(config.DEBUG_DIR, 'audio', os.path.basename(filename))
     if not os.path.exists(filepath):
         raise HTTPException(status_code=404, detail="File not found")
 
-    return FileResponse(filepath, media_type="audio/mpeg")
+    return RangeFileResponse(
+        filepath,
+        range_header=raw_request.headers.get("range"),
+        media_type="audio/mpeg"
+    )
 
 @app.get("/debug/test")
 async def debug_test():
@@ -0,0 +1,289 @@
+"""
+音频缓存模块
+
+以 (文本, 话者, 语言) 为键缓存段落音频，按LRU策略淘汰。
+与 functools.lru_cache 不同，缓存可以在流式下载完成后再写入，
+并且不会缓存失败产生的空结果。
+
+超过TTL的条目在正常读取时视为未命中，但在淘汰前仍保留在缓存中，
+上游不可用时可以通过 lookup_stale 作为降级结果返回。
+
+配置 CACHE_DIR 后启用磁盘缓存层：内存未命中时从磁盘读取并放回内存，
+写入时同时落盘，服务重启和命令行预生成的音频都可以直接命中。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+import config
+import metrics
+from cache_telemetry import cache_telemetry, TIER_MEMORY, TIER_DISK
+
+# 获取日志记录器（与应用共用，确保写入日志文件）
+logger = logging.getLogger('volcano_tts')
+
+
+class DiskCache:
+    """
+    磁盘缓存层：每个条目一个文件，按修改时间判断过期和淘汰
+
+    设置 max_bytes 时在内存中维护条目文件的大小索引（按写入顺序）和总字节数，
+    超出上限时直接删除最旧的条目，不需要遍历目录。
+    已有文件的索引在后台线程中建立，建立完成前不淘汰。
+    """
+
+    def __init__(self, directory: str, ttl: float = 0, max_bytes: int = 0):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._writes = 0
+        self._lock = threading.Lock()
+        # 条目文件路径 -> 大小（字节），最旧的在前
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self.bytes = 0
+        self._indexed = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+        if max_bytes > 0:
+            threading.Thread(target=self._build_index, name="disk-cache-index", daemon=True).start()
+        else:
+            self._indexed.set()
+
+    def path(self, key: Hashable) -> str:
+        """条目文件路径，按哈希前两位分目录"""
+        digest = hashlib.sha256(json.dumps(key, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, digest[:2], digest + ".mp3")
+
+    def get(self, key: Hashable, allow_expired: bool = False) -> Optional[bytes]:
+        """读取条目，不存在或已过期时返回None"""
+        path = self.path(key)
+        try:
+            if not allow_expired and self.ttl > 0 and time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def put(self, key: Hashable, audio_data: bytes) -> None:
+        """写入条目（先写临时文件再替换，避免读到不完整的文件）"""
+        path = self.path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(audio_data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"写入磁盘缓存失败: {str(e)}")
+            return
+        with self._lock:
+            self._writes += 1
+            if self.max_bytes <= 0:
+                return
+            previous = self._index.pop(path, None)
+            if previous is not None:
+                self.bytes -= previous
+            self._index[path] = len(audio_data)
+            self.bytes += len(audio_data)
+            excess = self._take_excess()
+        self._remove(excess)
+
+    def contains(self, key: Hashable) -> bool:
+        """条目是否存在且未过期"""
+        path = self.path(key)
+        try:
+            return self.ttl <= 0 or time.time() - os.path.getmtime(path) <= self.ttl
+        except OSError:
+            return False
+
+    def _build_index(self) -> None:
+        """遍历目录建立已有文件的索引（后台线程），然后淘汰超出上限的条目"""
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith(".mp3"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        with self._lock:
+            # 遍历期间写入的条目比已有文件新，排在后面
+            index = OrderedDict((path, size) for _, size, path in entries if path not in self._index)
+            index.update(self._index)
+            self._index = index
+            self.bytes = sum(index.values())
+            self._indexed.set()
+            excess = self._take_excess()
+            count, total = len(index), self.bytes
+        self._remove(excess)
+        logger.info(f"磁盘缓存索引已建立: {count} 个条目，{total} 字节")
+
+    def _take_excess(self) -> List[str]:
+        """从索引中取出超出 max_bytes 的最旧条目（需持有锁，索引建立前不淘汰）"""
+        excess = []
+        if not self._indexed.is_set():
+            return excess
+        while self.bytes > self.max_bytes and len(self._index) > 1:
+            path, size = self._index.popitem(last=False)
+            self.bytes -= size
+            excess.append(path)
+        return excess
+
+    def _remove(self, paths: List[str]) -> None:
+        """删除淘汰的条目文件"""
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if paths:
+            cache_telemetry.record_eviction(TIER_DISK, len(paths))
+            logger.debug(f"磁盘缓存超出上限，已删除 {len(paths)} 个最旧的条目")
+
+    def info(self) -> Dict[str, Any]:
+        """磁盘缓存统计（entries/bytes 仅在设置 max_bytes 时统计）"""
+        with self._lock:
+            return {
+                "dir": self.directory,
+                "ttl": self.ttl,
+                "max_bytes": self.max_bytes,
+                "writes": self._writes,
+                "entries": len(self._index),
+                "bytes": self.bytes,
+                "indexed": self._indexed.is_set()
+            }
+
+
+class AudioCache:
+    """线程安全的LRU音频缓存（可选磁盘缓存层）"""
+
+    def __init__(self, maxsize: int = 200, ttl: float = 0, disk: Optional[DiskCache] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.disk = disk
+        self._data: "OrderedDict[Hashable, Tuple[bytes, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # 内存层中音频的总字节数
+        self.bytes = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """获取缓存的音频，未命中或已过期时返回None"""
+        return self.lookup(key)[0]
+
+    def lookup(self, key: Hashable) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        获取缓存的音频和命中的缓存层（TIER_MEMORY/TIER_DISK），未命中时返回 (None, None)
+
+        查找结果由调用方记录到 cache_telemetry（未命中后可能还会返回过期条目或等待合并的请求）。
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and not self._expired(entry):
+                self._data.move_to_end(key)
+                return entry[0], TIER_MEMORY
+
+        if self.disk is not None:
+            audio_data = self.disk.get(key)
+            if audio_data:
+                with self._lock:
+                    self._store(key, audio_data)
+                return audio_data, TIER_DISK
+        return None, None
+
+    def lookup_stale(self, key: Hashable) -> Tuple[Optional[bytes], Optional[str]]:
+        """获取缓存的音频和所在的缓存层，包括已过期的条目（用于上游不可用时降级）"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                return entry[0], TIER_MEMORY
+        if self.disk is not None:
+            audio_data = self.disk.get(key, allow_expired=True)
+            if audio_data:
+                return audio_data, TIER_DISK
+        return None, None
+
+    def put(self, key: Hashable, audio_data: bytes) -> None:
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        if not audio_data:
+            return
+        with self._lock:
+            self._store(key, audio_data)
+        if self.disk is not None:
+            self.disk.put(key, audio_data)
+
+    def contains(self, key: Hashable) -> bool:
+        """是否存在未过期的条目（不计入命中统计）"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and not self._expired(entry):
+                return True
+        return self.disk is not None and self.disk.contains(key)
+
+    def _store(self, key: Hashable, audio_data: bytes) -> None:
+        """写入内存层（需持有锁）"""
+        previous = self._data.get(key)
+        if previous is not None:
+            self.bytes -= len(previous[0])
+        self._data[key] = (audio_data, time.time())
+        self._data.move_to_end(key)
+        self.bytes += len(audio_data)
+        while len(self._data) > self.maxsize:
+            _, (evicted, _) = self._data.popitem(last=False)
+            self.bytes -= len(evicted)
+            cache_telemetry.record_eviction(TIER_MEMORY)
+
+    def _expired(self, entry: Tuple[bytes, float]) -> bool:
+        """判断条目是否超过TTL"""
+        return self.ttl > 0 and time.time() - entry[1] > self.ttl
+
+    def info(self) -> Dict[str, Any]:
+        """
+        获取缓存统计信息
+
+        hits/stale_hits/coalesced/misses 互斥，合计为段落查找次数；
+        voices 按 "话者/语言" 细分，reuse 为抽样的重用距离和各容量的估计命中率。
+        """
+        totals = cache_telemetry.totals()
+        with self._lock:
+            info = {
+                "maxsize": self.maxsize,
+                "currsize": len(self._data),
+                "bytes": self.bytes,
+                "ttl": self.ttl
+            }
+        info.update({
+            "lookups": totals["lookups"],
+            "hits": totals["hit"],
+            "stale_hits": totals["stale"],
+            "coalesced": totals["coalesced"],
+            "misses": totals["miss"],
+            "disk_hits": totals["tier_hits"].get(TIER_DISK, 0),
+            "hit_rate": totals["hit_rate"],
+            "bytes_saved": totals["bytes_saved"],
+            "evictions": totals["evictions"],
+            "voices": cache_telemetry.breakdown(),
+            "reuse": cache_telemetry.sampler.snapshot()
+        })
+        info["disk"] = self.disk.info() if self.disk is not None else None
+        return info
+
+
+# 创建全局音频缓存实例
+audio_cache = AudioCache(
+    config.CACHE_MAX_SIZE,
+    config.CACHE_TTL,
+    DiskCache(config.CACHE_DIR, config.CACHE_TTL, config.CACHE_DISK_MAX_MB * 1024 * 1024) if config.CACHE_DIR else None
+)
+
+metrics.registry.gauge("tts_cache_entries", "内存缓存中的条目数", lambda: len(audio_cache._data))
+metrics.registry.gauge("tts_cache_bytes", "内存缓存中音频的总字节数", lambda: audio_cache.bytes)
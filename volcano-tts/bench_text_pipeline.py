@@ -0,0 +1,264 @@
+#!/usr/bin/env python
+"""
+文本处理热点路径的微基准测试
+
+覆盖每个请求都会经过的文本处理步骤：
+    - TextFilter.filter_text（完整过滤流程）及其中的 _apply_rules、_final_cleanup
+    - clean_text（create_speech 中的清理正则链）
+    - split_text（分段）
+    - resolve_voice（声音解析）
+
+输入从简短的聊天回复到包含大量 <details> 引用块的多MB文档（OpenWebUI 联网搜索的输出格式）。
+每项测试重复运行，记录中位数和最小耗时；最小耗时除以固定校准负载的耗时得到归一化成本，
+不同机器上的结果可以与同一份基准比较。
+
+用法:
+    python bench_text_pipeline.py                 # 运行并与 bench_baseline.json 比较，退化时以状态码1退出
+    python bench_text_pipeline.py --save          # 运行并更新基准
+    python bench_text_pipeline.py --quick         # 跳过多MB输入
+    python bench_text_pipeline.py --filter split  # 只运行名称包含 split 的测试
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 基准测试需要启用过滤器和默认规则（仅影响本进程）
+os.environ['TEXT_FILTER_ENABLED'] = 'true'
+os.environ['TEXT_FILTER_USE_DEFAULT_RULES'] = 'true'
+
+import config
+from text_filter import TextFilter
+from text_pipeline import clean_text, resolve_voice, split_text
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_baseline.json')
+
+# 每项测试至少运行的次数和时间（秒）
+MIN_RUNS = 5
+MIN_TIME = 0.5
+
+# 多MB输入只运行的次数
+LARGE_RUNS = 3
+
+# 每个计时样本的最短时间（秒）
+MIN_SAMPLE_TIME = 0.002
+
+# 与基准比较的默认容差（归一化成本允许上升的比例）
+DEFAULT_TOLERANCE = 0.5
+
+# 单次耗时低于该值（毫秒）的测试受计时误差影响较大，不参与退化判断
+NOISE_FLOOR_MS = 0.02
+
+PARAGRAPH = ("人工智能技术正在快速发展，语音合成已经广泛应用于智能助手、有声读物和无障碍服务。"
+             "新一代模型生成的语音更加自然流畅，能够表达不同的情感和语气。")
+
+CITATION = ("<details><summary>资料[{index}]: 相关报道_新闻网站{index}</summary>\n"
+            "据报道，第{index}项研究表明，相关技术在多个领域取得了进展。DOI: 10.1000/xyz{index}\n"
+            "Issue {index} 第{index}期 研究人员表示，未来还将继续优化模型的效果和效率。\n\n"
+            "Link\n"
+            "https://example.com/news/{index}\n"
+            "</details>\n")
+
+
+def make_chat_reply() -> str:
+    """简短的聊天回复"""
+    return "好的，我已经帮你查到了明天的天气：多云转晴，气温18到25度，适合出行。"
+
+
+def make_markdown_reply() -> str:
+    """带格式的中等长度回复"""
+    lines = ["# 总结", ""]
+    for i in range(8):
+        lines.append(f"{i + 1}. **要点{i + 1}**：{PARAGRAPH}")
+    lines += ["", "思考过程：先检索相关资料，再整理要点。", "", "> 以上内容仅供参考。"]
+    return "\n".join(lines)
+
+
+def make_cited_document(target_chars: int) -> str:
+    """OpenWebUI 联网搜索风格的文档：正文段落与 <details> 引用块交替，直到达到目标长度"""
+    parts = []
+    total = 0
+    index = 0
+    while total < target_chars:
+        block = f"{PARAGRAPH}\n\n" + CITATION.format(index=index) + "\n"
+        parts.append(block)
+        total += len(block)
+        index += 1
+    return "".join(parts)
+
+
+def make_plain_document(target_chars: int) -> str:
+    """没有标签的长文本（分段测试）"""
+    return (PARAGRAPH * (target_chars // len(PARAGRAPH) + 1))[:target_chars]
+
+
+def build_inputs(quick: bool) -> List[Tuple[str, str]]:
+    """(输入名称, 文本)"""
+    inputs = [
+        ("chat", make_chat_reply()),
+        ("markdown", make_markdown_reply()),
+        ("cited_20k", make_cited_document(20_000)),
+        ("cited_200k", make_cited_document(200_000)),
+    ]
+    if not quick:
+        inputs.append(("cited_2m", make_cited_document(2_000_000)))
+    return inputs
+
+
+def build_benchmarks(quick: bool) -> List[Tuple[str, Callable[[], Any], int]]:
+    """(测试名称, 被测函数, 输入字符数)"""
+    text_filter = TextFilter()
+    benchmarks: List[Tuple[str, Callable[[], Any], int]] = []
+    for name, text in build_inputs(quick):
+        filtered, _ = text_filter.filter_text(text)
+        benchmarks += [
+            (f"filter_text/{name}", lambda t=text: text_filter.filter_text(t), len(text)),
+            (f"apply_rules/{name}", lambda t=text: text_filter._apply_rules(t), len(text)),
+            (f"final_cleanup/{name}", lambda t=text: text_filter._final_cleanup(t), len(text)),
+            (f"clean_text/{name}", lambda t=text: clean_text(t), len(text)),
+            (f"split_text/{name}", lambda t=clean_text(filtered): split_text(t), len(filtered)),
+        ]
+    plain = make_plain_document(200_000 if quick else 2_000_000)
+    benchmarks.append((f"split_text/plain_{len(plain) // 1000}k", lambda: split_text(plain), len(plain)))
+
+    default_speaker = config.DEFAULT_SPEAKERS["zh_cn"]
+    voice_name = next(iter(next(iter(config.VOICE_CONFIG.values())).values()))
+    benchmarks += [
+        ("resolve_voice/id", lambda: resolve_voice(default_speaker), len(default_speaker)),
+        ("resolve_voice/name", lambda: resolve_voice(voice_name), len(voice_name)),
+        ("resolve_voice/unknown", lambda: resolve_voice("alloy"), 5),
+    ]
+    return benchmarks
+
+
+def calibrate() -> float:
+    """固定的正则和字符串负载的耗时（秒），用于归一化不同机器的结果"""
+    text = PARAGRAPH * 200
+    pattern = re.compile(r'[\u2000-\u206F，。]')
+
+    def workload() -> None:
+        for _ in range(20):
+            pattern.sub(' ', text)
+            "".join(reversed(text.split('，')))
+
+    return measure(workload, large=False)[1]
+
+
+def measure(func: Callable[[], Any], large: bool) -> Tuple[float, float, int]:
+    """
+    重复运行，返回 (单次调用的中位数耗时, 最小耗时, 调用次数)
+
+    很快的函数每个样本连续调用多次（每个样本至少 MIN_SAMPLE_TIME 秒），减少计时误差。
+    """
+    t0 = time.perf_counter()
+    func()  # 预热（编译正则、填充缓存）
+    number = max(1, int(MIN_SAMPLE_TIME / max(time.perf_counter() - t0, 1e-7)))
+    timings = []
+    start = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - t0) / number)
+        if large and len(timings) >= LARGE_RUNS:
+            break
+        if len(timings) >= MIN_RUNS and time.perf_counter() - start >= MIN_TIME:
+            break
+    return statistics.median(timings), min(timings), len(timings) * number
+
+
+def run(name_filter: Optional[str], quick: bool) -> Dict[str, Any]:
+    """运行所有测试，返回结果"""
+    calibration = calibrate()
+    results: Dict[str, Dict[str, Any]] = {}
+    for name, func, chars in build_benchmarks(quick):
+        if name_filter and name_filter not in name:
+            continue
+        median, best, runs = measure(func, large=chars >= 1_000_000)
+        results[name] = {
+            "chars": chars,
+            "runs": runs,
+            "median_ms": round(median * 1000, 4),
+            "min_ms": round(best * 1000, 4),
+            "us_per_kchar": round(median * 1e6 / max(1, chars) * 1000, 3),
+            "normalized": best
+        }
+        print(f"{name:<32} {chars:>9} 字符  {median * 1000:>10.3f}ms  "
+              f"{results[name]['us_per_kchar']:>10.3f}us/千字符")
+    # 运行前后各校准一次，取较快的一次，减少机器负载波动的影响
+    calibration = min(calibration, calibrate())
+    print(f"校准负载: {calibration * 1000:.3f}ms")
+    for result in results.values():
+        result["normalized"] = float(f"{result['normalized'] / calibration:.4g}")
+    return {"calibration_ms": round(calibration * 1000, 4), "results": results}
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """比较归一化成本，返回超出容差的测试（两次结果都低于 NOISE_FLOOR_MS 的测试除外）"""
+    regressions = []
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None or base["normalized"] <= 0:
+            continue
+        if max(result["median_ms"], base["median_ms"]) < NOISE_FLOOR_MS:
+            continue
+        ratio = result["normalized"] / base["normalized"]
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: x{result['normalized']}，基准 x{base['normalized']}（{ratio:.2f}倍）")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="文本处理热点路径的微基准测试")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="基准文件路径")
+    parser.add_argument("--save", action="store_true", help="把本次结果保存为基准")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE,
+                        help=f"归一化成本允许上升的比例（默认{DEFAULT_TOLERANCE}）")
+    parser.add_argument("--filter", help="只运行名称包含该字符串的测试")
+    parser.add_argument("--quick", action="store_true", help="跳过多MB输入")
+    parser.add_argument("--output", help="结果保存路径（JSON）")
+    args = parser.parse_args(argv)
+
+    # 过滤器和声音解析在每次调用时写日志，基准测试中关闭
+    logging.disable(logging.WARNING)
+    report = run(args.filter, args.quick)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.save:
+        baseline = {"results": {}}
+        if os.path.exists(args.baseline) and (args.filter or args.quick):
+            # 只运行了部分测试时保留其余测试的基准
+            with open(args.baseline, 'r', encoding='utf-8') as f:
+                baseline = json.load(f)
+        baseline["calibration_ms"] = report["calibration_ms"]
+        baseline["results"].update(report["results"])
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"基准已保存到 {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"没有找到基准文件 {args.baseline}，使用 --save 生成")
+        return 0
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    regressions = compare(report, baseline, args.tolerance)
+    if regressions:
+        for item in regressions:
+            print(f"退化: {item}", file=sys.stderr)
+        return 1
+    print("与基准相比没有超出容差的退化")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,253 @@
+"""
+批量预生成工具
+
+离线为大批量文本（文章、课程内容等）预生成音频，不经过HTTP接口：
+复用文本过滤、清理、分段和上游客户端，按上游自适应并发上限全速合成，
+结果写入磁盘缓存（CACHE_DIR）或输出目录。
+
+每完成一个文档就追加到检查点文件，中断后重新运行会跳过已完成的文档；
+未完成文档中已合成的段落会从磁盘缓存直接命中，不会重复请求上游。
+
+用法:
+    python bulk_render.py corpus.jsonl --output-dir out/
+    python bulk_render.py articles/ --voice zh_female_xiaoxiao
+    CACHE_DIR=cache python bulk_render.py corpus.jsonl
+
+语料格式:
+    JSONL: 每行一个对象，包含 text（或 input）字段，可选 id、voice 字段
+    目录: 递归读取所有 .txt 文件，文件相对路径作为文档ID
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Set
+
+import config
+from audio_cache import audio_cache
+from text_filter import text_filter
+from text_pipeline import clean_text, resolve_voice, split_text
+from synthesis import get_segment_audio_cached
+
+# 输出进度的间隔（秒）
+PROGRESS_INTERVAL = 5.0
+
+
+def load_corpus(path: str, default_voice: str) -> Iterator[Dict[str, str]]:
+    """逐个读取语料中的文档"""
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.endswith('.txt'):
+                    continue
+                filepath = os.path.join(root, name)
+                with open(filepath, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                doc_id = os.path.splitext(os.path.relpath(filepath, path))[0]
+                yield {"id": doc_id, "text": text, "voice": default_voice}
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                print(f"警告: 第 {line_no} 行不是有效的JSON，已跳过", file=sys.stderr)
+                continue
+            yield {
+                "id": str(record.get("id", line_no)),
+                "text": record.get("text") or record.get("input") or "",
+                "voice": record.get("voice") or default_voice
+            }
+
+
+def load_checkpoint(path: str) -> Set[str]:
+    """读取检查点文件中已完成的文档ID"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    done.add(json.loads(line)["id"])
+                except (ValueError, KeyError):
+                    continue
+    return done
+
+
+class DocumentState:
+    """一个文档的合成进度"""
+
+    def __init__(self, doc_id: str, segments: List[str], speaker: str, lang: str):
+        self.id = doc_id
+        self.segments = segments
+        self.speaker = speaker
+        self.lang = lang
+        self.results: List[Optional[bytes]] = [None] * len(segments)
+        self.remaining = len(segments)
+
+
+class BulkRenderer:
+    """批量预生成：段落级并行，文档级检查点"""
+
+    def __init__(self, output_dir: Optional[str], checkpoint_path: str, concurrency: int):
+        self.output_dir = output_dir
+        self.checkpoint_path = checkpoint_path
+        self.concurrency = concurrency
+        self.done = load_checkpoint(checkpoint_path)
+        self.stats = {
+            "documents": 0,
+            "skipped": 0,
+            "failed": 0,
+            "segments": 0,
+            "cached_segments": 0,
+            "chars": 0,
+            "bytes": 0
+        }
+        self.start_time = time.time()
+        self._last_report = self.start_time
+
+    def prepare(self, doc: Dict[str, str]) -> Optional[DocumentState]:
+        """过滤、清理和分段，返回None表示跳过该文档"""
+        if doc["id"] in self.done:
+            self.stats["skipped"] += 1
+            return None
+        filtered_text, _ = text_filter.filter_text(doc["text"])
+        cleaned_text = clean_text(filtered_text)
+        speaker, lang = resolve_voice(doc["voice"])
+        segments = [s for s in split_text(cleaned_text) if s and not s.isspace()] if cleaned_text else []
+        self.stats["chars"] += len(cleaned_text)
+        return DocumentState(doc["id"], segments, speaker, lang)
+
+    def run(self, docs: Iterator[Dict[str, str]]) -> bool:
+        """运行预生成，返回是否所有文档都成功"""
+        window = self.concurrency * 4
+        pending: Dict[concurrent.futures.Future, tuple] = {}
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency)
+        exhausted = False
+        try:
+            with open(self.checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+                while True:
+                    # 保持有限的段落在途，避免一次读入整个语料
+                    while not exhausted and len(pending) < window:
+                        doc = next(docs, None)
+                        if doc is None:
+                            exhausted = True
+                            break
+                        state = self.prepare(doc)
+                        if state is None:
+                            continue
+                        if not state.segments:
+                            self._finish(state, checkpoint)
+                            continue
+                        for index, segment in enumerate(state.segments):
+                            if audio_cache.contains((segment, state.speaker, state.lang)):
+                                self.stats["cached_segments"] += 1
+                            future = executor.submit(get_segment_audio_cached, segment, state.speaker, state.lang,
+                                                     record=False)
+                            pending[future] = (state, index)
+                    if not pending:
+                        break
+
+                    completed, _ = concurrent.futures.wait(
+                        pending, timeout=PROGRESS_INTERVAL, return_when=concurrent.futures.FIRST_COMPLETED
+                    )
+                    for future in completed:
+                        state, index = pending.pop(future)
+                        try:
+                            state.results[index] = future.result()
+                        except Exception as e:
+                            print(f"错误: 文档 {state.id} 段落 {index + 1} 合成失败: {str(e)}", file=sys.stderr)
+                            state.results[index] = b''
+                        self.stats["segments"] += 1
+                        state.remaining -= 1
+                        if state.remaining == 0:
+                            self._finish(state, checkpoint)
+                    self._report()
+        except KeyboardInterrupt:
+            print("\n已中断，等待进行中的段落完成；已完成的文档记录在检查点中", file=sys.stderr)
+            for future in pending:
+                future.cancel()
+            raise
+        finally:
+            executor.shutdown(wait=True)
+        self._report(final=True)
+        return self.stats["failed"] == 0
+
+    def _finish(self, state: DocumentState, checkpoint) -> None:
+        """文档全部段落完成：写出文件并记录检查点"""
+        if any(not audio for audio in state.results):
+            self.stats["failed"] += 1
+            print(f"错误: 文档 {state.id} 有段落合成失败，未写入检查点，重新运行时会重试", file=sys.stderr)
+            return
+        audio_data = b''.join(state.results)
+        if self.output_dir:
+            path = os.path.join(self.output_dir, state.id + ".mp3")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(audio_data)
+            os.replace(tmp_path, path)
+        self.stats["documents"] += 1
+        self.stats["bytes"] += len(audio_data)
+        checkpoint.write(json.dumps({"id": state.id, "segments": len(state.segments),
+                                     "bytes": len(audio_data)}, ensure_ascii=False) + "\n")
+        checkpoint.flush()
+        # 释放音频内存
+        state.results = []
+
+    def _report(self, final: bool = False) -> None:
+        """输出进度和吞吐量"""
+        now = time.time()
+        if not final and now - self._last_report < PROGRESS_INTERVAL:
+            return
+        self._last_report = now
+        elapsed = max(now - self.start_time, 1e-6)
+        stats = self.stats
+        print(
+            f"{'完成' if final else '进度'}: 文档 {stats['documents']} (跳过 {stats['skipped']}, 失败 {stats['failed']}), "
+            f"段落 {stats['segments']} (缓存 {stats['cached_segments']}), "
+            f"{stats['segments'] / elapsed:.1f} 段/秒, {stats['chars'] / elapsed:.0f} 字符/秒, "
+            f"{stats['bytes'] / 1024 / 1024:.1f} MB, 耗时 {elapsed:.1f}秒",
+            flush=True
+        )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="离线批量预生成音频")
+    parser.add_argument("corpus", help="JSONL文件或包含 .txt 文件的目录")
+    parser.add_argument("--voice", default=config.DEFAULT_SPEAKERS["zh_cn"], help="默认声音（语料未指定时使用）")
+    parser.add_argument("--output-dir", help="输出目录，每个文档写出一个MP3文件；不指定时只写入磁盘缓存")
+    parser.add_argument("--checkpoint", help="检查点文件路径，默认为输出目录或缓存目录下的 bulk_render.checkpoint")
+    parser.add_argument("--concurrency", type=int, default=config.UPSTREAM_CONCURRENCY_MAX,
+                        help="最大并行段落数，实际并发还受上游自适应并发和速率限制约束")
+    args = parser.parse_args(argv)
+
+    if not args.output_dir and not config.CACHE_DIR:
+        parser.error("需要指定 --output-dir 或设置 CACHE_DIR 环境变量，否则生成的音频无处保存")
+    target_dir = args.output_dir or config.CACHE_DIR
+    os.makedirs(target_dir, exist_ok=True)
+    checkpoint_path = args.checkpoint or os.path.join(target_dir, "bulk_render.checkpoint")
+
+    renderer = BulkRenderer(args.output_dir, checkpoint_path, max(1, args.concurrency))
+    if renderer.done:
+        print(f"从检查点恢复，跳过 {len(renderer.done)} 个已完成的文档")
+    try:
+        success = renderer.run(load_corpus(args.corpus, args.voice))
+    except KeyboardInterrupt:
+        return 130
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
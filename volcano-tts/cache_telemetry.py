@@ -0,0 +1,272 @@
+"""
+缓存统计模块
+
+每次段落缓存查找只记录一个结果，按话者、语言和缓存层（内存/磁盘）细分：
+    - hit：命中未过期的条目
+    - stale：上游熔断期间返回过期的条目
+    - coalesced：相同段落正在从上游获取，等待该次获取的结果
+    - miss：从上游获取
+命中、过期命中和合并等待都没有访问上游，返回的音频字节计入 bytes_saved。
+另外记录两层缓存的淘汰次数（磁盘缓存的文件名是哈希，淘汰不区分话者）。
+
+按键的哈希抽样（CACHE_REUSE_SAMPLE_RATE）记录重用距离：同一个键两次访问之间访问过多少个不同的键。
+抽样键之间的重用距离除以抽样率即为全量访问的估计值，
+容量为C的LRU缓存的命中率约等于重用距离小于C的访问比例，据此可以估算 CACHE_MAX_SIZE。
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Dict, Hashable, Tuple
+
+import config
+import metrics
+
+# 查找结果
+RESULT_HIT = "hit"
+RESULT_STALE = "stale"
+RESULT_COALESCED = "coalesced"
+RESULT_MISS = "miss"
+
+# 缓存层
+TIER_MEMORY = "memory"
+TIER_DISK = "disk"
+
+# 各查找结果对应的 PERFORMANCE_METRICS 计数
+PERFORMANCE_KEYS = {
+    RESULT_HIT: "cache_hits",
+    RESULT_STALE: "stale_cache_hits",
+    RESULT_COALESCED: "cache_coalesced",
+    RESULT_MISS: "cache_misses"
+}
+
+# 估算命中率的缓存容量（条目数），另外总是包含当前的 CACHE_MAX_SIZE
+REUSE_SIZES = (10, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 50000)
+
+# 用于估算命中率的最近抽样访问数
+REUSE_WINDOW = 20000
+
+# 重用距离位置数组的大小（max_keys 的倍数），位置用完时重新编号
+REUSE_POSITION_FACTOR = 4
+
+# 访问次数分布的区间上限
+ACCESS_COUNT_BUCKETS = (1, 2, 4, 8, 16, 64)
+
+
+def key_labels(key: Hashable) -> Tuple[str, str]:
+    """从 (文本, 话者, 语言) 键中取出话者和语言"""
+    if isinstance(key, tuple) and len(key) == 3:
+        return str(key[1]), str(key[2])
+    return "", ""
+
+
+class _FenwickTree:
+    """树状数组：单点增减和前缀求和均为 O(log n)"""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._tree = [0] * (size + 1)
+
+    def add(self, index: int, delta: int) -> None:
+        """位置 index（从0开始）增加 delta"""
+        index += 1
+        while index <= self.size:
+            self._tree[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int) -> int:
+        """位置 0..index 的和"""
+        total = 0
+        index += 1
+        while index > 0:
+            total += self._tree[index]
+            index -= index & -index
+        return total
+
+
+class ReuseSampler:
+    """
+    按键哈希抽样的重用距离统计
+
+    同一个键总是被抽中或总是不被抽中，抽样键之间的相对访问顺序与全量一致，
+    因此抽样键的重用距离按抽样率放大后可以估计全量的重用距离。
+    只保存键的哈希，超过 max_keys 时丢弃最久未访问的键（之后再访问视为首次访问）。
+
+    每次访问分配一个递增的位置，树状数组在每个键最近一次访问的位置上记1，
+    重用距离即为该键上次位置之后的标记数，记录一次访问为 O(log n)。
+    位置用完时按访问顺序重新编号（均摊 O(1)）。
+    """
+
+    def __init__(self, rate: float, max_keys: int):
+        self.rate = min(max(rate, 0.0), 1.0)
+        self.max_keys = max(1, max_keys)
+        # 键哈希 -> (最近一次访问的位置, 访问次数)，按最近访问排序
+        self._keys: "OrderedDict[bytes, Tuple[int, int]]" = OrderedDict()
+        self._positions = _FenwickTree(REUSE_POSITION_FACTOR * self.max_keys)
+        self._clock = 0
+        self._distances: deque = deque(maxlen=REUSE_WINDOW)
+        self._lock = threading.Lock()
+        self.accesses = 0
+        self.cold = 0
+
+    def record(self, key: Hashable) -> None:
+        """记录一次访问（未被抽中的键直接忽略）"""
+        if self.rate <= 0:
+            return
+        digest = hashlib.blake2b(repr(key).encode('utf-8'), digest_size=8).digest()
+        if int.from_bytes(digest, 'big') >= self.rate * 2 ** 64:
+            return
+        with self._lock:
+            self.accesses += 1
+            if self._clock >= self._positions.size:
+                self._compact()
+            position = self._clock
+            self._clock += 1
+            entry = self._keys.get(digest)
+            if entry is None:
+                self.cold += 1
+                self._distances.append(float('inf'))
+                self._keys[digest] = (position, 1)
+                self._positions.add(position, 1)
+                if len(self._keys) > self.max_keys:
+                    _, (evicted, _) = self._keys.popitem(last=False)
+                    self._positions.add(evicted, -1)
+                return
+            last, count = entry
+            # 上次访问之后访问过的不同键数即为抽样键之间的重用距离
+            distance = len(self._keys) - self._positions.prefix(last)
+            self._distances.append(distance / self.rate)
+            self._positions.add(last, -1)
+            self._positions.add(position, 1)
+            self._keys[digest] = (position, count + 1)
+            self._keys.move_to_end(digest)
+
+    def _compact(self) -> None:
+        """按最近访问顺序把位置重新编号为 0..n-1（需持有锁）"""
+        self._positions = _FenwickTree(self._positions.size)
+        keys: "OrderedDict[bytes, Tuple[int, int]]" = OrderedDict()
+        for position, (digest, (_, count)) in enumerate(self._keys.items()):
+            keys[digest] = (position, count)
+            self._positions.add(position, 1)
+        self._keys = keys
+        self._clock = len(keys)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """抽样统计、各容量的估计命中率和抽样键的访问次数分布"""
+        with self._lock:
+            distances = sorted(self._distances)
+            counts = [count for _, count in self._keys.values()]
+            accesses, cold = self.accesses, self.cold
+        sizes = sorted(set(REUSE_SIZES) | {config.CACHE_MAX_SIZE})
+        estimates = {}
+        if distances:
+            index = 0
+            for size in sizes:
+                while index < len(distances) and distances[index] < size:
+                    index += 1
+                estimates[str(size)] = round(index / len(distances), 4)
+        access_counts = {}
+        lower = 1
+        for bound in ACCESS_COUNT_BUCKETS:
+            label = str(bound) if bound == lower else f"{lower}-{bound}"
+            access_counts[label] = sum(1 for c in counts if lower <= c <= bound)
+            lower = bound + 1
+        access_counts[f"{lower}+"] = sum(1 for c in counts if c >= lower)
+        finite = [d for d in distances if d != float('inf')]
+        return {
+            "sample_rate": self.rate,
+            "sampled_accesses": accesses,
+            "sampled_keys": len(counts),
+            "cold_accesses": cold,
+            "window": len(distances),
+            "median_distance": round(finite[len(finite) // 2], 1) if finite else None,
+            "estimated_hit_ratio": estimates,
+            "access_counts": access_counts
+        }
+
+
+class CacheTelemetry:
+    """段落缓存的查找、节省字节和淘汰统计"""
+
+    def __init__(self, sampler: ReuseSampler):
+        self.sampler = sampler
+        self.lookups = metrics.registry.counter(
+            "tts_cache_lookups_total", "段落缓存查找结果（hit/stale/coalesced/miss），按话者、语言和缓存层统计",
+            ("speaker", "lang", "result", "tier")
+        )
+        self.saved_bytes = metrics.registry.counter(
+            "tts_cache_saved_bytes_total", "缓存命中、过期命中和合并等待节省的上游音频字节",
+            ("speaker", "lang")
+        )
+        self.evictions = metrics.registry.counter(
+            "tts_cache_evictions_total", "缓存淘汰的条目数", ("tier",)
+        )
+        metrics.registry.gauge(
+            "tts_cache_estimated_hit_ratio", "根据抽样重用距离估算的各容量LRU缓存命中率",
+            self._estimate_gauge, ("size",)
+        )
+
+    def record(self, key: Hashable, result: str, tier: str = "", size: int = 0) -> None:
+        """记录一次段落查找的结果，size为返回的音频字节数"""
+        speaker, lang = key_labels(key)
+        self.lookups.inc(speaker=speaker, lang=lang, result=result, tier=tier)
+        if result != RESULT_MISS and size:
+            self.saved_bytes.inc(size, speaker=speaker, lang=lang)
+        metrics.increment(PERFORMANCE_KEYS[result])
+        self.sampler.record(key)
+
+    def record_eviction(self, tier: str, count: int = 1) -> None:
+        """记录淘汰的条目数"""
+        if count > 0:
+            self.evictions.inc(count, tier=tier)
+
+    def totals(self) -> Dict[str, Any]:
+        """各查找结果的总数、各层的命中数和命中率"""
+        totals = {result: 0 for result in PERFORMANCE_KEYS}
+        tiers = {TIER_MEMORY: 0, TIER_DISK: 0}
+        for (_, _, result, tier), value in self.lookups.values().items():
+            totals[result] += int(value)
+            if result == RESULT_HIT:
+                tiers[tier] = tiers.get(tier, 0) + int(value)
+        lookups = sum(totals.values())
+        totals["tier_hits"] = tiers
+        totals["lookups"] = lookups
+        totals["hit_rate"] = totals[RESULT_HIT] / lookups if lookups else 0
+        totals["bytes_saved"] = int(sum(self.saved_bytes.values().values()))
+        totals["evictions"] = {tier: int(value) for (tier,), value in self.evictions.values().items()}
+        return totals
+
+    def breakdown(self) -> Dict[str, Dict[str, Any]]:
+        """按 "话者/语言" 细分的查找结果和节省字节"""
+        voices: Dict[str, Dict[str, Any]] = {}
+
+        def entry(speaker: str, lang: str) -> Dict[str, Any]:
+            name = f"{speaker}/{lang}"
+            if name not in voices:
+                voices[name] = {"hits": {}, "stale": 0, "coalesced": 0, "misses": 0, "bytes_saved": 0}
+            return voices[name]
+
+        for (speaker, lang, result, tier), value in self.lookups.values().items():
+            item = entry(speaker, lang)
+            if result == RESULT_HIT:
+                item["hits"][tier] = item["hits"].get(tier, 0) + int(value)
+            elif result == RESULT_MISS:
+                item["misses"] += int(value)
+            else:
+                item[result] += int(value)
+        for (speaker, lang), value in self.saved_bytes.values().items():
+            entry(speaker, lang)["bytes_saved"] += int(value)
+        for item in voices.values():
+            hits = sum(item["hits"].values())
+            lookups = hits + item["stale"] + item["coalesced"] + item["misses"]
+            item["hit_rate"] = round(hits / lookups, 4) if lookups else 0
+        return voices
+
+    def _estimate_gauge(self) -> Dict[Tuple[str, ...], float]:
+        """各容量的估计命中率（没有抽样数据时为空）"""
+        estimates = self.sampler.snapshot()["estimated_hit_ratio"]
+        return {(size,): ratio for size, ratio in estimates.items()}
+
+
+# 创建全局缓存统计实例
+cache_telemetry = CacheTelemetry(ReuseSampler(config.CACHE_REUSE_SAMPLE_RATE, config.CACHE_REUSE_MAX_KEYS))
@@ -0,0 +1,241 @@
+"""
+调试记录索引模块
+
+在 DEBUG_DIR 下用 SQLite 保存每个调试记录的摘要（时间、声音、文本长度、耗时、状态、过滤命中等），
+调试页面和查询接口直接按条件分页查询索引，不再每次遍历目录、读取文件修改时间。
+
+索引只由调试写入线程更新；查询在其他线程中进行（WAL模式，读写互不阻塞）。
+服务启动时与目录中的文件同步一次：删除文件已不存在的条目，补充旧版本保存的文件。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+# 获取日志记录器
+logger = logging.getLogger('debug_utils')
+
+INDEX_FILE = "index.sqlite3"
+
+# 预览文本的最大长度
+PREVIEW_LENGTH = 120
+
+# 单次查询返回的最大条目数
+MAX_PAGE_SIZE = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS captures (
+    request_id TEXT PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    text_file TEXT,
+    audio_file TEXT,
+    voice TEXT,
+    speaker TEXT,
+    lang TEXT,
+    stream INTEGER,
+    text_length INTEGER,
+    segment_count INTEGER,
+    latency REAL,
+    status INTEGER,
+    error TEXT,
+    capture_reason TEXT,
+    filter_hits INTEGER DEFAULT 0,
+    filter_rules TEXT,
+    audio_size INTEGER,
+    preview TEXT
+);
+CREATE INDEX IF NOT EXISTS captures_timestamp ON captures (timestamp);
+CREATE INDEX IF NOT EXISTS captures_text_file ON captures (text_file);
+CREATE INDEX IF NOT EXISTS captures_audio_file ON captures (audio_file);
+"""
+
+
+def request_id_from_filename(filename: str) -> Optional[str]:
+    """从 {时间戳}_{请求ID}[_后缀].扩展名 中取出请求ID"""
+    parts = os.path.splitext(filename)[0].split('_')
+    return parts[1] if len(parts) >= 2 else None
+
+
+def summarize_record(filename: str, record: Dict[str, Any], timestamp: float) -> Dict[str, Any]:
+    """
+    从调试记录中提取索引字段
+
+    兼容旧版本的记录格式（original_request / parsed_request / filtered_text 分散在多个文件中）。
+    """
+    parsed = record.get("parsed_request") or record.get("original_request") or {}
+    if not isinstance(parsed, dict):
+        parsed = {}
+    text = record.get("cleaned_text") or record.get("filtered_text") or parsed.get("input") or \
+        parsed.get("original") or ""
+    rules = record.get("filter_hits") or []
+    return {
+        "request_id": record.get("request_id") or request_id_from_filename(filename),
+        "timestamp": timestamp,
+        "text_file": filename,
+        "voice": parsed.get("voice"),
+        "speaker": record.get("speaker"),
+        "lang": record.get("lang"),
+        "stream": int(bool(parsed.get("stream"))) if "stream" in parsed else None,
+        "text_length": len(parsed["input"]) if isinstance(parsed.get("input"), str) else None,
+        "segment_count": record.get("segment_count"),
+        "latency": record.get("latency"),
+        "status": record.get("status"),
+        "error": record.get("error"),
+        "capture_reason": record.get("capture_reason"),
+        "filter_hits": len(rules) if "filter_hits" in record else None,
+        "filter_rules": ",".join(sorted(set(rules))) or None,
+        "audio_size": record.get("audio_size"),
+        "preview": text[:PREVIEW_LENGTH] if isinstance(text, str) and text else None
+    }
+
+
+class CaptureIndex:
+    """调试记录的SQLite索引"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立的连接"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def add_records(self, summaries: Iterable[Dict[str, Any]]) -> None:
+        """写入或更新一批文本记录的摘要，已有条目只更新新记录中有值的字段"""
+        rows = [s for s in summaries if s.get("request_id")]
+        if not rows:
+            return
+        columns = list(rows[0].keys())
+        updates = ", ".join(f"{c}=COALESCE(excluded.{c}, captures.{c})" for c in columns
+                            if c not in ("request_id", "timestamp"))
+        sql = (f"INSERT INTO captures ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)}) "
+               f"ON CONFLICT(request_id) DO UPDATE SET {updates}")
+        with self._connect() as conn:
+            conn.executemany(sql, [[row.get(c) for c in columns] for row in rows])
+
+    def add_audio(self, files: Iterable[tuple]) -> None:
+        """记录一批音频文件 [(文件名, 时间戳, 大小)]"""
+        rows = []
+        for filename, timestamp, size in files:
+            request_id = request_id_from_filename(filename)
+            if request_id:
+                rows.append((request_id, timestamp, filename, size))
+        if not rows:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO captures (request_id, timestamp, audio_file, audio_size) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(request_id) DO UPDATE SET audio_file=excluded.audio_file, "
+                "audio_size=COALESCE(captures.audio_size, excluded.audio_size)",
+                rows
+            )
+
+    def remove_files(self, file_type: str, filenames: List[str]) -> None:
+        """文件被清理后更新索引，文本和音频都不存在的条目直接删除"""
+        if not filenames:
+            return
+        column = "text_file" if file_type == 'text' else "audio_file"
+        with self._connect() as conn:
+            conn.executemany(f"UPDATE captures SET {column}=NULL WHERE {column}=?", [(f,) for f in filenames])
+            conn.execute("DELETE FROM captures WHERE text_file IS NULL AND audio_file IS NULL")
+
+    def known_files(self, file_type: str) -> set:
+        """索引中已记录的文件名"""
+        column = "text_file" if file_type == 'text' else "audio_file"
+        rows = self._connect().execute(f"SELECT {column} FROM captures WHERE {column} IS NOT NULL").fetchall()
+        return {row[0] for row in rows}
+
+    def sync(self, directory: Dict[str, str], files: Dict[str, List[tuple]]) -> None:
+        """
+        启动时与目录同步：删除文件已不存在的条目，为索引中没有的文件补充条目
+
+        参数:
+            directory: 各类型文件所在目录
+            files: 各类型已有的文件 [(文件名, 修改时间, 大小)]，按时间从旧到新
+        """
+        for file_type in ('text', 'audio'):
+            present = {name for name, _, _ in files.get(file_type, [])}
+            known = self.known_files(file_type)
+            self.remove_files(file_type, sorted(known - present))
+            missing = [entry for entry in files.get(file_type, []) if entry[0] not in known]
+            if not missing:
+                continue
+            if file_type == 'audio':
+                self.add_audio(missing)
+                continue
+            summaries = []
+            for name, mtime, _ in missing:
+                try:
+                    with open(os.path.join(directory['text'], name), 'r', encoding='utf-8') as f:
+                        record = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if isinstance(record, dict):
+                    summaries.append(summarize_record(name, record, mtime))
+            # 旧版本同一请求有多个文本文件，最后写入的原始请求体文件作为条目的文本文件
+            summaries.sort(key=lambda s: s["text_file"].endswith("_raw.json"))
+            self.add_records(summaries)
+            logger.info(f"调试记录索引已补充 {len(summaries)} 个文本文件")
+
+    def query(self, limit: int = 50, offset: int = 0, since: Optional[float] = None,
+              until: Optional[float] = None, voice: Optional[str] = None,
+              min_length: Optional[int] = None, max_length: Optional[int] = None,
+              min_latency: Optional[float] = None, max_latency: Optional[float] = None,
+              filtered: Optional[bool] = None, rule: Optional[str] = None,
+              status: Optional[int] = None, reason: Optional[str] = None,
+              search: Optional[str] = None) -> Dict[str, Any]:
+        """按条件分页查询，按时间从新到旧排列"""
+        conditions = []
+        params: List[Any] = []
+        for column, op, value in (
+            ("timestamp", ">=", since), ("timestamp", "<=", until), ("voice", "=", voice),
+            ("text_length", ">=", min_length), ("text_length", "<=", max_length),
+            ("latency", ">=", min_latency), ("latency", "<=", max_latency),
+            ("status", "=", status), ("capture_reason", "=", reason)
+        ):
+            if value is not None:
+                conditions.append(f"{column} {op} ?")
+                params.append(value)
+        if filtered is not None:
+            conditions.append("filter_hits > 0" if filtered else "COALESCE(filter_hits, 0) = 0")
+        if rule:
+            conditions.append("(',' || filter_rules || ',') LIKE ?")
+            params.append(f"%,{rule},%")
+        if search:
+            conditions.append("preview LIKE ?")
+            params.append(f"%{search}%")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        offset = max(0, offset)
+
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(*) FROM captures {where}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT * FROM captures {where} ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return {
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "items": [dict(row) for row in rows]
+        }
+
+    def voices(self) -> List[str]:
+        """索引中出现过的声音"""
+        rows = self._connect().execute(
+            "SELECT DISTINCT voice FROM captures WHERE voice IS NOT NULL ORDER BY voice"
+        ).fetchall()
+        return [row[0] for row in rows]
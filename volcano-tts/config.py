@@ -1,4 +1,5 @@
 import os
+import json
 from pathlib import Path
 from dotenv import load_dotenv
 import logging
@@ -21,6 +22,17 @@ if not API_KEY:
     print("警告: 未设置API_KEY环境变量，使用默认值")
     API_KEY = 'sk-564565KDA231D'  # 默认值
 
+# 多租户API密钥配置（JSON对象，键为API密钥，值为该密钥的权重和配额）
+# 例如: {"sk-team-a": {"name": "team-a", "weight": 2, "max_concurrency": 10,
+#                      "chars_per_minute": 20000, "upstream_calls_per_minute": 600}}
+try:
+    API_KEYS = json.loads(os.getenv('API_KEYS', '') or '{}')
+    if not isinstance(API_KEYS, dict):
+        raise ValueError("API_KEYS必须是JSON对象")
+except ValueError:
+    print("警告: API_KEYS环境变量无效，只使用API_KEY")
+    API_KEYS = {}
+
 # 服务配置
 # 尝试从环境变量获取PORT，如果不存在或无法转换为整数，则使用默认值
 try:
@@ -45,12 +57,263 @@ except (TypeError, ValueError):
     print("警告: MAX_WORKERS环境变量无效，使用默认值5")
     MAX_WORKERS = 5
 
+try:
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '100'))
+except (TypeError, ValueError):
+    print("警告: BATCH_MAX_ITEMS环境变量无效，使用默认值100")
+    BATCH_MAX_ITEMS = 100
+
+# 缓存配置
+try:
+    CACHE_MAX_SIZE = int(os.getenv('CACHE_MAX_SIZE', '200'))
+except (TypeError, ValueError):
+    print("警告: CACHE_MAX_SIZE环境变量无效，使用默认值200")
+    CACHE_MAX_SIZE = 200
+
+try:
+    CACHE_TTL = int(os.getenv('CACHE_TTL', '86400'))
+except (TypeError, ValueError):
+    print("警告: CACHE_TTL环境变量无效，使用默认值86400")
+    CACHE_TTL = 86400
+
+# 磁盘缓存目录，为空表示只使用内存缓存
+CACHE_DIR = os.getenv('CACHE_DIR', '')
+
+try:
+    CACHE_DISK_MAX_MB = int(os.getenv('CACHE_DISK_MAX_MB', '0'))
+except (TypeError, ValueError):
+    print("警告: CACHE_DISK_MAX_MB环境变量无效，使用默认值0")
+    CACHE_DISK_MAX_MB = 0
+
+# 缓存键重用距离抽样配置
+try:
+    CACHE_REUSE_SAMPLE_RATE = float(os.getenv('CACHE_REUSE_SAMPLE_RATE', '0.1'))
+except (TypeError, ValueError):
+    print("警告: CACHE_REUSE_SAMPLE_RATE环境变量无效，使用默认值0.1")
+    CACHE_REUSE_SAMPLE_RATE = 0.1
+
+try:
+    CACHE_REUSE_MAX_KEYS = int(os.getenv('CACHE_REUSE_MAX_KEYS', '5000'))
+except (TypeError, ValueError):
+    print("警告: CACHE_REUSE_MAX_KEYS环境变量无效，使用默认值5000")
+    CACHE_REUSE_MAX_KEYS = 5000
+
+# 请求截止时间配置
+try:
+    REQUEST_TIMEOUT = float(os.getenv('REQUEST_TIMEOUT', '60'))
+except (TypeError, ValueError):
+    print("警告: REQUEST_TIMEOUT环境变量无效，使用默认值60")
+    REQUEST_TIMEOUT = 60.0
+
+try:
+    REQUEST_TIMEOUT_MAX = float(os.getenv('REQUEST_TIMEOUT_MAX', '300'))
+except (TypeError, ValueError):
+    print("警告: REQUEST_TIMEOUT_MAX环境变量无效，使用默认值300")
+    REQUEST_TIMEOUT_MAX = 300.0
+
+# 慢请求日志配置：总耗时超过该值（秒）的合成请求输出完整的阶段耗时，0表示关闭
+try:
+    SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', '5'))
+except (TypeError, ValueError):
+    print("警告: SLOW_REQUEST_THRESHOLD环境变量无效，使用默认值5")
+    SLOW_REQUEST_THRESHOLD = 5.0
+
+# 上游接口地址，压测时可以指向本地模拟上游（mock_upstream.py）
+UPSTREAM_URL = os.getenv('UPSTREAM_URL', 'https://translate.volcengine.com/web/tts/v1/')
+
+try:
+    UPSTREAM_TIMEOUT = float(os.getenv('UPSTREAM_TIMEOUT', '10'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_TIMEOUT环境变量无效，使用默认值10")
+    UPSTREAM_TIMEOUT = 10.0
+
+# 合成调度配置（优先级和准入控制）
+try:
+    SCHEDULER_MAX_CONCURRENCY = int(os.getenv('SCHEDULER_MAX_CONCURRENCY', '20'))
+except (TypeError, ValueError):
+    print("警告: SCHEDULER_MAX_CONCURRENCY环境变量无效，使用默认值20")
+    SCHEDULER_MAX_CONCURRENCY = 20
+
+try:
+    SCHEDULER_MAX_QUEUE = int(os.getenv('SCHEDULER_MAX_QUEUE', '200'))
+except (TypeError, ValueError):
+    print("警告: SCHEDULER_MAX_QUEUE环境变量无效，使用默认值200")
+    SCHEDULER_MAX_QUEUE = 200
+
+try:
+    SCHEDULER_INTERACTIVE_MAX_CHARS = int(os.getenv('SCHEDULER_INTERACTIVE_MAX_CHARS', '1000'))
+except (TypeError, ValueError):
+    print("警告: SCHEDULER_INTERACTIVE_MAX_CHARS环境变量无效，使用默认值1000")
+    SCHEDULER_INTERACTIVE_MAX_CHARS = 1000
+
+# 上游自适应并发限制配置（AIMD）
+try:
+    UPSTREAM_CONCURRENCY_INITIAL = int(os.getenv('UPSTREAM_CONCURRENCY_INITIAL', '10'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_CONCURRENCY_INITIAL环境变量无效，使用默认值10")
+    UPSTREAM_CONCURRENCY_INITIAL = 10
+
+try:
+    UPSTREAM_CONCURRENCY_MIN = int(os.getenv('UPSTREAM_CONCURRENCY_MIN', '1'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_CONCURRENCY_MIN环境变量无效，使用默认值1")
+    UPSTREAM_CONCURRENCY_MIN = 1
+
+try:
+    UPSTREAM_CONCURRENCY_MAX = int(os.getenv('UPSTREAM_CONCURRENCY_MAX', '50'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_CONCURRENCY_MAX环境变量无效，使用默认值50")
+    UPSTREAM_CONCURRENCY_MAX = 50
+
+# 上游速率限制配置（令牌桶）
+try:
+    UPSTREAM_RATE_LIMIT = float(os.getenv('UPSTREAM_RATE_LIMIT', '20'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_RATE_LIMIT环境变量无效，使用默认值20")
+    UPSTREAM_RATE_LIMIT = 20.0
+
+try:
+    UPSTREAM_RATE_BURST = int(os.getenv('UPSTREAM_RATE_BURST', '40'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_RATE_BURST环境变量无效，使用默认值40")
+    UPSTREAM_RATE_BURST = 40
+
+try:
+    UPSTREAM_SPEAKER_RATE_LIMIT = float(os.getenv('UPSTREAM_SPEAKER_RATE_LIMIT', '10'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_SPEAKER_RATE_LIMIT环境变量无效，使用默认值10")
+    UPSTREAM_SPEAKER_RATE_LIMIT = 10.0
+
+try:
+    UPSTREAM_SPEAKER_RATE_BURST = int(os.getenv('UPSTREAM_SPEAKER_RATE_BURST', '20'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_SPEAKER_RATE_BURST环境变量无效，使用默认值20")
+    UPSTREAM_SPEAKER_RATE_BURST = 20
+
+try:
+    UPSTREAM_RATE_MAX_WAIT = float(os.getenv('UPSTREAM_RATE_MAX_WAIT', '30'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_RATE_MAX_WAIT环境变量无效，使用默认值30")
+    UPSTREAM_RATE_MAX_WAIT = 30.0
+
+# 上游重试配置
+try:
+    UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', '2'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_MAX_RETRIES环境变量无效，使用默认值2")
+    UPSTREAM_MAX_RETRIES = 2
+
+try:
+    UPSTREAM_RETRY_BACKOFF = float(os.getenv('UPSTREAM_RETRY_BACKOFF', '0.2'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_RETRY_BACKOFF环境变量无效，使用默认值0.2")
+    UPSTREAM_RETRY_BACKOFF = 0.2
+
+# 上游熔断配置
+try:
+    UPSTREAM_BREAKER_FAILURES = int(os.getenv('UPSTREAM_BREAKER_FAILURES', '5'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_BREAKER_FAILURES环境变量无效，使用默认值5")
+    UPSTREAM_BREAKER_FAILURES = 5
+
+try:
+    UPSTREAM_BREAKER_RESET_TIMEOUT = float(os.getenv('UPSTREAM_BREAKER_RESET_TIMEOUT', '30'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_BREAKER_RESET_TIMEOUT环境变量无效，使用默认值30")
+    UPSTREAM_BREAKER_RESET_TIMEOUT = 30.0
+
+# 上游请求对冲配置
+UPSTREAM_HEDGE_ENABLED = os.getenv('UPSTREAM_HEDGE_ENABLED', 'false').lower() in ('true', '1', 'yes', 'y', 'on')
+try:
+    UPSTREAM_HEDGE_PERCENTILE = float(os.getenv('UPSTREAM_HEDGE_PERCENTILE', '95'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_HEDGE_PERCENTILE环境变量无效，使用默认值95")
+    UPSTREAM_HEDGE_PERCENTILE = 95.0
+
+try:
+    UPSTREAM_HEDGE_MAX_RATIO = float(os.getenv('UPSTREAM_HEDGE_MAX_RATIO', '0.1'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_HEDGE_MAX_RATIO环境变量无效，使用默认值0.1")
+    UPSTREAM_HEDGE_MAX_RATIO = 0.1
+
+# 上游连接池预热配置（启动后在后台建立连接）
+try:
+    UPSTREAM_WARM_CONNECTIONS = int(os.getenv('UPSTREAM_WARM_CONNECTIONS', '4'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_WARM_CONNECTIONS环境变量无效，使用默认值4")
+    UPSTREAM_WARM_CONNECTIONS = 4
+
+try:
+    UPSTREAM_WARM_TIMEOUT = float(os.getenv('UPSTREAM_WARM_TIMEOUT', '5'))
+except (TypeError, ValueError):
+    print("警告: UPSTREAM_WARM_TIMEOUT环境变量无效，使用默认值5")
+    UPSTREAM_WARM_TIMEOUT = 5.0
+
+# 缓存预热配置
+PREWARM_ENABLED = os.getenv('PREWARM_ENABLED', 'true').lower() in ('true', '1', 'yes', 'y', 'on')
+PREWARM_FILE = os.getenv('PREWARM_FILE', '')
+
+try:
+    PREWARM_MAX_ENTRIES = int(os.getenv('PREWARM_MAX_ENTRIES', '200'))
+except (TypeError, ValueError):
+    print("警告: PREWARM_MAX_ENTRIES环境变量无效，使用默认值200")
+    PREWARM_MAX_ENTRIES = 200
+
+try:
+    PREWARM_RATE = float(os.getenv('PREWARM_RATE', '2'))
+except (TypeError, ValueError):
+    print("警告: PREWARM_RATE环境变量无效，使用默认值2")
+    PREWARM_RATE = 2.0
+
+# 后台任务配置
+JOBS_DIR = os.getenv('JOBS_DIR', 'jobs')
+
+try:
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+except (TypeError, ValueError):
+    print("警告: JOB_WORKERS环境变量无效，使用默认值2")
+    JOB_WORKERS = 2
+
+try:
+    JOB_TTL = int(os.getenv('JOB_TTL', '86400'))
+except (TypeError, ValueError):
+    print("警告: JOB_TTL环境变量无效，使用默认值86400")
+    JOB_TTL = 86400
+
+try:
+    JOB_MAX_WAIT = float(os.getenv('JOB_MAX_WAIT', '60'))
+except (TypeError, ValueError):
+    print("警告: JOB_MAX_WAIT环境变量无效，使用默认值60")
+    JOB_MAX_WAIT = 60.0
+
+try:
+    JOB_SEGMENT_RETRIES = int(os.getenv('JOB_SEGMENT_RETRIES', '2'))
+except (TypeError, ValueError):
+    print("警告: JOB_SEGMENT_RETRIES环境变量无效，使用默认值2")
+    JOB_SEGMENT_RETRIES = 2
+
+# 事件循环监控配置
+LOOP_MONITOR_ENABLED = os.getenv('LOOP_MONITOR_ENABLED', 'true').lower() in ('true', '1', 'yes', 'y', 'on')
+try:
+    LOOP_MONITOR_INTERVAL = float(os.getenv('LOOP_MONITOR_INTERVAL', '0.1'))
+except (TypeError, ValueError):
+    print("警告: LOOP_MONITOR_INTERVAL环境变量无效，使用默认值0.1")
+    LOOP_MONITOR_INTERVAL = 0.1
+
+try:
+    LOOP_STALL_THRESHOLD = float(os.getenv('LOOP_STALL_THRESHOLD', '0.2'))
+except (TypeError, ValueError):
+    print("警告: LOOP_STALL_THRESHOLD环境变量无效，使用默认值0.2")
+    LOOP_STALL_THRESHOLD = 0.2
+
 # 日志配置
 LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
 LOG_FILE_PATH = os.getenv('LOG_FILE_PATH', 'logs/volcano-tts.log')
 LOG_FORMAT = os.getenv('LOG_FORMAT', '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 LOG_ROTATION = os.getenv('LOG_ROTATION', '1 MB')
 LOG_RETENTION = os.getenv('LOG_RETENTION', '30 days')
+# 日志由后台线程写入文件，调用方只把记录放入队列
+LOG_ASYNC = os.getenv('LOG_ASYNC', 'true').lower() in ('true', '1', 'yes', 'y', 'on')
 
 # 确保日志目录路径一致
 LOG_DIR = os.path.dirname(LOG_FILE_PATH)
@@ -66,6 +329,41 @@ except (TypeError, ValueError):
     print("警告: DEBUG_MAX_FILES环境变量无效，使用默认值100")
     DEBUG_MAX_FILES = 100
 
+try:
+    DEBUG_QUEUE_SIZE = int(os.getenv('DEBUG_QUEUE_SIZE', '1000'))
+except (TypeError, ValueError):
+    print("警告: DEBUG_QUEUE_SIZE环境变量无效，使用默认值1000")
+    DEBUG_QUEUE_SIZE = 1000
+
+DEBUG_FSYNC = os.getenv('DEBUG_FSYNC', 'true').lower() in ('true', '1', 'yes', 'y', 'on')
+
+# 调试记录采集策略：按比例采样，出错和慢请求总是保存
+try:
+    DEBUG_SAMPLE_RATE = int(os.getenv('DEBUG_SAMPLE_RATE', '1'))
+except (TypeError, ValueError):
+    print("警告: DEBUG_SAMPLE_RATE环境变量无效，使用默认值1")
+    DEBUG_SAMPLE_RATE = 1
+
+DEBUG_CAPTURE_ERRORS = os.getenv('DEBUG_CAPTURE_ERRORS', 'true').lower() in ('true', '1', 'yes', 'y', 'on')
+
+try:
+    DEBUG_SLOW_PERCENTILE = float(os.getenv('DEBUG_SLOW_PERCENTILE', '0'))
+except (TypeError, ValueError):
+    print("警告: DEBUG_SLOW_PERCENTILE环境变量无效，使用默认值0")
+    DEBUG_SLOW_PERCENTILE = 0.0
+
+try:
+    DEBUG_MAX_FILE_BYTES = int(os.getenv('DEBUG_MAX_FILE_BYTES', '0'))
+except (TypeError, ValueError):
+    print("警告: DEBUG_MAX_FILE_BYTES环境变量无效，使用默认值0")
+    DEBUG_MAX_FILE_BYTES = 0
+
+try:
+    DEBUG_MAX_TOTAL_MB = int(os.getenv('DEBUG_MAX_TOTAL_MB', '0'))
+except (TypeError, ValueError):
+    print("警告: DEBUG_MAX_TOTAL_MB环境变量无效，使用默认值0")
+    DEBUG_MAX_TOTAL_MB = 0
+
 # 确保调试目录存在
 if DEBUG_MODE:
     os.makedirs(DEBUG_DIR, exist_ok=True)
@@ -208,5 +506,15 @@ PERFORMANCE_METRICS = {
     "stream_requests": 0,
     "parallel_requests": 0,
     "total_audio_size": 0,
-    "avg_segment_size": 0
+    "avg_segment_size": 0,
+    "hedges_sent": 0,
+    "hedges_won": 0,
+    "hedges_cancelled": 0,
+    "stale_cache_hits": 0,
+    "cache_coalesced": 0,
+    "upstream_retries": 0,
+    "upstream_requests": 0,
+    "rejected_requests": 0,
+    "batch_requests": 0,
+    "batch_deduped_segments": 0
 }
@@ -0,0 +1,104 @@
+"""
+请求截止时间模块
+
+为每个请求创建端到端的截止时间，并向下传递给每个段落任务和上游重试，
+使客户端已经放弃的请求不再继续占用上游名额。
+
+截止时间同时记录请求的各阶段耗时：请求协程中顺序执行的阶段用 mark() 记录，
+段落任务在工作线程中测量的阶段（缓存查找、排队、上游、解码）用 add() 累加，
+多个段落并行时累加值可能超过请求总耗时。
+"""
+
+import threading
+import time
+import logging
+from typing import Dict, Optional
+
+import config
+
+# 获取日志记录器（与应用共用，确保写入日志文件）
+logger = logging.getLogger('volcano_tts')
+
+
+class DeadlineExceeded(Exception):
+    """请求的截止时间已到，剩余工作被放弃"""
+
+
+class Deadline:
+    """请求的端到端截止时间，timeout为None表示不限制"""
+
+    def __init__(self, timeout: Optional[float], request_id: str = ''):
+        self.request_id = request_id
+        self.started_at = time.time()
+        self.expires_at = self.started_at + timeout if timeout else None
+        self._last_mark = self.started_at
+        self._lock = threading.Lock()
+        # 各阶段耗时（秒），按记录顺序
+        self.stages: Dict[str, float] = {}
+
+    @classmethod
+    def from_header(cls, value: Optional[str], request_id: str = '') -> 'Deadline':
+        """
+        根据请求头 X-Request-Timeout（秒）创建截止时间
+
+        请求头缺失或无效时使用 REQUEST_TIMEOUT，且不超过 REQUEST_TIMEOUT_MAX。
+        """
+        timeout = config.REQUEST_TIMEOUT
+        if value:
+            try:
+                timeout = float(value)
+            except (TypeError, ValueError):
+                logger.warning(f"无效的 X-Request-Timeout 请求头: {value}")
+        if config.REQUEST_TIMEOUT_MAX > 0:
+            timeout = min(timeout, config.REQUEST_TIMEOUT_MAX) if timeout > 0 else config.REQUEST_TIMEOUT_MAX
+        return cls(timeout if timeout > 0 else None, request_id)
+
+    def remaining(self) -> float:
+        """剩余时间（秒），不限制时返回无穷大"""
+        if self.expires_at is None:
+            return float('inf')
+        return self.expires_at - time.time()
+
+    def expired(self) -> bool:
+        """是否已超过截止时间"""
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float) -> float:
+        """单次操作可用的超时时间：不超过cap，也不超过剩余时间"""
+        return max(0.0, min(cap, self.remaining()))
+
+    def check(self, what: str = '') -> None:
+        """已超过截止时间时抛出DeadlineExceeded"""
+        if self.expired():
+            raise DeadlineExceeded(f"已超过请求截止时间{'，放弃' + what if what else ''}")
+
+    def mark(self, stage: str) -> None:
+        """记录从上一次 mark() 到现在的阶段耗时和剩余预算"""
+        now = time.time()
+        remaining = self.remaining()
+        remaining_text = f"{remaining:.2f}秒" if remaining != float('inf') else "不限"
+        with self._lock:
+            elapsed = now - self._last_mark
+            self.stages[stage] = self.stages.get(stage, 0) + elapsed
+            self._last_mark = now
+        logger.info(f"[{self.request_id}] 阶段 {stage} 耗时 {elapsed:.3f}秒，剩余预算 {remaining_text}")
+
+    def add(self, stage: str, seconds: float) -> None:
+        """累加在工作线程中测量的阶段耗时（不影响 mark() 的计时起点）"""
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0) + seconds
+
+    def elapsed(self) -> float:
+        """从请求开始到现在的时间（秒）"""
+        return time.time() - self.started_at
+
+    def snapshot(self) -> Dict[str, float]:
+        """各阶段耗时（秒）的副本"""
+        with self._lock:
+            return {stage: round(seconds, 4) for stage, seconds in self.stages.items()}
+
+    def server_timing(self) -> str:
+        """Server-Timing 响应头：各阶段耗时和到目前为止的总耗时（毫秒）"""
+        parts = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in self.snapshot().items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
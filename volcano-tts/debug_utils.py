@@ -2,162 +2,505 @@
 调试工具模块
 
 提供保存请求文本和生成音频的功能，用于调试和问题排查。
+
+每个请求的原始请求体、过滤结果、分段和各阶段耗时合并为一条记录，
+请求结束时按采集策略（按比例采样、出错、慢请求）决定是否保存。
+
+保存操作只把记录放入有界队列，由后台写入线程批量写盘：
+每批文件写完后统一 fsync，已保存的文件按写入顺序记录在内存环形索引中，
+文件数超过 DEBUG_MAX_FILES 或总大小超过 DEBUG_MAX_TOTAL_MB 时直接删除最旧的文件，不再每次保存后遍历目录。
+队列已满时丢弃新记录并计数，调试功能不会拖慢请求。
+
+写入线程同时维护 DEBUG_DIR 下的SQLite索引（capture_index），调试页面通过索引分页查询记录。
 """
 
 import os
 import json
 import time
+import queue
 import logging
 import datetime
 import glob
-from typing import Dict, Any, List, Optional, Union
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Tuple, Union
 
 import config
+from capture_index import CaptureIndex, INDEX_FILE, summarize_record
 
 # 获取日志记录器
 logger = logging.getLogger('debug_utils')
 
-def save_request_text(request_id: str, request_data: Dict[str, Any], filtered_text: Optional[str] = None) -> None:
-    """
-    保存请求文本数据到文件
+# 每批最多写入的记录数
+WRITE_BATCH_SIZE = 64
+
+# 按耗时分位数采集前至少需要的请求数
+SLOW_MIN_SAMPLES = 20
+
+
+class DebugWriter:
+    """调试文件的后台批量写入线程"""
+
+    def __init__(self, queue_size: int, max_files: int, fsync: bool = True, max_bytes: int = 0,
+                 max_file_bytes: int = 0):
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.fsync = fsync
+        self._queue: "queue.Queue[Tuple[str, str, Union[bytes, Dict[str, Any]]]]" = queue.Queue(
+            maxsize=max(1, queue_size)
+        )
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # 各类型已保存文件的环形索引（文件名 -> (写入时间, 大小)），按写入顺序排列
+        self._index: Dict[str, "OrderedDict[str, Tuple[float, int]]"] = {'text': OrderedDict(), 'audio': OrderedDict()}
+        self._total_bytes = 0
+        self._dirs: Dict[str, Optional[str]] = {}
+        # 可查询的SQLite索引，写入线程启动并与目录同步后才可用
+        self.capture_index: Optional[CaptureIndex] = None
+        self.stats = {
+            "queued": 0,
+            "written": 0,
+            "dropped": 0,
+            "failed": 0,
+            "deleted": 0,
+            "oversize": 0,
+            "batches": 0,
+            "bytes": 0
+        }
 
-    参数:
-        request_id: 请求ID
-        request_data: 请求数据字典
-        filtered_text: 过滤后的文本（如果有）
-    """
-    if not config.DEBUG_MODE or not config.DEBUG_SAVE_TEXT:
-        logger.debug(f"调试模式未启用或未配置保存文本: DEBUG_MODE={config.DEBUG_MODE}, DEBUG_SAVE_TEXT={config.DEBUG_SAVE_TEXT}")
-        return
+    def submit(self, file_type: str, filename: str, payload: Union[bytes, Dict[str, Any]]) -> bool:
+        """
+        放入写入队列，立即返回
 
-    try:
-        # 确保目录存在
-        text_dir = os.path.join(config.DEBUG_DIR, 'text')
+        参数:
+            file_type: 'text' 或 'audio'
+            filename: 文件名
+            payload: 文件内容，字典在写入线程中序列化为JSON（超过单文件上限时截断长文本），字节原样写入
+
+        返回:
+            是否已放入队列（队列已满时丢弃）
+        """
+        self.start()
+        try:
+            self._queue.put_nowait((file_type, filename, payload))
+        except queue.Full:
+            with self._lock:
+                self.stats["dropped"] += 1
+            return False
+        with self._lock:
+            self.stats["queued"] += 1
+        return True
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """等待队列中的记录写完（用于服务停止和测试），返回是否在超时前写完"""
+        deadline = time.time() + timeout
+        while self._queue.unfinished_tasks and time.time() < deadline:
+            time.sleep(0.01)
+        return not self._queue.unfinished_tasks
+
+    def start(self) -> None:
+        """启动写入线程（首次保存时也会自动启动）"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='debug-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        """写入线程主体：加载已有文件的索引，然后批量写入队列中的记录"""
+        for file_type in self._index:
+            try:
+                self._load_index(file_type)
+            except Exception as e:
+                logger.error(f"加载调试文件索引失败: {str(e)}")
+        self._open_capture_index()
+        self._prune()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error(f"写入调试文件失败: {str(e)}", exc_info=True)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_batch(self, batch: List[Tuple[str, str, Union[bytes, Dict[str, Any]]]]) -> None:
+        """写入一批文件，全部写完后统一 fsync，更新SQLite索引，再按环形索引删除最旧的文件"""
+        opened = []
+        records = []
+        audio = []
+        for file_type, filename, payload in batch:
+            directory = self._directory(file_type)
+            if directory is None:
+                with self._lock:
+                    self.stats["failed"] += 1
+                continue
+            filepath = os.path.join(directory, filename)
+            try:
+                data = _fit_record(payload, self.max_file_bytes) if isinstance(payload, dict) else payload
+                if data is None or (self.max_file_bytes > 0 and len(data) > self.max_file_bytes):
+                    with self._lock:
+                        self.stats["oversize"] += 1
+                    continue
+                f = open(filepath, 'wb')
+                f.write(data)
+                f.flush()
+                opened.append(f)
+            except Exception as e:
+                logger.error(f"保存调试文件失败 {filepath}: {str(e)}")
+                with self._lock:
+                    self.stats["failed"] += 1
+                continue
+            logger.debug(f"已保存调试文件 {filepath}, 大小: {len(data)} 字节")
+            written_at = time.time()
+            if file_type == 'audio':
+                audio.append((filename, written_at, len(data)))
+            elif isinstance(payload, dict):
+                records.append(summarize_record(filename, payload, _record_time(payload, written_at)))
+            with self._lock:
+                self.stats["written"] += 1
+                self.stats["bytes"] += len(data)
+                index = self._index[file_type]
+                previous = index.get(filename)
+                if previous is not None:
+                    self._total_bytes -= previous[1]
+                index[filename] = (written_at, len(data))
+                index.move_to_end(filename)
+                self._total_bytes += len(data)
+
+        for f in opened:
+            try:
+                if self.fsync:
+                    os.fsync(f.fileno())
+            except OSError as e:
+                logger.warning(f"同步调试文件失败: {str(e)}")
+            finally:
+                f.close()
+
+        if self.capture_index is not None:
+            try:
+                self.capture_index.add_records(records)
+                self.capture_index.add_audio(audio)
+            except Exception as e:
+                logger.error(f"更新调试记录索引失败: {str(e)}")
+
+        with self._lock:
+            self.stats["batches"] += 1
+        self._prune()
+
+    def _prune(self) -> None:
+        """
+        删除最旧的文件，直到每类文件数不超过 max_files，
+        且两类文件的总大小不超过 max_bytes（为0时不限制）
+        """
+        removed: Dict[str, List[str]] = {'text': [], 'audio': []}
+        try:
+            self._prune_files(removed)
+        finally:
+            if self.capture_index is not None:
+                try:
+                    for file_type, filenames in removed.items():
+                        self.capture_index.remove_files(file_type, filenames)
+                except Exception as e:
+                    logger.error(f"更新调试记录索引失败: {str(e)}")
+
+    def _prune_files(self, removed: Dict[str, List[str]]) -> None:
+        """按环形索引删除文件，被删除的文件名记入 removed"""
+        while True:
+            with self._lock:
+                victim = None
+                for file_type, index in self._index.items():
+                    if len(index) > self.max_files:
+                        victim = file_type
+                        break
+                if victim is None and self.max_bytes > 0 and self._total_bytes > self.max_bytes:
+                    # 按总大小清理时删除两类文件中最旧的一个
+                    candidates = [(next(iter(index.values()))[0], file_type)
+                                  for file_type, index in self._index.items() if index]
+                    if candidates:
+                        victim = min(candidates)[1]
+                if victim is None:
+                    return
+                filename, (_, size) = self._index[victim].popitem(last=False)
+                self._total_bytes -= size
+            removed[victim].append(filename)
+            try:
+                os.remove(os.path.join(self._dirs[victim], filename))
+                logger.debug(f"已删除旧文件: {filename}")
+                with self._lock:
+                    self.stats["deleted"] += 1
+            except OSError:
+                pass
+
+    def _load_index(self, file_type: str) -> None:
+        """启动时扫描一次已有文件，按修改时间建立索引"""
+        directory = self._directory(file_type)
+        if directory is None:
+            return
+        pattern = '*.json' if file_type == 'text' else '*.mp3'
+        entries = []
+        for filepath in glob.glob(os.path.join(directory, pattern)):
+            try:
+                stat = os.stat(filepath)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, os.path.basename(filepath), stat.st_size))
+        entries.sort()
+        with self._lock:
+            index = self._index[file_type]
+            for mtime, filename, size in entries:
+                if filename not in index:
+                    index[filename] = (mtime, size)
+                    self._total_bytes += size
+
+    def _open_capture_index(self) -> None:
+        """打开SQLite索引并与目录中已有的文件同步"""
+        directory = self._dirs.get('text') or self._dirs.get('audio')
+        if directory is None:
+            return
+        try:
+            capture_index = CaptureIndex(os.path.join(os.path.dirname(directory), INDEX_FILE))
+            with self._lock:
+                files = {
+                    file_type: [(name, entry[0], entry[1]) for name, entry in index.items()]
+                    for file_type, index in self._index.items()
+                }
+            capture_index.sync(self._dirs, files)
+        except Exception as e:
+            logger.error(f"打开调试记录索引失败: {str(e)}")
+            return
+        self.capture_index = capture_index
+
+    def _directory(self, file_type: str) -> Optional[str]:
+        """获取并创建调试子目录（只在第一次使用时检查权限）"""
+        if file_type in self._dirs:
+            return self._dirs[file_type]
+        directory = os.path.join(config.DEBUG_DIR, file_type)
         try:
-            os.makedirs(text_dir, exist_ok=True)
-            logger.debug(f"确保目录存在: {text_dir}")
+            os.makedirs(directory, exist_ok=True)
         except Exception as dir_error:
-            logger.error(f"创建目录失败: {text_dir}, 错误: {str(dir_error)}")
+            logger.error(f"创建目录失败: {directory}, 错误: {str(dir_error)}")
             # 尝试在当前目录创建
-            text_dir = os.path.join(os.getcwd(), 'DEBUG', 'text')
-            os.makedirs(text_dir, exist_ok=True)
-            logger.info(f"已在当前目录创建: {text_dir}")
+            directory = os.path.join(os.getcwd(), 'DEBUG', file_type)
+            os.makedirs(directory, exist_ok=True)
+            logger.info(f"已在当前目录创建: {directory}")
 
         # 检查目录权限
-        if not os.access(text_dir, os.W_OK):
-            logger.error(f"没有写入权限: {text_dir}")
+        if not os.access(directory, os.W_OK):
+            logger.error(f"没有写入权限: {directory}")
             # 尝试修复权限
             try:
-                os.chmod(text_dir, 0o777)
-                logger.info(f"已尝试修复目录权限: {text_dir}")
+                os.chmod(directory, 0o777)
+                logger.info(f"已尝试修复目录权限: {directory}")
             except Exception as perm_error:
                 logger.error(f"修复权限失败: {str(perm_error)}")
-                return
-
-        # 创建保存数据
-        save_data = {
-            'timestamp': datetime.datetime.now().isoformat(),
-            'request_id': request_id,
-            'original_request': request_data,
-            'filtered_text': filtered_text
-        }
-
-        # 生成文件名
-        timestamp = int(time.time())
-        filename = f"{timestamp}_{request_id}.json"
-        filepath = os.path.join(text_dir, filename)
+                directory = None
+        self._dirs[file_type] = directory
+        return directory
+
+    def files(self, file_type: str) -> List[Tuple[str, float]]:
+        """已保存的文件（文件名, 写入时间），从新到旧"""
+        with self._lock:
+            return [(filename, entry[0]) for filename, entry in reversed(self._index[file_type].items())]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取写入统计"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["text_files"] = len(self._index['text'])
+            stats["audio_files"] = len(self._index['audio'])
+            stats["total_bytes"] = self._total_bytes
+        stats["pending"] = self._queue.qsize()
+        return stats
+
+
+def _record_time(record: Dict[str, Any], default: float) -> float:
+    """记录中的请求开始时间（Unix时间戳）"""
+    try:
+        return datetime.datetime.fromisoformat(record["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return default
 
-        # 保存到文件
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(save_data, f, ensure_ascii=False, indent=2)
 
-        logger.info(f"已保存请求文本到 {filepath}")
+# 创建全局写入实例
+debug_writer = DebugWriter(config.DEBUG_QUEUE_SIZE, config.DEBUG_MAX_FILES, config.DEBUG_FSYNC,
+                           config.DEBUG_MAX_TOTAL_MB * 1024 * 1024, config.DEBUG_MAX_FILE_BYTES)
 
-        # 清理旧文件
-        cleanup_old_files('text')
-    except Exception as e:
-        logger.error(f"保存请求文本失败: {str(e)}", exc_info=True)
 
-def save_audio_data(request_id: str, audio_data: bytes, is_filtered: bool = False) -> None:
+class CapturePolicy:
     """
-    保存音频数据到文件
+    调试记录的采集策略
 
-    参数:
-        request_id: 请求ID
-        audio_data: 音频数据
-        is_filtered: 是否经过过滤
+    满足任一条件的请求会被保存：
+        - 每 sample_rate 个请求采样一个（0表示不采样）
+        - 请求出错（capture_errors）
+        - 请求耗时超过最近请求的第 slow_percentile 百分位（0表示不按耗时采集）
     """
-    if not config.DEBUG_MODE or not config.DEBUG_SAVE_AUDIO or not audio_data:
-        logger.debug(f"调试模式未启用或未配置保存音频: DEBUG_MODE={config.DEBUG_MODE}, DEBUG_SAVE_AUDIO={config.DEBUG_SAVE_AUDIO}")
-        return
-
-    try:
-        # 确保目录存在
-        audio_dir = os.path.join(config.DEBUG_DIR, 'audio')
-        try:
-            os.makedirs(audio_dir, exist_ok=True)
-            logger.debug(f"确保目录存在: {audio_dir}")
-        except Exception as dir_error:
-            logger.error(f"创建目录失败: {audio_dir}, 错误: {str(dir_error)}")
-            # 尝试在当前目录创建
-            audio_dir = os.path.join(os.getcwd(), 'DEBUG', 'audio')
-            os.makedirs(audio_dir, exist_ok=True)
-            logger.info(f"已在当前目录创建: {audio_dir}")
-
-        # 检查目录权限
-        if not os.access(audio_dir, os.W_OK):
-            logger.error(f"没有写入权限: {audio_dir}")
-            # 尝试修复权限
-            try:
-                os.chmod(audio_dir, 0o777)
-                logger.info(f"已尝试修复目录权限: {audio_dir}")
-            except Exception as perm_error:
-                logger.error(f"修复权限失败: {str(perm_error)}")
-                return
 
-        # 生成文件名
-        timestamp = int(time.time())
-        filtered_tag = "_filtered" if is_filtered else ""
-        filename = f"{timestamp}_{request_id}{filtered_tag}.mp3"
-        filepath = os.path.join(audio_dir, filename)
+    def __init__(self, sample_rate: int, capture_errors: bool, slow_percentile: float, window: int = 500):
+        self.sample_rate = max(0, sample_rate)
+        self.capture_errors = capture_errors
+        self.slow_percentile = slow_percentile
+        self._latencies: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._seen = 0
+        self.stats = {"requests": 0, "captured": 0, "sampled": 0, "error": 0, "slow": 0}
+
+    def decide(self, latency: float, error: bool) -> Optional[str]:
+        """记录请求耗时并决定是否保存，返回采集原因，不保存时返回None"""
+        with self._lock:
+            self._seen += 1
+            self.stats["requests"] += 1
+            threshold = None
+            if self.slow_percentile > 0 and len(self._latencies) >= SLOW_MIN_SAMPLES:
+                ordered = sorted(self._latencies)
+                threshold = ordered[min(len(ordered) - 1, int(len(ordered) * self.slow_percentile / 100))]
+            if not error:
+                self._latencies.append(latency)
+
+            if error and self.capture_errors:
+                reason = "error"
+            elif threshold is not None and latency > threshold:
+                reason = "slow"
+            elif self.sample_rate > 0 and self._seen % self.sample_rate == 0:
+                reason = "sampled"
+            else:
+                return None
+            self.stats["captured"] += 1
+            self.stats[reason] += 1
+            return reason
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取采集统计"""
+        with self._lock:
+            stats = dict(self.stats)
+        stats.update({
+            "sample_rate": self.sample_rate,
+            "capture_errors": self.capture_errors,
+            "slow_percentile": self.slow_percentile
+        })
+        return stats
+
+
+class DebugCapture:
+    """
+    一个请求的调试记录
 
-        # 保存到文件
-        with open(filepath, 'wb') as f:
-            f.write(audio_data)
+    请求处理过程中逐步填充，请求结束时由 finish_capture 按采集策略决定是否保存；
+    原始请求体、过滤结果、分段和各阶段耗时合并为一个JSON文件，音频单独保存。
+    """
 
-        logger.info(f"已保存音频数据到 {filepath}, 大小: {len(audio_data)} 字节")
+    def __init__(self, request_id: str, raw_body: str, parsed_request: Dict[str, Any]):
+        self.request_id = request_id
+        self.started_at = time.time()
+        self.raw_body = raw_body
+        self.parsed_request = parsed_request
+        self.filtered_text: Optional[str] = None
+        self.cleaned_text: Optional[str] = None
+        self.filter_hits: List[str] = []
+        self.segments: List[str] = []
+        self.speaker: Optional[str] = None
+        self.lang: Optional[str] = None
+
+    def to_record(self, latency: float, status: int, error: Optional[str], reason: str,
+                  stages: Dict[str, float], audio_size: int) -> Dict[str, Any]:
+        """生成保存的记录"""
+        return {
+            "timestamp": datetime.datetime.fromtimestamp(self.started_at).isoformat(),
+            "request_id": self.request_id,
+            "capture_reason": reason,
+            "status": status,
+            "error": error,
+            "latency": round(latency, 4),
+            "stages": stages,
+            "raw_request_body": self.raw_body,
+            "parsed_request": self.parsed_request,
+            "filtered_text": self.filtered_text,
+            "cleaned_text": self.cleaned_text,
+            "filter_hits": self.filter_hits,
+            "speaker": self.speaker,
+            "lang": self.lang,
+            "segments": self.segments,
+            "segment_count": len(self.segments),
+            "audio_size": audio_size
+        }
 
-        # 清理旧文件
-        cleanup_old_files('audio')
-    except Exception as e:
-        logger.error(f"保存音频数据失败: {str(e)}", exc_info=True)
 
-def cleanup_old_files(file_type: str) -> None:
+def _fit_record(record: Dict[str, Any], max_bytes: int) -> Optional[bytes]:
+    """序列化记录，超过 max_bytes 时截断长文本字段，仍然超出时返回None"""
+    data = json.dumps(record, ensure_ascii=False, indent=2).encode('utf-8')
+    if max_bytes <= 0 or len(data) <= max_bytes:
+        return data
+    # UTF-8 中文每个字符3字节，四个长文本字段平分配额
+    limit = max(100, max_bytes // 16)
+    for field in ("raw_request_body", "filtered_text", "cleaned_text"):
+        if isinstance(record.get(field), str) and len(record[field]) > limit:
+            record[field] = record[field][:limit]
+    parsed = record.get("parsed_request")
+    if isinstance(parsed, dict) and isinstance(parsed.get("input"), str) and len(parsed["input"]) > limit:
+        record["parsed_request"] = dict(parsed, input=parsed["input"][:limit])
+    segments = record["segments"]
+    kept, used = [], 0
+    for segment in segments:
+        used += len(segment)
+        if used > limit:
+            break
+        kept.append(segment)
+    record["segments"] = kept
+    record["truncated"] = True
+    data = json.dumps(record, ensure_ascii=False, indent=2).encode('utf-8')
+    return data if len(data) <= max_bytes else None
+
+
+# 创建全局采集策略
+capture_policy = CapturePolicy(config.DEBUG_SAMPLE_RATE, config.DEBUG_CAPTURE_ERRORS, config.DEBUG_SLOW_PERCENTILE)
+
+
+def start_capture(request_id: str, raw_body: str, parsed_request: Dict[str, Any]) -> Optional[DebugCapture]:
+    """开始记录一个请求，调试模式未启用时返回None"""
+    if not config.DEBUG_MODE or not (config.DEBUG_SAVE_TEXT or config.DEBUG_SAVE_AUDIO):
+        return None
+    return DebugCapture(request_id, raw_body, parsed_request)
+
+def finish_capture(capture: Optional[DebugCapture], status: int = 200, error: Optional[str] = None,
+                   audio_data: Optional[bytes] = None, audio_size: Optional[int] = None,
+                   stages: Optional[Dict[str, float]] = None) -> None:
     """
-    清理旧文件，保持文件数量在限制范围内
+    请求结束时按采集策略决定是否保存调试记录
 
     参数:
-        file_type: 文件类型 ('text' 或 'audio')
+        capture: start_capture 返回的记录（None时忽略）
+        status: 响应状态码
+        error: 错误信息
+        audio_data: 完整音频（流式响应没有完整音频时为None）
+        audio_size: 音频大小（未提供时使用 audio_data 的长度）
+        stages: 各阶段耗时（秒）
     """
-    try:
-        # 获取目录路径
-        dir_path = os.path.join(config.DEBUG_DIR, file_type)
-
-        # 获取所有文件
-        pattern = '*.json' if file_type == 'text' else '*.mp3'
-        files = glob.glob(os.path.join(dir_path, pattern))
-
-        # 按修改时间排序
-        files.sort(key=os.path.getmtime)
+    if capture is None:
+        return
+    latency = time.time() - capture.started_at
+    is_error = error is not None or status >= 500
+    reason = capture_policy.decide(latency, is_error)
+    if reason is None:
+        return
+    if audio_size is None:
+        audio_size = len(audio_data) if audio_data else 0
 
-        # 如果文件数量超过限制，删除最旧的文件
-        if len(files) > config.DEBUG_MAX_FILES:
-            files_to_delete = files[:len(files) - config.DEBUG_MAX_FILES]
-            for file_path in files_to_delete:
-                os.remove(file_path)
-                logger.debug(f"已删除旧文件: {file_path}")
-    except Exception as e:
-        logger.error(f"清理旧文件失败: {str(e)}")
+    # 序列化和单文件大小检查在写入线程中进行
+    timestamp = int(capture.started_at)
+    if config.DEBUG_SAVE_TEXT:
+        record = capture.to_record(latency, status, error, reason, stages or {}, audio_size)
+        debug_writer.submit('text', f"{timestamp}_{capture.request_id}.json", record)
+    if config.DEBUG_SAVE_AUDIO and audio_data:
+        debug_writer.submit('audio', f"{timestamp}_{capture.request_id}.mp3", audio_data)
 
 def get_debug_info() -> Dict[str, Any]:
     """
@@ -170,17 +513,8 @@ def get_debug_info() -> Dict[str, Any]:
         return {'debug_enabled': False}
 
     try:
-        # 获取文本文件数量
-        text_dir = os.path.join(config.DEBUG_DIR, 'text')
-        text_files = glob.glob(os.path.join(text_dir, '*.json'))
-
-        # 获取音频文件数量
-        audio_dir = os.path.join(config.DEBUG_DIR, 'audio')
-        audio_files = glob.glob(os.path.join(audio_dir, '*.mp3'))
-
-        # 获取最新文件
-        latest_text = max(text_files, key=os.path.getmtime) if text_files else None
-        latest_audio = max(audio_files, key=os.path.getmtime) if audio_files else None
+        text_files = debug_writer.files('text')
+        audio_files = debug_writer.files('audio')
 
         return {
             'debug_enabled': True,
@@ -188,10 +522,15 @@ def get_debug_info() -> Dict[str, Any]:
             'save_text': config.DEBUG_SAVE_TEXT,
             'save_audio': config.DEBUG_SAVE_AUDIO,
             'max_files': config.DEBUG_MAX_FILES,
+            'max_total_mb': config.DEBUG_MAX_TOTAL_MB,
+            'max_file_bytes': config.DEBUG_MAX_FILE_BYTES,
             'text_files_count': len(text_files),
             'audio_files_count': len(audio_files),
-            'latest_text': os.path.basename(latest_text) if latest_text else None,
-            'latest_audio': os.path.basename(latest_audio) if latest_audio else None
+            'latest_text': text_files[0][0] if text_files else None,
+            'latest_audio': audio_files[0][0] if audio_files else None,
+            'writer': debug_writer.snapshot(),
+            'capture': capture_policy.snapshot(),
+            'index_ready': debug_writer.capture_index is not None
         }
     except Exception as e:
         logger.error(f"获取调试信息失败: {str(e)}")
@@ -199,3 +538,22 @@ def get_debug_info() -> Dict[str, Any]:
             'debug_enabled': True,
             'error': str(e)
         }
+
+def query_captures(**filters: Any) -> Dict[str, Any]:
+    """
+    按条件分页查询调试记录（参数见 CaptureIndex.query），附带文本和音频的访问地址
+
+    索引尚未就绪（写入线程未启动或正在与目录同步）时返回空结果，ready 为 False。
+    """
+    capture_index = debug_writer.capture_index
+    if capture_index is None:
+        debug_writer.start()
+        return {'ready': False, 'total': 0, 'limit': filters.get('limit', 0),
+                'offset': filters.get('offset', 0), 'items': []}
+    result = capture_index.query(**filters)
+    for item in result['items']:
+        item['text_url'] = f"/debug/text/{item['text_file']}" if item['text_file'] else None
+        item['audio_url'] = f"/debug/audio/{item['audio_file']}" if item['audio_file'] else None
+    result['ready'] = True
+    result['voices'] = capture_index.voices()
+    return result
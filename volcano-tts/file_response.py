@@ -0,0 +1,127 @@
+"""
+文件响应模块
+
+支持 Range 请求（单个字节范围）的文件响应。
+服务器提供 ASGI zerocopysend 扩展时使用 sendfile 零拷贝发送文件，
+否则分块读取文件发送，不会把整个文件读入内存。
+"""
+
+import os
+import re
+from typing import Optional, Tuple
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+# 分块读取文件的大小
+FILE_CHUNK_SIZE = 64 * 1024
+
+_RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(range_header: Optional[str], file_size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析 Range 请求头
+
+    返回:
+        (起始位置, 结束位置) 闭区间；没有请求头或包含多个范围时返回None（返回完整文件）
+
+    异常:
+        ValueError: 范围无法满足
+    """
+    if not range_header:
+        return None
+    match = _RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        # 多个范围或无法识别的格式，按规范可以忽略并返回完整文件
+        return None
+    start_text, end_text = match.groups()
+    if not start_text and not end_text:
+        raise ValueError("无效的Range")
+    if not start_text:
+        # bytes=-N 表示最后N个字节
+        length = int(end_text)
+        if length == 0:
+            raise ValueError("无效的Range")
+        if file_size == 0:
+            raise ValueError("Range超出文件大小")
+        return max(0, file_size - length), file_size - 1
+    start = int(start_text)
+    end = min(int(end_text), file_size - 1) if end_text else file_size - 1
+    if start >= file_size or start > end:
+        raise ValueError("Range超出文件大小")
+    return start, end
+
+
+class RangeFileResponse(Response):
+    """支持 Range 请求的文件响应"""
+
+    def __init__(self, path: str, range_header: Optional[str] = None,
+                 media_type: str = "application/octet-stream", filename: Optional[str] = None,
+                 headers: Optional[dict] = None):
+        self.path = path
+        self.file_size = os.stat(path).st_size
+        self.media_type = media_type
+        self.background = None
+        self.body = b''
+        self.status_code = 200
+        self.init_headers(headers)
+        self.headers["accept-ranges"] = "bytes"
+        if filename:
+            self.headers["content-disposition"] = f'attachment; filename="{filename}"'
+
+        self.start, self.end = 0, self.file_size - 1
+        try:
+            byte_range = parse_range(range_header, self.file_size)
+        except ValueError:
+            self.status_code = 416
+            self.headers["content-range"] = f"bytes */{self.file_size}"
+            self.headers["content-length"] = "0"
+            self.start, self.end = 0, -1
+            return
+        if byte_range is not None:
+            self.status_code = 206
+            self.start, self.end = byte_range
+            self.headers["content-range"] = f"bytes {self.start}-{self.end}/{self.file_size}"
+        self.headers["content-length"] = str(self.end - self.start + 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers
+        })
+        count = self.end - self.start + 1
+        if count <= 0 or scope.get("method") == "HEAD":
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        if "http.response.zerocopysend" in scope.get("extensions", {}):
+            # 服务器支持零拷贝发送时直接交给sendfile
+            with open(self.path, "rb") as file:
+                await send({
+                    "type": "http.response.zerocopysend",
+                    "file": file.fileno(),
+                    "offset": self.start,
+                    "count": count,
+                    "more_body": False
+                })
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = count
+            while remaining > 0:
+                chunk = await file.read(min(FILE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({
+                    "type": "http.response.body",
+                    "body": chunk,
+                    "more_body": remaining > 0
+                })
+            if remaining > 0:
+                # 文件在发送过程中被截断
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
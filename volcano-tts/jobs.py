@@ -0,0 +1,361 @@
+"""
+后台合成任务模块
+
+超长文本可以作为后台任务提交：段落通过共享的合成调度器在后台合成，
+每完成一个段落就写入磁盘，最终拼接为完整的MP3文件。
+任务目录结构:
+    JOBS_DIR/<任务ID>/job.json        任务信息
+    JOBS_DIR/<任务ID>/seg_00000.mp3   已完成的段落
+    JOBS_DIR/<任务ID>/speech.mp3      完成后的完整音频
+服务重启后，未完成的任务从已落盘的段落继续合成。
+合成失败的段落按 JOB_SEGMENT_RETRIES 重试，仍然失败的段落在输出中跳过并记录在任务中，
+已完成的段落不会因为个别段落失败而作废。
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import config
+from scheduler import synthesis_scheduler, PRIORITY_BATCH
+from tenants import Tenant, tenant_registry, SYSTEM_TENANT
+
+# 获取日志记录器（与应用共用，确保写入日志文件）
+logger = logging.getLogger('volcano_tts')
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+JOB_FILE = "job.json"
+OUTPUT_FILE = "speech.mp3"
+
+# 失败段落每轮重试前的等待时间（秒），按轮数递增
+SEGMENT_RETRY_DELAY = 1.0
+
+
+class Job:
+    """一个后台合成任务"""
+
+    def __init__(self, job_id: str, directory: str, segments: List[str], speaker: str, lang: str,
+                 tenant: str, status: str = JOB_QUEUED, created_at: Optional[float] = None,
+                 error: Optional[str] = None, failed_segments: Optional[List[int]] = None):
+        self.id = job_id
+        self.directory = directory
+        self.segments = segments
+        self.speaker = speaker
+        self.lang = lang
+        self.tenant = tenant
+        self.status = status
+        self.created_at = created_at or time.time()
+        self.updated_at = self.created_at
+        self.error = error
+        # 重试后仍然失败、在输出中跳过的段落（从0开始）
+        self.failed_segments = failed_segments or []
+        self.completed = 0
+        # 每次进度或状态变化时递增，用于长轮询
+        self.version = 0
+
+    @property
+    def finished(self) -> bool:
+        """任务是否已结束"""
+        return self.status in (JOB_COMPLETED, JOB_FAILED)
+
+    @property
+    def output_path(self) -> str:
+        """完整音频文件路径"""
+        return os.path.join(self.directory, OUTPUT_FILE)
+
+    def segment_path(self, index: int) -> str:
+        """段落音频文件路径"""
+        return os.path.join(self.directory, f"seg_{index:05d}.mp3")
+
+    def save(self) -> None:
+        """保存任务信息（先写临时文件再替换，避免重启时读到不完整的文件）"""
+        data = {
+            "id": self.id,
+            "segments": self.segments,
+            "speaker": self.speaker,
+            "lang": self.lang,
+            "tenant": self.tenant,
+            "status": self.status,
+            "created_at": self.created_at,
+            "error": self.error,
+            "failed_segments": self.failed_segments
+        }
+        _write_atomic(os.path.join(self.directory, JOB_FILE),
+                      json.dumps(data, ensure_ascii=False).encode('utf-8'))
+
+    @classmethod
+    def load(cls, directory: str) -> 'Job':
+        """从任务目录加载任务"""
+        with open(os.path.join(directory, JOB_FILE), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        job = cls(data["id"], directory, data["segments"], data["speaker"], data["lang"],
+                  data.get("tenant", SYSTEM_TENANT.name), data.get("status", JOB_QUEUED),
+                  data.get("created_at"), data.get("error"), data.get("failed_segments"))
+        job.completed = sum(1 for i in range(len(job.segments)) if os.path.exists(job.segment_path(i)))
+        job.updated_at = os.path.getmtime(os.path.join(directory, JOB_FILE))
+        return job
+
+    def describe(self) -> Dict[str, Any]:
+        """任务状态（API响应）"""
+        total = len(self.segments)
+        completed = total - len(self.failed_segments) if self.status == JOB_COMPLETED else self.completed
+        info = {
+            "id": self.id,
+            "object": "audio.job",
+            "status": self.status,
+            "created_at": int(self.created_at),
+            "updated_at": int(self.updated_at),
+            "segments_total": total,
+            "segments_completed": completed,
+            "progress": 1.0 if self.finished or not total else round(completed / total, 4),
+            "error": self.error,
+            "failed_segments": [i + 1 for i in self.failed_segments],
+            "content_url": None,
+            "size": None
+        }
+        if self.status == JOB_COMPLETED:
+            info["content_url"] = f"/v1/audio/jobs/{self.id}/content"
+            try:
+                info["size"] = os.path.getsize(self.output_path)
+            except OSError:
+                pass
+        return info
+
+
+class JobManager:
+    """
+    后台任务管理器
+
+    最多同时运行 JOB_WORKERS 个任务，每个任务内部最多并行 MAX_WORKERS 个段落；
+    段落以批量优先级进入合成调度器，不占用同步请求的排队预算。
+    """
+
+    def __init__(self, jobs_dir: str, synthesize: Callable[..., bytes], workers: int = 2):
+        """
+        参数:
+            jobs_dir: 任务目录
+            synthesize: 段落合成函数，签名为 (文本, 话者, 语言, 截止时间, 调度凭据) -> 音频
+            workers: 同时运行的任务数
+        """
+        self.jobs_dir = jobs_dir
+        self._synthesize = synthesize
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        # 长轮询的等待者：任务ID -> [(事件循环, 事件)]
+        self._waiters: Dict[str, List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]]] = {}
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix="tts-job"
+        )
+
+    def submit(self, segments: List[str], speaker: str, lang: str, tenant: Tenant) -> Job:
+        """提交任务，立即返回"""
+        self.cleanup()
+        job_id = uuid.uuid4().hex
+        directory = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(directory, exist_ok=True)
+        job = Job(job_id, directory, segments, speaker, lang, tenant.name)
+        job.save()
+        with self._lock:
+            self._jobs[job_id] = job
+        self._executor.submit(self._run, job)
+        logger.info(f"已提交后台任务 [{job_id}]: tenant={tenant.name}, 段落数={len(segments)}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """获取任务，不存在时返回None"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    async def wait(self, job: Job, version: int, timeout: float) -> None:
+        """在事件循环中等待任务有新进度（version 变化）、结束或超时"""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._lock:
+            if job.finished or job.version != version:
+                return
+            self._waiters.setdefault(job.id, []).append(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(job.id, [])
+                if waiter in waiters:
+                    waiters.remove(waiter)
+                if not waiters:
+                    self._waiters.pop(job.id, None)
+
+    def _changed(self, job: Job) -> None:
+        """任务进度或状态变化：递增版本号并唤醒长轮询（需持有锁）"""
+        job.updated_at = time.time()
+        job.version += 1
+        for loop, event in self._waiters.get(job.id, []):
+            loop.call_soon_threadsafe(event.set)
+
+    def resume(self) -> int:
+        """
+        加载任务目录中的所有任务，继续运行未完成的任务
+
+        返回:
+            恢复运行的任务数
+        """
+        if not os.path.isdir(self.jobs_dir):
+            return 0
+        resumed = 0
+        for name in os.listdir(self.jobs_dir):
+            directory = os.path.join(self.jobs_dir, name)
+            if not os.path.isfile(os.path.join(directory, JOB_FILE)):
+                continue
+            try:
+                job = Job.load(directory)
+            except Exception as e:
+                logger.error(f"加载后台任务失败 {directory}: {str(e)}")
+                continue
+            with self._lock:
+                if job.id in self._jobs:
+                    continue
+                self._jobs[job.id] = job
+            if not job.finished:
+                job.status = JOB_QUEUED
+                self._executor.submit(self._run, job)
+                resumed += 1
+                logger.info(f"恢复后台任务 [{job.id}]，已完成 {job.completed}/{len(job.segments)} 个段落")
+        return resumed
+
+    def cleanup(self) -> None:
+        """删除超过 JOB_TTL 的已结束任务"""
+        if config.JOB_TTL <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished and now - job.updated_at > config.JOB_TTL]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            shutil.rmtree(job.directory, ignore_errors=True)
+            logger.info(f"已删除过期后台任务 [{job.id}]")
+
+    def _run(self, job: Job) -> None:
+        """运行任务：并行合成尚未落盘的段落，重试失败的段落，然后拼接输出文件"""
+        job.error = None
+        job.failed_segments = []
+        self._set_status(job, JOB_RUNNING)
+        tenant = tenant_registry.find(job.tenant) or SYSTEM_TENANT
+        ticket = synthesis_scheduler.ticket(PRIORITY_BATCH, tenant)
+        pending = [i for i in range(len(job.segments)) if not os.path.exists(job.segment_path(i))]
+
+        failed = self._synthesize_segments(job, pending, ticket)
+        for attempt in range(1, config.JOB_SEGMENT_RETRIES + 1):
+            if not failed:
+                break
+            logger.warning(f"后台任务 [{job.id}] 重试 {len(failed)} 个失败的段落 "
+                           f"({attempt}/{config.JOB_SEGMENT_RETRIES})")
+            time.sleep(SEGMENT_RETRY_DELAY * attempt)
+            failed = self._synthesize_segments(job, failed, ticket)
+
+        if failed and len(failed) == len(job.segments):
+            job.error = "所有段落合成失败"
+            self._set_status(job, JOB_FAILED)
+            return
+        if failed:
+            # 保留已完成的段落，跳过仍然失败的段落
+            job.failed_segments = sorted(failed)
+            job.error = f"{len(failed)} 个段落合成失败，已跳过: {[i + 1 for i in job.failed_segments]}"
+            logger.error(f"后台任务 [{job.id}] {job.error}")
+
+        try:
+            self._assemble(job)
+        except Exception as e:
+            logger.error(f"后台任务 [{job.id}] 拼接音频失败: {str(e)}", exc_info=True)
+            job.error = f"拼接音频失败: {str(e)}"
+            self._set_status(job, JOB_FAILED)
+            return
+        self._set_status(job, JOB_COMPLETED)
+        logger.info(f"后台任务完成 [{job.id}], 大小: {os.path.getsize(job.output_path)} 字节, "
+                    f"耗时: {time.time() - job.created_at:.2f}秒")
+
+    def _synthesize_segments(self, job: Job, indexes: List[int], ticket) -> List[int]:
+        """并行合成指定的段落，返回失败的段落"""
+        failed = []
+        workers = max(1, min(len(indexes), config.MAX_WORKERS))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(self._synthesize_segment, job, i, ticket): i for i in indexes}
+            for future in concurrent.futures.as_completed(futures):
+                index = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"后台任务 [{job.id}] 段落 {index + 1} 合成失败: {str(e)}")
+                    failed.append(index)
+        return failed
+
+    def _synthesize_segment(self, job: Job, index: int, ticket) -> None:
+        """合成一个段落并写入磁盘"""
+        audio_data = self._synthesize(job.segments[index], job.speaker, job.lang, None, ticket)
+        if not audio_data:
+            raise RuntimeError("上游返回空音频")
+        _write_atomic(job.segment_path(index), audio_data)
+        with self._lock:
+            job.completed += 1
+            self._changed(job)
+
+    def _assemble(self, job: Job) -> None:
+        """按顺序拼接段落文件（跳过失败的段落），完成后删除段落文件"""
+        tmp_path = job.output_path + ".tmp"
+        skipped = set(job.failed_segments)
+        with open(tmp_path, 'wb') as output:
+            for i in range(len(job.segments)):
+                if i in skipped:
+                    continue
+                with open(job.segment_path(i), 'rb') as segment:
+                    shutil.copyfileobj(segment, output)
+            output.flush()
+            os.fsync(output.fileno())
+        os.replace(tmp_path, job.output_path)
+        for i in range(len(job.segments)):
+            try:
+                os.remove(job.segment_path(i))
+            except OSError:
+                pass
+
+    def _set_status(self, job: Job, status: str) -> None:
+        """更新任务状态并保存"""
+        with self._lock:
+            job.status = status
+            self._changed(job)
+        try:
+            job.save()
+        except Exception as e:
+            logger.error(f"保存后台任务状态失败 [{job.id}]: {str(e)}")
+
+    def snapshot(self) -> Dict[str, int]:
+        """各状态的任务数"""
+        counts = {JOB_QUEUED: 0, JOB_RUNNING: 0, JOB_COMPLETED: 0, JOB_FAILED: 0}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    """先写临时文件再替换，保证文件要么完整要么不存在"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
@@ -0,0 +1,404 @@
+"""
+端到端压测工具
+
+在本进程中启动模拟上游（mock_upstream），服务以子进程（默认）或在本进程中运行，
+按场景矩阵（并发数 × 文本长度 × 流式/非流式 × 冷/热缓存）逐个压测，
+每个场景在固定时长内由多个客户端线程连续发送请求，统计：
+
+    - 吞吐量（请求/秒、字符/秒）和错误数
+    - 延迟和首字节时间（TTFB）的 p50/p95/p99
+    - 服务进程的CPU时间、CPU占用率和内存（RSS峰值）
+    - 缓存命中率和上游请求数（压测前后读取 /stats 计算）
+
+结果保存为JSON和/或CSV，指定 --baseline 时与之前的结果逐场景比较，
+用于对比不同分支的性能。
+
+用法:
+    python loadtest.py --output results.json --csv results.csv
+    python loadtest.py --concurrency 1,8,32 --lengths 50,500,5000 --stream both --cache cold,hot
+    python loadtest.py --in-process --duration 5 --baseline results.json --tolerance 0.1
+
+缓存场景:
+    cold: 每个请求的文本都不同，所有段落都需要请求上游
+    hot: 先把固定的一组文本各请求一次，压测时只从这组文本中选择
+
+服务进程默认关闭调试模式和上游速率限制（否则吞吐量由限速决定），可以用 --env KEY=VALUE 覆盖。
+服务以子进程运行时CPU和内存只统计服务进程；在本进程中运行时包括压测客户端和模拟上游。
+"""
+
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+import mock_upstream
+from replay import send_request, fetch_stats, percentile
+
+# 生成测试文本使用的句子
+SENTENCES = [
+    "今天的天气非常好，适合出去散步",
+    "这个问题需要从多个角度来分析",
+    "请注意，会议将在下午三点开始",
+    "我们已经收到了您的反馈，感谢您的支持",
+    "语音合成服务可以把文本转换为自然的语音",
+    "长文本会被自动分段，并行请求上游",
+    "缓存命中时不需要再次请求上游接口",
+    "如果有任何疑问，欢迎随时联系我们"
+]
+
+# 热缓存场景使用的文本数
+HOT_POOL_SIZE = 20
+
+# 进程资源采样间隔（秒）
+SAMPLE_INTERVAL = 0.2
+
+# 服务进程的默认环境变量（可用 --env 覆盖）
+DEFAULT_SERVICE_ENV = {
+    "DEBUG_MODE": "false",
+    "LOG_LEVEL": "WARNING",
+    "UPSTREAM_RATE_LIMIT": "0",
+    "UPSTREAM_SPEAKER_RATE_LIMIT": "0",
+    "UPSTREAM_WARM_CONNECTIONS": "0",
+    "PREWARM_ENABLED": "false",
+    "CACHE_DIR": ""
+}
+
+CSV_FIELDS = [
+    "scenario", "concurrency", "length", "stream", "cache", "requests", "errors", "duration",
+    "throughput", "chars_per_second", "latency_p50", "latency_p95", "latency_p99", "ttfb_p50",
+    "ttfb_p95", "ttfb_p99", "cpu_seconds", "cpu_percent", "rss_max_mb", "cache_hit_rate", "upstream_calls"
+]
+
+
+def make_text(length: int, seed: int) -> str:
+    """生成约 length 个字符的文本，不同 seed 生成的每个句子都不同（冷缓存下每个段落都不会命中）"""
+    parts = []
+    total = 0
+    for i in itertools.count():
+        sentence = f"{SENTENCES[(seed + i) % len(SENTENCES)]}，编号{seed}-{i}。"
+        parts.append(sentence)
+        total += len(sentence)
+        if total >= length:
+            break
+    return "".join(parts)[:max(length, 1)]
+
+
+class ProcessSampler:
+    """定期采样进程的CPU时间和RSS（Linux下读取 /proc，其他系统只支持本进程）"""
+
+    def __init__(self, pid: int, interval: float = SAMPLE_INTERVAL):
+        self.pid = pid
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._rss_max = 0
+        self._start_cpu: Optional[float] = None
+        self._start_time = 0.0
+
+    def start(self) -> None:
+        self._start_cpu = self._cpu_seconds()
+        self._start_time = time.time()
+        self._rss_max = self._rss_bytes() or 0
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='loadtest-sampler', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> Dict[str, Optional[float]]:
+        """停止采样，返回区间内的CPU时间、CPU占用率和RSS峰值"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        elapsed = time.time() - self._start_time
+        end_cpu = self._cpu_seconds()
+        cpu = end_cpu - self._start_cpu if end_cpu is not None and self._start_cpu is not None else None
+        return {
+            "cpu_seconds": round(cpu, 3) if cpu is not None else None,
+            "cpu_percent": round(cpu / elapsed * 100, 1) if cpu is not None and elapsed > 0 else None,
+            "rss_max_mb": round(self._rss_max / 1048576, 1) if self._rss_max else None
+        }
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            rss = self._rss_bytes()
+            if rss:
+                self._rss_max = max(self._rss_max, rss)
+
+    def _cpu_seconds(self) -> Optional[float]:
+        try:
+            with open(f"/proc/{self.pid}/stat", 'r') as f:
+                # 进程名可能包含空格，从右括号之后开始按字段分割
+                fields = f.read().rsplit(')', 1)[1].split()
+            return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+        except (OSError, IndexError, ValueError):
+            if self.pid != os.getpid():
+                return None
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            return usage.ru_utime + usage.ru_stime
+
+    def _rss_bytes(self) -> Optional[int]:
+        try:
+            with open(f"/proc/{self.pid}/status", 'r') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError):
+            pass
+        if self.pid == os.getpid():
+            # ru_maxrss 在Linux下为KB，在macOS下为字节
+            maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return maxrss if sys.platform == 'darwin' else maxrss * 1024
+        return None
+
+
+class Service:
+    """被压测的服务：子进程或本进程中的uvicorn"""
+
+    def __init__(self, port: int, env: Dict[str, str], in_process: bool):
+        self.port = port
+        self.env = env
+        self.in_process = in_process
+        self.process: Optional[subprocess.Popen] = None
+        self.server = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid if self.process is not None else os.getpid()
+
+    def start(self, timeout: float = 30.0) -> None:
+        env = dict(self.env, HOST="127.0.0.1", PORT=str(self.port))
+        if self.in_process:
+            # 配置在导入时读取，必须在导入服务之前设置环境变量
+            os.environ.update(env)
+            import uvicorn
+            import app
+            self.server = uvicorn.Server(uvicorn.Config(app.app, host="127.0.0.1", port=self.port,
+                                                        log_level="warning"))
+            threading.Thread(target=self.server.run, name='loadtest-service', daemon=True).start()
+        else:
+            self.process = subprocess.Popen(
+                [sys.executable, "app.py"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                env=dict(os.environ, **env),
+                # uvicorn 的访问日志写到标准输出，压测时丢弃；错误日志仍输出到标准错误
+                stdout=subprocess.DEVNULL
+            )
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.process is not None and self.process.poll() is not None:
+                raise RuntimeError(f"服务进程退出，返回码 {self.process.returncode}")
+            try:
+                if requests.get(f"{self.base_url}/healthz", timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise RuntimeError("等待服务启动超时")
+
+    def stop(self) -> None:
+        if self.process is not None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.server is not None:
+            self.server.should_exit = True
+
+
+def run_scenario(service: Service, api_key: str, voice: str, concurrency: int, length: int,
+                 stream: bool, cache: str, duration: float, timeout: float,
+                 seed_base: int) -> Dict[str, Any]:
+    """在固定时长内以 concurrency 个客户端连续发送请求，返回场景结果"""
+    url = f"{service.base_url}/v1/audio/speech"
+    counter = itertools.count(seed_base)
+    lock = threading.Lock()
+    hot_pool = [make_text(length, seed_base + i) for i in range(HOT_POOL_SIZE)]
+
+    def body_for(seq: int) -> str:
+        text = hot_pool[seq % HOT_POOL_SIZE] if cache == "hot" else make_text(length, seq)
+        return json.dumps({"model": "tts-1", "input": text, "voice": voice, "stream": stream},
+                          ensure_ascii=False)
+
+    session = requests.Session()
+    if cache == "hot":
+        # 预热：每个文本请求一次，不计入结果
+        for i in range(HOT_POOL_SIZE):
+            send_request(session, url, api_key, body_for(i), timeout)
+
+    results: List[Dict[str, Any]] = []
+    stop_at = time.time() + duration
+
+    def worker() -> None:
+        client = requests.Session()
+        while time.time() < stop_at:
+            with lock:
+                seq = next(counter)
+            result = send_request(client, url, api_key, body_for(seq), timeout)
+            with lock:
+                results.append(result)
+
+    before = fetch_stats(session, service.base_url, api_key)
+    sampler = ProcessSampler(service.pid)
+    sampler.start()
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for future in [executor.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    elapsed = time.time() - start
+    resources = sampler.stop()
+    after = fetch_stats(session, service.base_url, api_key)
+
+    ok = [r for r in results if r["error"] is None]
+    latencies = [r["latency"] for r in ok]
+    ttfbs = [r["ttfb"] for r in ok if r["ttfb"] is not None]
+    row: Dict[str, Any] = {
+        "scenario": f"c{concurrency}-len{length}-{'stream' if stream else 'full'}-{cache}",
+        "concurrency": concurrency,
+        "length": length,
+        "stream": stream,
+        "cache": cache,
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "duration": round(elapsed, 3),
+        "throughput": round(len(ok) / elapsed, 3) if elapsed > 0 else 0,
+        "chars_per_second": round(len(ok) * length / elapsed, 1) if elapsed > 0 else 0,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "ttfb_p50": percentile(ttfbs, 50),
+        "ttfb_p95": percentile(ttfbs, 95),
+        "ttfb_p99": percentile(ttfbs, 99),
+        "cache_hit_rate": None,
+        "upstream_calls": None
+    }
+    row.update(resources)
+    if before is not None and after is not None:
+        hits = after["cache"]["hits"] - before["cache"]["hits"]
+        lookups = after["cache"]["lookups"] - before["cache"]["lookups"]
+        row["cache_hit_rate"] = round(hits / lookups, 4) if lookups else 0
+        row["upstream_calls"] = after["upstream"]["requests"] - before["upstream"]["requests"]
+    return row
+
+
+def compare(rows: List[Dict[str, Any]], baseline: List[Dict[str, Any]], tolerance: float) -> List[str]:
+    """逐场景与基准比较，返回吞吐量下降或p95延迟上升超过容差的场景"""
+    previous = {row["scenario"]: row for row in baseline}
+    regressions = []
+    for row in rows:
+        base = previous.get(row["scenario"])
+        if base is None:
+            continue
+        if base["throughput"] > 0 and row["throughput"] < base["throughput"] * (1 - tolerance):
+            regressions.append(f"{row['scenario']}: 吞吐量 {row['throughput']} < 基准 {base['throughput']}")
+        if base["latency_p95"] > 0 and row["latency_p95"] > base["latency_p95"] * (1 + tolerance):
+            regressions.append(f"{row['scenario']}: p95延迟 {row['latency_p95']} > 基准 {base['latency_p95']}")
+    return regressions
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="端到端压测（使用本地模拟上游）")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8, 32], help="并发数列表（默认1,8,32）")
+    parser.add_argument("--lengths", type=_int_list, default=[50, 500, 5000], help="文本长度列表（默认50,500,5000）")
+    parser.add_argument("--stream", choices=["off", "on", "both"], default="both", help="流式场景（默认both）")
+    parser.add_argument("--cache", default="cold,hot", help="缓存场景，cold、hot或两者（默认cold,hot）")
+    parser.add_argument("--duration", type=float, default=10.0, help="每个场景的压测时长（秒，默认10）")
+    parser.add_argument("--timeout", type=float, default=120.0, help="单个请求的超时时间（秒）")
+    parser.add_argument("--voice", default="zh_male_xiaoming", help="请求使用的声音")
+    parser.add_argument("--port", type=int, default=5090, help="服务端口（默认5090）")
+    parser.add_argument("--mock-port", type=int, default=5091, help="模拟上游端口（默认5091）")
+    parser.add_argument("--mock-latency-base", type=float, default=0.15, help="模拟上游的基础延迟（秒）")
+    parser.add_argument("--mock-latency-per-char", type=float, default=0.004, help="模拟上游每字符延迟（秒）")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0, help="模拟上游返回500的比例")
+    parser.add_argument("--in-process", action="store_true", help="在本进程中运行服务（默认以子进程运行）")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="服务的环境变量，可重复")
+    parser.add_argument("--output", help="JSON结果保存路径")
+    parser.add_argument("--csv", help="CSV结果保存路径")
+    parser.add_argument("--baseline", help="基准JSON结果，退化超过容差时以状态码1退出")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="与基准比较的容差（默认0.1）")
+    args = parser.parse_args(argv)
+
+    streams = {"off": [False], "on": [True], "both": [False, True]}[args.stream]
+    caches = [c.strip() for c in args.cache.split(',') if c.strip() in ("cold", "hot")]
+
+    mock = mock_upstream.MockUpstream(mock_upstream.MockProfile(
+        latency_base=args.mock_latency_base,
+        latency_per_char=args.mock_latency_per_char,
+        error_rate=args.mock_error_rate
+    ), seed=0)
+    mock_server = mock_upstream.start_in_thread(mock, port=args.mock_port)
+
+    env = dict(DEFAULT_SERVICE_ENV, UPSTREAM_URL=f"http://127.0.0.1:{args.mock_port}/web/tts/v1/")
+    for item in args.env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    env.setdefault("API_KEY", os.getenv("API_KEY") or "loadtest")
+    service = Service(args.port, env, args.in_process)
+
+    rows: List[Dict[str, Any]] = []
+    try:
+        service.start()
+        scenarios = list(itertools.product(args.concurrency, args.lengths, streams, caches))
+        for index, (concurrency, length, stream, cache) in enumerate(scenarios):
+            # 每个场景使用不同的文本，冷缓存场景不会命中前面场景的缓存
+            row = run_scenario(service, env["API_KEY"], args.voice, concurrency, length, stream, cache,
+                               args.duration, args.timeout, seed_base=(index + 1) * 1000000)
+            rows.append(row)
+            print(f"[{index + 1}/{len(scenarios)}] {row['scenario']}: {row['throughput']} 请求/秒, "
+                  f"p50 {row['latency_p50']}  p95 {row['latency_p95']}  p99 {row['latency_p99']}  "
+                  f"TTFB p95 {row['ttfb_p95']}, 错误 {row['errors']}, CPU {row['cpu_percent']}%, "
+                  f"RSS {row['rss_max_mb']}MB, 命中率 {row['cache_hit_rate']}")
+    finally:
+        service.stop()
+        mock_server.should_exit = True
+
+    report = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "mode": "in-process" if args.in_process else "subprocess",
+        "duration": args.duration,
+        "mock": mock.profile.to_dict(),
+        "env": {k: v for k, v in env.items() if k != "API_KEY"},
+        "results": rows
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"JSON结果已保存到 {args.output}")
+    if args.csv:
+        with open(args.csv, 'w', encoding='utf-8', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(rows)
+        print(f"CSV结果已保存到 {args.csv}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(rows, baseline, args.tolerance)
+        if regressions:
+            for item in regressions:
+                print(f"退化: {item}", file=sys.stderr)
+            return 1
+        print("与基准相比没有超出容差的退化")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,8 @@
 import os
+import atexit
 import logging
-from logging.handlers import RotatingFileHandler
+import queue
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 from pathlib import Path
 import config
 
@@ -17,6 +19,20 @@ LOG_LEVELS = {
     'CRITICAL': logging.CRITICAL
 }
 
+# 异步日志：每个日志记录器一个后台写入线程
+_listeners = {}
+
+class RawQueueHandler(QueueHandler):
+    """
+    只把日志记录放入队列的处理器
+
+    QueueHandler.prepare() 会在调用方线程中格式化消息和异常堆栈；
+    这里直接传递原始记录，参数插值、异常堆栈和格式化都在后台线程的处理器中进行。
+    """
+
+    def prepare(self, record):
+        return record
+
 def setup_logger(name):
     """
     设置并返回一个配置好的日志记录器
@@ -36,6 +52,9 @@ def setup_logger(name):
     # 清除现有的处理器
     if logger.handlers:
         logger.handlers.clear()
+    if name in _listeners:
+        _listeners.pop(name).stop()
+    handlers = []
 
     # 创建格式化器
     formatter = logging.Formatter(config.LOG_FORMAT)
@@ -43,7 +62,7 @@ def setup_logger(name):
     # 控制台处理器
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    handlers.append(console_handler)
 
     # 解析日志轮转大小
     size_str = config.LOG_ROTATION
@@ -61,7 +80,7 @@ def setup_logger(name):
         backupCount=10  # 保留10个备份文件
     )
     file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+    handlers.append(file_handler)
 
     # 如果是错误日志记录器，添加专门的错误日志文件
     if name == 'error':
@@ -73,7 +92,7 @@ def setup_logger(name):
         )
         error_handler.setFormatter(formatter)
         error_handler.setLevel(logging.ERROR)
-        logger.addHandler(error_handler)
+        handlers.append(error_handler)
 
     # 如果是请求日志记录器，添加专门的请求日志文件
     if name == 'request':
@@ -84,10 +103,28 @@ def setup_logger(name):
             backupCount=10
         )
         request_handler.setFormatter(formatter)
-        logger.addHandler(request_handler)
+        handlers.append(request_handler)
+
+    if config.LOG_ASYNC:
+        # 调用方只把原始记录放入队列，由后台线程格式化并写入控制台和文件，磁盘缓慢不会阻塞事件循环
+        log_queue = queue.SimpleQueue()
+        listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+        listener.start()
+        _listeners[name] = listener
+        logger.addHandler(RawQueueHandler(log_queue))
+    else:
+        for handler in handlers:
+            logger.addHandler(handler)
 
     return logger
 
+@atexit.register
+def _stop_listeners():
+    """进程退出前写出队列中剩余的日志"""
+    for listener in list(_listeners.values()):
+        listener.stop()
+    _listeners.clear()
+
 # 创建应用日志记录器
 app_logger = setup_logger('volcano_tts')
 request_logger = setup_logger('request')
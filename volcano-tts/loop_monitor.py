@@ -0,0 +1,168 @@
+"""
+事件循环延迟监控模块
+
+事件循环上的协程每隔 LOOP_MONITOR_INTERVAL 秒醒来一次，记录实际唤醒时间比预期晚了多少（延迟），
+按固定区间统计直方图。另有一个看门狗线程检查协程的心跳：超过 LOOP_STALL_THRESHOLD 秒没有心跳，
+说明事件循环正在执行阻塞操作，此时抓取事件循环线程的调用栈并写入日志，便于定位阻塞代码。
+"""
+
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import config
+
+# 获取日志记录器（与应用共用，确保写入日志文件）
+logger = logging.getLogger('volcano_tts')
+
+# 延迟直方图的区间上限（秒）
+LAG_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# 用于计算分位数的最近样本数
+LAG_SAMPLES = 1000
+
+# 保留的最近阻塞记录数
+MAX_STALLS = 20
+
+# 调用栈保留的最大帧数
+STACK_LIMIT = 30
+
+
+class LoopMonitor:
+    """事件循环延迟监控和阻塞检测"""
+
+    def __init__(self, interval: float, stall_threshold: float):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._bucket_counts = [0] * (len(LAG_BUCKETS) + 1)
+        self._samples: deque = deque(maxlen=LAG_SAMPLES)
+        self._count = 0
+        self._sum = 0.0
+        self._max = 0.0
+        self._stalls: deque = deque(maxlen=MAX_STALLS)
+        self._stall_count = 0
+
+    def start(self) -> None:
+        """在事件循环中启动监控协程和看门狗线程（需在事件循环内调用）"""
+        if not config.LOOP_MONITOR_ENABLED or self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._watchdog.start()
+
+    def stop(self) -> None:
+        """停止监控"""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._watchdog = None
+
+    async def _tick(self) -> None:
+        """定时唤醒，记录事件循环延迟"""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._last_beat = now
+            self.record(max(0.0, now - expected))
+
+    def record(self, lag: float) -> None:
+        """记录一次延迟样本"""
+        index = len(LAG_BUCKETS)
+        for i, bound in enumerate(LAG_BUCKETS):
+            if lag <= bound:
+                index = i
+                break
+        with self._lock:
+            self._bucket_counts[index] += 1
+            self._samples.append(lag)
+            self._count += 1
+            self._sum += lag
+            self._max = max(self._max, lag)
+
+    def _watch(self) -> None:
+        """看门狗：心跳停止超过阈值时抓取事件循环线程的调用栈，每次阻塞只记录一次"""
+        stalled_since = None
+        stack = None
+        while not self._stop.wait(self.interval):
+            silence = time.monotonic() - self._last_beat
+            if silence > self.interval + self.stall_threshold:
+                if stalled_since is None:
+                    stalled_since = self._last_beat
+                    stack = self._capture_stack()
+                    logger.warning(
+                        f"事件循环已阻塞 {silence:.3f}秒，当前调用栈:\n{''.join(stack)}"
+                    )
+                continue
+            if stalled_since is not None:
+                duration = round(self._last_beat - stalled_since - self.interval, 4)
+                with self._lock:
+                    self._stall_count += 1
+                    self._stalls.append({
+                        "time": time.time() - (time.monotonic() - stalled_since),
+                        "duration": duration,
+                        "stack": stack
+                    })
+                logger.warning(f"事件循环阻塞结束，持续约 {duration}秒")
+                stalled_since = None
+                stack = None
+
+    def _capture_stack(self) -> List[str]:
+        """获取事件循环线程当前的调用栈"""
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return []
+        return traceback.format_stack(frame, limit=STACK_LIMIT)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取延迟直方图、分位数和最近的阻塞记录"""
+        with self._lock:
+            samples = sorted(self._samples)
+            buckets = {}
+            cumulative = 0
+            for bound, count in zip(LAG_BUCKETS, self._bucket_counts):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            buckets["+Inf"] = self._count
+            stalls = list(self._stalls)
+            stall_count = self._stall_count
+            count, total, maximum = self._count, self._sum, self._max
+
+        def percentile(p: float) -> float:
+            if not samples:
+                return 0
+            return round(samples[min(len(samples) - 1, int(len(samples) * p / 100))], 6)
+
+        return {
+            "enabled": config.LOOP_MONITOR_ENABLED,
+            "interval": self.interval,
+            "stall_threshold": self.stall_threshold,
+            "count": count,
+            "avg": round(total / count, 6) if count else 0,
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "p99": percentile(99),
+            "max": round(maximum, 6),
+            "buckets": buckets,
+            "stalls": stall_count,
+            "recent_stalls": stalls
+        }
+
+
+# 创建全局监控实例
+loop_monitor = LoopMonitor(config.LOOP_MONITOR_INTERVAL, config.LOOP_STALL_THRESHOLD)
@@ -0,0 +1,266 @@
+"""
+指标模块
+
+以 Prometheus 文本格式（/metrics）导出服务指标：
+    - 计数器：按路径、状态码、声音和流式模式统计的请求数，以及 PERFORMANCE_METRICS 中的各项计数
+    - 直方图：请求总耗时（到响应体发送完毕）、首字节时间、上游段落请求耗时、段落音频大小、合成请求各阶段耗时
+    - 仪表：上游在途请求、线程池和调度器的排队深度、缓存占用字节等，抓取时通过回调读取
+
+PERFORMANCE_METRICS 在多个工作线程中更新，统一通过 increment() 加锁修改；
+/stats 使用 performance_snapshot() 返回的副本，平均值由直方图计算。
+"""
+
+import concurrent.futures
+import threading
+from typing import Any, Callable, Dict, List, Sequence, Tuple, Union
+
+import config
+
+# 耗时直方图的区间上限（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 段落音频大小直方图的区间上限（字节）
+SIZE_BUCKETS = (1024, 4096, 16384, 32768, 65536, 131072, 262144, 524288, 1048576, 4194304)
+
+# 保护 PERFORMANCE_METRICS 的锁
+_performance_lock = threading.Lock()
+
+GaugeValue = Union[float, Dict[Tuple[str, ...], float]]
+
+
+def _escape(value: str) -> str:
+    """转义标签值中的反斜杠、引号和换行"""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    """格式化标签，如 {path="/stats",status="200"}"""
+    parts = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    """整数值不带小数点输出"""
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """只增不减的计数器，可按标签区分"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        """增加计数"""
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> Dict[Tuple[str, ...], float]:
+        """{标签值元组: 计数} 的副本"""
+        with self._lock:
+            return dict(self._values)
+
+    def collect(self) -> List[str]:
+        """文本格式的输出行"""
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """按固定区间统计分布的直方图，可按标签区分"""
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float],
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        # 每组标签: [各区间计数..., 超出最大区间的计数, 总和]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: Any) -> None:
+        """记录一个样本"""
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    def totals(self) -> Tuple[int, float]:
+        """所有标签合计的 (样本数, 总和)"""
+        with self._lock:
+            count = sum(sum(counts[:-1]) for counts in self._values.values())
+            total = sum(counts[-1] for counts in self._values.values())
+        return int(count), total
+
+    def mean(self) -> float:
+        """所有标签合计的平均值，没有样本时为0"""
+        count, total = self.totals()
+        return total / count if count else 0
+
+    def collect(self) -> List[str]:
+        """文本格式的输出行（区间计数为累计值）"""
+        with self._lock:
+            values = sorted((key, list(counts)) for key, counts in self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, counts in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += counts[len(self.buckets)]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(counts[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    仪表：抓取时调用回调获取当前值
+
+    回调返回数值，或 {标签值元组: 数值} 的字典（按 labelnames 的顺序）。
+    """
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], GaugeValue],
+                 labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        self.labelnames = tuple(labelnames)
+
+    def collect(self) -> List[str]:
+        """文本格式的输出行"""
+        value = self.func()
+        values = value if isinstance(value, dict) else {(): value}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        for key, item in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(item)}")
+        return lines
+
+
+class MetricsRegistry:
+    """已注册指标的集合"""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """注册指标并返回该指标"""
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float],
+                  labelnames: Sequence[str] = ()) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets, labelnames))
+
+    def gauge(self, name: str, documentation: str, func: Callable[[], GaugeValue],
+              labelnames: Sequence[str] = ()) -> Gauge:
+        return self.register(Gauge(name, documentation, func, labelnames))
+
+    def render(self) -> str:
+        """Prometheus 文本格式（0.0.4）"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.collect())
+            except Exception as e:
+                # 单个仪表回调失败不影响其他指标
+                lines.append(f"# {metric.name} 采集失败: {str(e)}")
+        lines.extend(_collect_performance())
+        return "\n".join(lines) + "\n"
+
+
+def increment(name: str, amount: float = 1) -> None:
+    """线程安全地增加 PERFORMANCE_METRICS 中的计数"""
+    with _performance_lock:
+        config.PERFORMANCE_METRICS[name] += amount
+
+
+def performance_snapshot() -> Dict[str, Any]:
+    """
+    PERFORMANCE_METRICS 的副本
+
+    avg_response_time 为所有请求的平均总耗时（秒），
+    avg_segment_size 为每个段落的平均音频大小（字节），均由直方图计算。
+    """
+    with _performance_lock:
+        snapshot = dict(config.PERFORMANCE_METRICS)
+    snapshot["avg_response_time"] = round(request_duration.mean(), 4)
+    snapshot["avg_segment_size"] = round(segment_size.mean(), 1)
+    return snapshot
+
+
+def _collect_performance() -> List[str]:
+    """把 PERFORMANCE_METRICS 中的计数导出为计数器（平均值由直方图提供，不重复导出）"""
+    lines = []
+    for key, value in sorted(performance_snapshot().items()):
+        if key.startswith("avg_"):
+            continue
+        name = f"tts_{key[len('total_'):] if key.startswith('total_') else key}_total"
+        lines += [f"# HELP {name} PERFORMANCE_METRICS[\"{key}\"]", f"# TYPE {name} counter",
+                  f"{name} {_format_value(value)}"]
+    return lines
+
+
+def executor_queue_depth(executor: concurrent.futures.ThreadPoolExecutor) -> int:
+    """线程池中等待执行的任务数（ThreadPoolExecutor 没有公开接口，读取内部队列）"""
+    return executor._work_queue.qsize()
+
+
+# 创建全局指标注册表和各指标
+registry = MetricsRegistry()
+
+http_requests = registry.counter(
+    "tts_http_requests_total", "按路径、状态码、声音和流式模式统计的HTTP请求数",
+    ("path", "status", "voice", "stream")
+)
+request_duration = registry.histogram(
+    "tts_http_request_duration_seconds", "请求总耗时（到响应体发送完毕）",
+    LATENCY_BUCKETS, ("path", "stream")
+)
+request_ttfb = registry.histogram(
+    "tts_http_ttfb_seconds", "请求的首字节时间（到响应体第一个非空块）",
+    LATENCY_BUCKETS, ("path", "stream")
+)
+upstream_duration = registry.histogram(
+    "tts_upstream_request_duration_seconds", "单次上游段落请求耗时（到响应体读取完毕）",
+    LATENCY_BUCKETS, ("outcome",)
+)
+segment_size = registry.histogram(
+    "tts_segment_size_bytes", "每个段落的音频大小（字节）", SIZE_BUCKETS
+)
+stage_duration = registry.histogram(
+    "tts_stage_duration_seconds", "合成请求各阶段的耗时（段落阶段为所有段落的累计值）",
+    LATENCY_BUCKETS, ("stage",)
+)
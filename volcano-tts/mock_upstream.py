@@ -0,0 +1,252 @@
+"""
+本地模拟上游
+
+提供与火山引擎相同的 /web/tts/v1/ 接口（JSON请求，响应中的audio字段为Base64音频），
+用于在没有真实上游的环境中压测缓存、并发和容错相关的改动。
+
+可以模拟：
+    - 随文本长度增长的延迟（对数正态分布抖动，以及按比例出现的长尾延迟）
+    - 按比例返回 500 错误、429 限流，或超过并发上限时返回 429
+    - 按比例返回没有音频的响应
+    - 慢速滴流响应（响应体分小块缓慢发送）
+
+用法:
+    python mock_upstream.py --port 5060
+    python mock_upstream.py --port 5060 --error-rate 0.05 --throttle-rate 0.02 --drip-rate 0.1
+    UPSTREAM_URL=http://127.0.0.1:5060/web/tts/v1/ python app.py
+
+GET /mock/stats 返回模拟上游收到的请求统计。
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import random
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# 128kbps、44.1kHz 的静音MP3帧（帧长417字节）
+MP3_FRAME = b'\xFF\xFB\x90\x44' + b'\x00' * 413
+
+
+class MockProfile:
+    """模拟上游的行为参数"""
+
+    def __init__(self, latency_base: float = 0.15, latency_per_char: float = 0.004,
+                 latency_sigma: float = 0.3, tail_rate: float = 0.0, tail_latency: float = 2.0,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, max_concurrency: int = 0,
+                 empty_rate: float = 0.0, drip_rate: float = 0.0, drip_chunk: int = 512,
+                 drip_interval: float = 0.05, audio_bytes_per_char: int = 800,
+                 legacy_format: bool = False):
+        self.latency_base = latency_base
+        self.latency_per_char = latency_per_char
+        self.latency_sigma = latency_sigma
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.max_concurrency = max_concurrency
+        self.empty_rate = empty_rate
+        self.drip_rate = drip_rate
+        self.drip_chunk = drip_chunk
+        self.drip_interval = drip_interval
+        self.audio_bytes_per_char = audio_bytes_per_char
+        self.legacy_format = legacy_format
+
+    def latency(self, text: str, rng: random.Random) -> float:
+        """首字节延迟：基础延迟加上与文本长度成正比的部分，乘以对数正态抖动"""
+        latency = self.latency_base + self.latency_per_char * len(text)
+        if self.latency_sigma > 0:
+            latency *= rng.lognormvariate(0, self.latency_sigma)
+        if self.tail_rate > 0 and rng.random() < self.tail_rate:
+            latency += self.tail_latency
+        return latency
+
+    def to_dict(self) -> Dict[str, Any]:
+        """参数概览"""
+        return dict(vars(self))
+
+
+class MockUpstream:
+    """模拟上游服务"""
+
+    def __init__(self, profile: MockProfile, seed: Optional[int] = None):
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.in_flight = 0
+        self.stats = {
+            "requests": 0,
+            "succeeded": 0,
+            "errors": 0,
+            "throttled": 0,
+            "empty": 0,
+            "dripped": 0,
+            "bad_requests": 0,
+            "chars": 0,
+            "max_in_flight": 0
+        }
+        self.app = self._create_app()
+
+    def _create_app(self) -> FastAPI:
+        app = FastAPI(title="Mock Volcano TTS")
+
+        @app.api_route("/", methods=["GET", "HEAD"])
+        async def root():
+            # 服务启动时的连接池预热会请求根路径
+            return Response(status_code=200)
+
+        @app.post("/web/tts/v1/")
+        @app.post("/web/tts/v1")
+        async def synthesize(request: Request):
+            return await self.handle(request)
+
+        @app.get("/mock/stats")
+        async def mock_stats():
+            return self.snapshot()
+
+        return app
+
+    async def handle(self, request: Request) -> Response:
+        """处理一次合成请求（所有状态都在事件循环中修改，不需要加锁）"""
+        profile = self.profile
+        self.stats["requests"] += 1
+        try:
+            payload = json.loads(await request.body())
+            text = payload["text"]
+        except (ValueError, KeyError, TypeError):
+            self.stats["bad_requests"] += 1
+            return JSONResponse(status_code=400, content=_base_resp(400, "invalid request"))
+        self.stats["chars"] += len(text)
+
+        if profile.max_concurrency > 0 and self.in_flight >= profile.max_concurrency:
+            self.stats["throttled"] += 1
+            return JSONResponse(status_code=429, content=_base_resp(429, "too many requests"))
+        roll = self.rng.random()
+        if roll < profile.throttle_rate:
+            self.stats["throttled"] += 1
+            return JSONResponse(status_code=429, content=_base_resp(429, "too many requests"))
+        roll -= profile.throttle_rate
+
+        self.in_flight += 1
+        self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.in_flight)
+        streaming = False
+        try:
+            latency = profile.latency(text, self.rng)
+            if roll < profile.error_rate:
+                # 错误通常比正常响应更快返回
+                await asyncio.sleep(latency / 2)
+                self.stats["errors"] += 1
+                return JSONResponse(status_code=500, content=_base_resp(500, "internal error"))
+            roll -= profile.error_rate
+
+            await asyncio.sleep(latency)
+            if roll < profile.empty_rate:
+                self.stats["empty"] += 1
+                return JSONResponse(content=_base_resp(4001, "synthesis failed"))
+            roll -= profile.empty_rate
+
+            body = self._build_body(text)
+            self.stats["succeeded"] += 1
+            if roll < profile.drip_rate:
+                self.stats["dripped"] += 1
+                streaming = True
+                return StreamingResponse(self._drip(body), media_type="application/json")
+            return Response(content=body, media_type="application/json")
+        finally:
+            if not streaming:
+                self.in_flight -= 1
+
+    async def _drip(self, body: bytes) -> AsyncIterator[bytes]:
+        """分小块缓慢发送响应体，发送结束后才释放并发名额"""
+        try:
+            for i in range(0, len(body), self.profile.drip_chunk):
+                yield body[i:i + self.profile.drip_chunk]
+                await asyncio.sleep(self.profile.drip_interval)
+        finally:
+            self.in_flight -= 1
+
+    def _build_body(self, text: str) -> bytes:
+        """生成与文本长度成正比的静音MP3，编码为上游的JSON响应"""
+        frames = max(1, len(text) * self.profile.audio_bytes_per_char // len(MP3_FRAME))
+        audio = base64.b64encode(MP3_FRAME * frames).decode('ascii')
+        result: Dict[str, Any] = _base_resp(0, "success")
+        result["audio"] = {"data": audio} if self.profile.legacy_format else audio
+        return json.dumps(result).encode('utf-8')
+
+    def snapshot(self) -> Dict[str, Any]:
+        """请求统计和当前参数"""
+        stats = dict(self.stats)
+        stats["in_flight"] = self.in_flight
+        stats["profile"] = self.profile.to_dict()
+        return stats
+
+
+def _base_resp(status_code: int, message: str) -> Dict[str, Any]:
+    """上游响应中的状态字段"""
+    return {"base_resp": {"status_code": status_code, "status_message": message}}
+
+
+def start_in_thread(mock: MockUpstream, host: str = "127.0.0.1", port: int = 5060,
+                    timeout: float = 10.0) -> uvicorn.Server:
+    """在后台线程中启动模拟上游（用于压测脚本），返回已启动的服务器，设置 should_exit 即可停止"""
+    server = uvicorn.Server(uvicorn.Config(mock.app, host=host, port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name='mock-upstream', daemon=True)
+    thread.start()
+    deadline = time.time() + timeout
+    while not server.started:
+        if not thread.is_alive() or time.time() > deadline:
+            raise RuntimeError(f"模拟上游启动失败: {host}:{port}")
+        time.sleep(0.05)
+    return server
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="本地模拟火山引擎TTS上游")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=5060, help="监听端口（默认5060）")
+    parser.add_argument("--latency-base", type=float, default=0.15, help="基础延迟（秒）")
+    parser.add_argument("--latency-per-char", type=float, default=0.004, help="每个字符增加的延迟（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="对数正态抖动的sigma，0表示固定延迟")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="出现长尾延迟的比例")
+    parser.add_argument("--tail-latency", type=float, default=2.0, help="长尾延迟额外增加的时间（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回500错误的比例")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回429的比例")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="并发请求上限，超出时返回429，0表示不限制")
+    parser.add_argument("--empty-rate", type=float, default=0.0, help="返回没有音频的响应的比例")
+    parser.add_argument("--drip-rate", type=float, default=0.0, help="慢速滴流响应的比例")
+    parser.add_argument("--drip-chunk", type=int, default=512, help="滴流响应每块的字节数")
+    parser.add_argument("--drip-interval", type=float, default=0.05, help="滴流响应每块之间的间隔（秒）")
+    parser.add_argument("--audio-bytes-per-char", type=int, default=800, help="每个字符生成的音频字节数")
+    parser.add_argument("--legacy-format", action="store_true", help='使用旧版响应格式 {"audio": {"data": ...}}')
+    parser.add_argument("--seed", type=int, help="随机数种子，便于重复测试")
+    args = parser.parse_args(argv)
+
+    profile = MockProfile(
+        latency_base=args.latency_base,
+        latency_per_char=args.latency_per_char,
+        latency_sigma=args.latency_sigma,
+        tail_rate=args.tail_rate,
+        tail_latency=args.tail_latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        max_concurrency=args.max_concurrency,
+        empty_rate=args.empty_rate,
+        drip_rate=args.drip_rate,
+        drip_chunk=args.drip_chunk,
+        drip_interval=args.drip_interval,
+        audio_bytes_per_char=args.audio_bytes_per_char,
+        legacy_format=args.legacy_format
+    )
+    mock = MockUpstream(profile, seed=args.seed)
+    print(f"模拟上游: http://{args.host}:{args.port}/web/tts/v1/")
+    uvicorn.run(mock.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,243 @@
+"""
+缓存预热模块
+
+从历史流量中挖掘高频的 (段落, 话者) 组合，服务启动后在后台按限定速率填充缓存，
+使新部署的实例在接收真实流量时缓存已经是热的。
+
+数据来源（按请求ID去重）:
+    1. PREWARM_FILE 指定的文件：JSONL（text/input、voice、可选 count）或每行一个短语
+    2. 调试模式保存的请求文本（DEBUG_DIR/text/*.json）
+    3. 主日志中记录的原始请求体（LOG_FILE_PATH 及其轮转文件，被截断的记录会跳过）
+请求日志（volcano-tts-request.log）只记录路径和耗时，不包含文本，因此不作为来源。
+"""
+
+import glob
+import json
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import config
+from audio_cache import audio_cache
+from text_filter import text_filter
+from text_pipeline import clean_text, resolve_voice, split_text
+from synthesis import get_segment_audio_cached
+
+# 获取日志记录器（与应用共用，确保写入日志文件）
+logger = logging.getLogger('volcano_tts')
+
+# 没有任何历史流量时使用的默认短语
+DEFAULT_PHRASES = ["你好", "谢谢", "欢迎使用"]
+
+# 主日志中原始请求体的记录格式
+_RAW_BODY_PATTERN = re.compile(r'原始请求体 \[(\w+)\]: (.*?)(?:\.\.\.)?$')
+
+
+def iter_prewarm_file(path: str) -> Iterator[Tuple[str, str, Optional[str], int]]:
+    """读取预热文件，产出 (来源ID, 文本, 声音, 次数)"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"预热文件第 {line_no} 行不是有效的JSON，已跳过")
+                    continue
+                text = record.get("text") or record.get("input") or ""
+                yield f"file:{line_no}", text, record.get("voice"), int(record.get("count", 1))
+            else:
+                yield f"file:{line_no}", line, None, 1
+
+
+def iter_debug_captures(debug_dir: str) -> Iterator[Tuple[str, str, Optional[str], int]]:
+    """读取调试模式保存的请求文本，产出 (请求ID, 文本, 声音, 次数)"""
+    for filepath in glob.glob(os.path.join(debug_dir, 'text', '*.json')):
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        request = data.get("parsed_request") or data.get("original_request") or {}
+        if not isinstance(request, dict) or "input" not in request:
+            # 过滤结果记录（只有 original 字段，没有声音），与原始请求重复
+            continue
+        yield data.get("request_id") or filepath, request.get("input") or "", request.get("voice"), 1
+
+
+def iter_log_requests(log_path: str) -> Iterator[Tuple[str, str, Optional[str], int]]:
+    """读取主日志及其轮转文件中的原始请求体，产出 (请求ID, 文本, 声音, 次数)"""
+    paths = [log_path] + [f"{log_path}.{i}" for i in range(1, 11)]
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, 'r', encoding='utf-8', errors='replace') as f:
+                for line in f:
+                    if '原始请求体' not in line:
+                        continue
+                    match = _RAW_BODY_PATTERN.search(line.rstrip('\n'))
+                    if not match:
+                        continue
+                    try:
+                        body = json.loads(match.group(2))
+                    except ValueError:
+                        # 请求体超过200字符时日志中被截断，无法使用
+                        continue
+                    if isinstance(body, dict) and body.get("input"):
+                        yield match.group(1), body["input"], body.get("voice"), 1
+        except OSError as e:
+            logger.warning(f"读取日志文件失败 {path}: {str(e)}")
+
+
+def build_hot_set(max_entries: int, prewarm_file: str = '', debug_dir: str = '',
+                  log_path: str = '') -> Tuple[List[Tuple[str, str, str]], Dict[str, int]]:
+    """
+    构建按频率排序的预热列表
+
+    返回:
+        ([(段落, 话者, 语言), ...], 各来源的记录数)
+    """
+    sources = []
+    if prewarm_file:
+        if os.path.exists(prewarm_file):
+            sources.append(("file", iter_prewarm_file(prewarm_file)))
+        else:
+            logger.warning(f"预热文件不存在: {prewarm_file}")
+    if debug_dir and os.path.isdir(debug_dir):
+        sources.append(("debug", iter_debug_captures(debug_dir)))
+    if log_path:
+        sources.append(("log", iter_log_requests(log_path)))
+
+    counter: Counter = Counter()
+    seen_requests = set()
+    source_counts = {}
+    voices = {}
+    for name, records in sources:
+        source_counts[name] = 0
+        for record_id, text, voice, count in records:
+            # 同一请求可能同时出现在调试文件和日志中
+            if name != "file":
+                if record_id in seen_requests:
+                    continue
+                seen_requests.add(record_id)
+            source_counts[name] += 1
+            voice = voice or config.DEFAULT_SPEAKERS["zh_cn"]
+            if voice not in voices:
+                voices[voice] = resolve_voice(voice)
+            speaker, lang = voices[voice]
+            filtered_text, _ = text_filter.filter_text(text)
+            cleaned_text = clean_text(filtered_text)
+            if not cleaned_text:
+                continue
+            for segment in split_text(cleaned_text):
+                if segment and not segment.isspace():
+                    counter[(segment, speaker, lang)] += max(1, count)
+
+    if not counter:
+        speaker = config.DEFAULT_SPEAKERS["zh_cn"]
+        return [(phrase, speaker, "zh") for phrase in DEFAULT_PHRASES], source_counts
+    return [key for key, _ in counter.most_common(max_entries)], source_counts
+
+
+class Prewarmer:
+    """后台缓存预热：构建热点列表后按 PREWARM_RATE 逐个合成未缓存的段落"""
+
+    def __init__(self, rate: float, max_entries: int):
+        self.rate = rate
+        self.max_entries = max_entries
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.state: Dict[str, Any] = {
+            "status": "idle",
+            "total": 0,
+            "done": 0,
+            "already_cached": 0,
+            "synthesized": 0,
+            "failed": 0,
+            "sources": {},
+            "started_at": None,
+            "finished_at": None
+        }
+
+    def start(self) -> None:
+        """启动后台预热线程（立即返回）"""
+        if not config.PREWARM_ENABLED:
+            self._update(status="disabled")
+            return
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="cache-prewarm", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """停止预热"""
+        self._stop.set()
+
+    def _run(self) -> None:
+        """预热线程主体"""
+        self._update(status="building", started_at=time.time())
+        try:
+            hot_set, sources = build_hot_set(
+                self.max_entries,
+                prewarm_file=config.PREWARM_FILE,
+                debug_dir=config.DEBUG_DIR,
+                log_path=config.LOG_FILE_PATH
+            )
+        except Exception as e:
+            logger.error(f"构建预热列表失败: {str(e)}", exc_info=True)
+            self._update(status="failed", finished_at=time.time())
+            return
+
+        self._update(status="running", total=len(hot_set), sources=sources)
+        logger.info(f"开始缓存预热: {len(hot_set)} 个段落, 来源: {sources}")
+        interval = 1.0 / self.rate if self.rate > 0 else 0.0
+        for text, speaker, lang in hot_set:
+            if self._stop.is_set():
+                self._update(status="stopped", finished_at=time.time())
+                return
+            if audio_cache.contains((text, speaker, lang)):
+                self._increment("already_cached")
+                continue
+            started = time.time()
+            try:
+                # 后台预取不计入缓存查找统计
+                audio_data = get_segment_audio_cached(text, speaker, lang, record=False)
+                self._increment("synthesized" if audio_data else "failed")
+            except Exception as e:
+                logger.warning(f"预热段落失败: {str(e)}")
+                self._increment("failed")
+            # 限制预热速率，避免与真实流量争抢上游
+            self._stop.wait(max(0.0, interval - (time.time() - started)))
+
+        self._update(status="completed", finished_at=time.time())
+        logger.info(f"缓存预热完成: {self.snapshot()}")
+
+    def _update(self, **fields) -> None:
+        """更新状态"""
+        with self._lock:
+            self.state.update(fields)
+
+    def _increment(self, field: str) -> None:
+        """累加计数和已处理数"""
+        with self._lock:
+            self.state[field] += 1
+            self.state["done"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取预热进度"""
+        with self._lock:
+            state = dict(self.state)
+        state["progress"] = round(state["done"] / state["total"], 4) if state["total"] else 0
+        return state
+
+
+# 创建全局预热实例
+prewarmer = Prewarmer(config.PREWARM_RATE, config.PREWARM_MAX_ENTRIES)
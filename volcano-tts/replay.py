@@ -0,0 +1,312 @@
+"""
+流量回放工具
+
+读取调试模式保存的请求记录（DEBUG/text/*.json），按原始到达时间（可按倍数加速）
+重新发送到运行中的服务，统计吞吐量、延迟分位数、首字节时间（TTFB）、缓存命中率和上游请求数，
+作为接近生产流量的回归基准，用于比较性能改动前后的结果。
+
+服务应连接到本地模拟上游，避免回放流量打到真实的火山引擎接口；
+缓存命中率和上游请求数通过回放前后两次读取 /stats 计算。
+
+用法:
+    python replay.py DEBUG --url http://localhost:5050
+    python replay.py DEBUG --speed 10 --concurrency 32 --output report.json
+    python replay.py DEBUG --speed 0 --baseline report.json --tolerance 0.1
+
+参数 --speed 0 表示不按到达时间等待，在并发上限内尽快发送。
+指定 --baseline 时与之前保存的报告比较，吞吐量下降或p95延迟上升超过容差时以状态码1退出。
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import glob
+import json
+import os
+import sys
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import requests
+
+# 读取响应的块大小
+READ_CHUNK_SIZE = 4096
+
+
+def load_captures(path: str) -> List[Dict[str, Any]]:
+    """
+    读取调试记录，按请求时间排序
+
+    兼容旧版本分开保存的 _raw.json 和请求文本文件，同一请求只回放一次；
+    单文件大小超限被截断的记录无法还原请求体，已跳过。
+    """
+    text_dir = os.path.join(path, 'text') if os.path.isdir(os.path.join(path, 'text')) else path
+    captures: Dict[str, Dict[str, Any]] = {}
+    skipped = 0
+    for filepath in sorted(glob.glob(os.path.join(text_dir, '*.json'))):
+        try:
+            with open(filepath, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            skipped += 1
+            continue
+        if not isinstance(record, dict) or record.get("truncated"):
+            skipped += 1
+            continue
+        body = _request_body(record)
+        if body is None:
+            continue
+        filename = os.path.basename(filepath)
+        request_id = record.get("request_id") or filename
+        if request_id in captures and not filename.endswith("_raw.json"):
+            continue
+        captures[request_id] = {
+            "request_id": request_id,
+            "time": _record_time(record, filename),
+            "body": body,
+            "stream": bool(json.loads(body).get("stream")) if body.startswith('{') else False
+        }
+    if skipped:
+        print(f"警告: 跳过了 {skipped} 个无法读取或已截断的记录", file=sys.stderr)
+    return sorted(captures.values(), key=lambda c: c["time"])
+
+
+def _request_body(record: Dict[str, Any]) -> Optional[str]:
+    """记录中的原始请求体，没有时用解析后的请求重新生成"""
+    raw = record.get("raw_request_body")
+    if isinstance(raw, str):
+        try:
+            if isinstance(json.loads(raw), dict):
+                return raw
+        except ValueError:
+            pass
+    request = record.get("parsed_request") or record.get("original_request")
+    if isinstance(request, dict) and request.get("input"):
+        return json.dumps(request, ensure_ascii=False)
+    return None
+
+
+def _record_time(record: Dict[str, Any], filename: str) -> float:
+    """请求时间：优先使用记录中的时间戳，否则使用文件名中的时间戳"""
+    try:
+        return datetime.datetime.fromisoformat(record["timestamp"]).timestamp()
+    except (KeyError, TypeError, ValueError):
+        pass
+    try:
+        return float(filename.split('_')[0])
+    except ValueError:
+        return 0.0
+
+
+def send_request(session: requests.Session, url: str, api_key: str, body: str,
+                 timeout: float) -> Dict[str, Any]:
+    """发送一个请求并读取完整响应，记录状态、耗时和首字节时间"""
+    start = time.time()
+    result = {"status": None, "latency": None, "ttfb": None, "bytes": 0, "error": None}
+    try:
+        response = session.post(
+            url,
+            data=body.encode('utf-8'),
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+            timeout=timeout,
+            stream=True
+        )
+        result["status"] = response.status_code
+        for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+            if result["ttfb"] is None:
+                result["ttfb"] = time.time() - start
+            result["bytes"] += len(chunk)
+        response.close()
+        if response.status_code >= 400:
+            result["error"] = f"HTTP {response.status_code}"
+    except requests.RequestException as e:
+        result["error"] = type(e).__name__
+    result["latency"] = time.time() - start
+    return result
+
+
+def fetch_stats(session: requests.Session, base_url: str, api_key: str) -> Optional[Dict[str, Any]]:
+    """读取服务的 /stats，失败时返回None"""
+    try:
+        response = session.get(f"{base_url}/stats", headers={"Authorization": f"Bearer {api_key}"}, timeout=10)
+        response.raise_for_status()
+        return response.json()
+    except (requests.RequestException, ValueError) as e:
+        print(f"警告: 读取 /stats 失败: {str(e)}", file=sys.stderr)
+        return None
+
+
+def replay(captures: List[Dict[str, Any]], base_url: str, api_key: str, speed: float,
+           concurrency: int, timeout: float) -> List[Dict[str, Any]]:
+    """
+    按原始到达时间回放请求
+
+    参数:
+        speed: 时间加速倍数，2表示用一半的时间回放；0表示不等待
+        concurrency: 同时进行的最大请求数，超出时请求排队，排队时间计入 lag
+    """
+    url = f"{base_url}/v1/audio/speech"
+    local = threading.local()
+    results: List[Dict[str, Any]] = []
+
+    def run(capture: Dict[str, Any], scheduled: float) -> Dict[str, Any]:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        lag = max(0.0, time.time() - scheduled)
+        result = send_request(session, url, api_key, capture["body"], timeout)
+        result.update({"request_id": capture["request_id"], "stream": capture["stream"], "lag": lag})
+        return result
+
+    first = captures[0]["time"] if captures else 0
+    start = time.time()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = []
+        for capture in captures:
+            scheduled = start + ((capture["time"] - first) / speed if speed > 0 else 0)
+            delay = scheduled - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(run, capture, scheduled))
+        for future in futures:
+            results.append(future.result())
+    return results
+
+
+def percentile(values: List[float], p: float) -> float:
+    """计算分位数"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))], 4)
+
+
+def summarize(results: List[Dict[str, Any]], duration: float, before: Optional[Dict[str, Any]],
+              after: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总回放结果"""
+    ok = [r for r in results if r["error"] is None]
+    latencies = [r["latency"] for r in ok]
+    ttfbs = [r["ttfb"] for r in ok if r["ttfb"] is not None]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r["error"] is not None:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+
+    report = {
+        "requests": len(results),
+        "succeeded": len(ok),
+        "errors": errors,
+        "stream_requests": sum(1 for r in results if r["stream"]),
+        "duration": round(duration, 3),
+        "throughput": round(len(ok) / duration, 3) if duration > 0 else 0,
+        "audio_bytes": sum(r["bytes"] for r in ok),
+        "latency": {
+            "avg": round(sum(latencies) / len(latencies), 4) if latencies else 0,
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": round(max(latencies), 4) if latencies else 0
+        },
+        "ttfb": {
+            "p50": percentile(ttfbs, 50),
+            "p95": percentile(ttfbs, 95),
+            "p99": percentile(ttfbs, 99)
+        },
+        "schedule_lag_p95": percentile([r["lag"] for r in results], 95),
+        "cache_hit_rate": None,
+        "upstream_calls": None
+    }
+    if before is not None and after is not None:
+        hits = after["cache"]["hits"] - before["cache"]["hits"]
+        lookups = after["cache"]["lookups"] - before["cache"]["lookups"]
+        report["cache_hit_rate"] = round(hits / lookups, 4) if lookups else 0
+        report["upstream_calls"] = after["upstream"]["requests"] - before["upstream"]["requests"]
+    return report
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """与基准报告比较，返回超出容差的退化项"""
+    regressions = []
+    if baseline["throughput"] > 0 and report["throughput"] < baseline["throughput"] * (1 - tolerance):
+        regressions.append(f"吞吐量 {report['throughput']} < 基准 {baseline['throughput']}")
+    for key in ("p95", "p99"):
+        if baseline["latency"][key] > 0 and report["latency"][key] > baseline["latency"][key] * (1 + tolerance):
+            regressions.append(f"{key}延迟 {report['latency'][key]} > 基准 {baseline['latency'][key]}")
+    if report["succeeded"] < baseline["succeeded"]:
+        regressions.append(f"成功请求 {report['succeeded']} < 基准 {baseline['succeeded']}")
+    return regressions
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    """输出可读的报告"""
+    latency, ttfb = report["latency"], report["ttfb"]
+    print(f"请求: {report['requests']}（成功 {report['succeeded']}，流式 {report['stream_requests']}），"
+          f"耗时 {report['duration']}秒，吞吐量 {report['throughput']} 请求/秒")
+    if report["errors"]:
+        print(f"错误: {report['errors']}")
+    print(f"延迟: avg {latency['avg']}  p50 {latency['p50']}  p95 {latency['p95']}  "
+          f"p99 {latency['p99']}  max {latency['max']}")
+    print(f"首字节: p50 {ttfb['p50']}  p95 {ttfb['p95']}  p99 {ttfb['p99']}")
+    print(f"排队延迟p95: {report['schedule_lag_p95']}秒")
+    if report["cache_hit_rate"] is not None:
+        print(f"缓存命中率: {report['cache_hit_rate']:.2%}，上游请求: {report['upstream_calls']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    # 只在命令行运行时读取配置（默认值），被压测脚本导入时不影响服务配置的加载时机
+    import config
+
+    parser = argparse.ArgumentParser(description="回放调试模式保存的请求，统计服务性能")
+    parser.add_argument("captures", nargs="?", default=config.DEBUG_DIR,
+                        help="调试目录或其中的 text 目录（默认 DEBUG_DIR）")
+    parser.add_argument("--url", default=f"http://localhost:{config.PORT}", help="服务地址")
+    parser.add_argument("--api-key", default=config.API_KEY, help="API密钥（默认 API_KEY）")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="到达时间加速倍数，0表示不等待（默认1，按原始时间回放）")
+    parser.add_argument("--concurrency", type=int, default=16, help="最大并发请求数（默认16）")
+    parser.add_argument("--limit", type=int, default=0, help="最多回放的请求数（默认全部）")
+    parser.add_argument("--timeout", type=float, default=120, help="单个请求的超时时间（秒）")
+    parser.add_argument("--output", help="报告保存路径（JSON）")
+    parser.add_argument("--baseline", help="基准报告路径，结果退化时以状态码1退出")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="与基准比较的容差（默认0.1，即10%%）")
+    args = parser.parse_args(argv)
+
+    captures = load_captures(args.captures)
+    if args.limit > 0:
+        captures = captures[:args.limit]
+    if not captures:
+        print(f"错误: {args.captures} 中没有可回放的请求", file=sys.stderr)
+        return 1
+    span = captures[-1]["time"] - captures[0]["time"]
+    print(f"回放 {len(captures)} 个请求，原始时间跨度 {span:.1f}秒，加速 {args.speed}倍")
+
+    base_url = args.url.rstrip('/')
+    session = requests.Session()
+    before = fetch_stats(session, base_url, args.api_key)
+    start = time.time()
+    results = replay(captures, base_url, args.api_key, args.speed, max(1, args.concurrency), args.timeout)
+    duration = time.time() - start
+    after = fetch_stats(session, base_url, args.api_key)
+
+    report = summarize(results, duration, before, after)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"报告已保存到 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            for item in regressions:
+                print(f"退化: {item}", file=sys.stderr)
+            return 1
+        print("与基准相比没有超出容差的退化")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,279 @@
+"""
+合成调度模块
+
+所有需要访问上游的段落合成任务都在中央调度器中排队获取执行名额。
+短文本和流式请求属于交互优先级，优先于长文本的非流式请求；
+同一优先级内按租户权重加权公平排队，单个租户的大批量任务不会饿死其他租户。
+调度器限制排队中的段落总数，超出预算的请求在入口处直接被拒绝（429）。
+"""
+
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+import config
+from deadline import Deadline, DeadlineExceeded
+from tenants import Tenant, SYSTEM_TENANT
+
+# 获取日志记录器（与应用共用，确保写入日志文件）
+logger = logging.getLogger('volcano_tts')
+
+# 优先级（数值越小越优先）
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+PRIORITY_BACKGROUND = 2
+
+# 租户上游调用预算耗尽时，等待者重新检查的间隔（秒）
+QUOTA_POLL_INTERVAL = 0.1
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BATCH: "batch",
+    PRIORITY_BACKGROUND: "background"
+}
+
+
+class SchedulerFull(Exception):
+    """排队的段落超出预算，请求被拒绝"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """一个请求在调度器中的凭据，记录优先级、租户和尚未完成的段落数"""
+
+    def __init__(self, scheduler: 'SynthesisScheduler', priority: int, cost: int, tenant: Tenant):
+        self.scheduler = scheduler
+        self.priority = priority
+        self.remaining = cost
+        self.tenant = tenant
+        self.closed = False
+
+    def close(self) -> None:
+        """请求结束，归还未使用的排队预算（可重复调用，只归还一次）"""
+        self.scheduler._release_budget(self)
+
+
+class SynthesisScheduler:
+    """
+    按优先级分配段落合成名额的调度器
+
+    同时执行的段落数不超过 SCHEDULER_MAX_CONCURRENCY 和上游自适应并发上限中的较小值。
+    等待中的段落先按优先级出队，同一优先级内按租户的虚拟时间出队：
+    租户每获得一个名额，虚拟时间增加 1/权重，因此各租户获得的名额与权重成正比。
+    达到并发上限或上游调用预算耗尽的租户暂不参与出队。
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, capacity_hint=None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(1, max_queue)
+        self._capacity_hint = capacity_hint
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._tenant_vtime: Dict[str, float] = {}
+        self._tenant_running: Dict[str, int] = {}
+        self._throttled = False
+        self.running = 0
+        self.outstanding = 0
+        self._rejected = 0
+        self._service_times = deque(maxlen=200)
+        self._waits = {priority: deque(maxlen=500) for priority in PRIORITY_NAMES}
+        self._wait_counts = {priority: 0 for priority in PRIORITY_NAMES}
+
+    def capacity(self) -> int:
+        """当前可同时执行的段落数"""
+        capacity = self.max_concurrency
+        if self._capacity_hint is not None:
+            capacity = min(capacity, max(1, int(self._capacity_hint())))
+        return capacity
+
+    def admit(self, cost: int, priority: int, tenant: Tenant = SYSTEM_TENANT) -> Ticket:
+        """
+        准入控制：预算不足时抛出SchedulerFull
+
+        参数:
+            cost: 请求包含的段落数
+            priority: 请求优先级
+            tenant: 请求所属的租户
+        """
+        with self._cond:
+            if self.outstanding > 0 and self.outstanding + cost > self.max_queue:
+                self._rejected += 1
+                excess = self.outstanding + cost - self.max_queue
+                retry_after = self._estimate_retry_after(excess)
+                logger.warning(
+                    f"合成队列已满，拒绝请求 (段落数: {cost}, 排队段落: {self.outstanding}, "
+                    f"上限: {self.max_queue}, 建议重试间隔: {retry_after}秒)"
+                )
+                raise SchedulerFull(
+                    f"合成队列已满 (排队段落: {self.outstanding}, 上限: {self.max_queue})",
+                    retry_after
+                )
+            self.outstanding += cost
+        return Ticket(self, priority, cost, tenant)
+
+    def ticket(self, priority: int = PRIORITY_BACKGROUND, tenant: Tenant = SYSTEM_TENANT) -> Ticket:
+        """创建不经过准入控制的凭据（用于预热、后台任务等不占用请求排队预算的工作）"""
+        return Ticket(self, priority, 0, tenant)
+
+    @contextmanager
+    def slot(self, ticket: Optional[Ticket] = None, deadline: Optional[Deadline] = None):
+        """获取一个段落执行名额，退出时释放"""
+        if ticket is None:
+            ticket = self.ticket()
+        self.acquire(ticket, deadline)
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.release(ticket, time.time() - start_time)
+
+    def acquire(self, ticket: Ticket, deadline: Optional[Deadline] = None) -> None:
+        """按优先级和租户公平份额等待执行名额，超过截止时间抛出DeadlineExceeded"""
+        start_time = time.time()
+        tenant = ticket.tenant
+        entry = (ticket.priority, next(self._seq), tenant)
+        with self._cond:
+            self._activate(tenant)
+            self._waiting.append(entry)
+            try:
+                while self._select() is not entry:
+                    remaining = deadline.remaining() if deadline is not None else None
+                    if remaining == float('inf'):
+                        # 不限制截止时间（Condition.wait 不接受无穷大）
+                        remaining = None
+                    if remaining is not None and remaining <= 0:
+                        raise DeadlineExceeded("等待合成名额时超过请求截止时间")
+                    if self._throttled:
+                        # 预算恢复时没有释放事件，需要定时重新检查
+                        remaining = QUOTA_POLL_INTERVAL if remaining is None else min(remaining, QUOTA_POLL_INTERVAL)
+                    self._cond.wait(remaining)
+            except BaseException:
+                self._waiting.remove(entry)
+                self._cond.notify_all()
+                raise
+            self._waiting.remove(entry)
+            self.running += 1
+            self._tenant_running[tenant.name] = self._tenant_running.get(tenant.name, 0) + 1
+            vtime = self._tenant_vtime.get(tenant.name, 0.0)
+            self._virtual_time = max(self._virtual_time, vtime)
+            self._tenant_vtime[tenant.name] = vtime + 1.0 / tenant.weight
+            waited = time.time() - start_time
+            self._waits[ticket.priority].append(waited)
+            self._wait_counts[ticket.priority] += 1
+            tenant.take_call(waited)
+            # 队首变化后唤醒其他等待者
+            self._cond.notify_all()
+
+    def _activate(self, tenant: Tenant) -> None:
+        """
+        空闲租户重新排队时，虚拟时间不低于当前的全局虚拟时间，
+        避免长时间空闲的租户积累额度后独占名额（需持有锁）
+        """
+        if self._tenant_running.get(tenant.name, 0) == 0 and \
+                not any(entry[2] is tenant for entry in self._waiting):
+            self._tenant_vtime[tenant.name] = max(self._tenant_vtime.get(tenant.name, 0.0), self._virtual_time)
+
+    def _select(self):
+        """选出下一个应获得名额的等待者，没有可用名额时返回None（需持有锁）"""
+        self._throttled = False
+        if self.running >= self.capacity():
+            return None
+        best = None
+        best_key = None
+        for entry in self._waiting:
+            priority, seq, tenant = entry
+            if tenant.max_concurrency and self._tenant_running.get(tenant.name, 0) >= tenant.max_concurrency:
+                continue
+            if tenant.call_wait_time() > 0:
+                self._throttled = True
+                continue
+            key = (priority, self._tenant_vtime.get(tenant.name, 0.0), seq)
+            if best_key is None or key < best_key:
+                best, best_key = entry, key
+        return best
+
+    def release(self, ticket: Ticket, service_time: float) -> None:
+        """释放执行名额"""
+        with self._cond:
+            self.running -= 1
+            self._tenant_running[ticket.tenant.name] -= 1
+            self._service_times.append(service_time)
+            if ticket.remaining > 0:
+                ticket.remaining -= 1
+                self.outstanding -= 1
+            self._cond.notify_all()
+
+    def _release_budget(self, ticket: Ticket) -> None:
+        """归还凭据剩余的排队预算"""
+        with self._cond:
+            if ticket.closed:
+                return
+            ticket.closed = True
+            self.outstanding -= ticket.remaining
+            ticket.remaining = 0
+            self._cond.notify_all()
+
+    def _estimate_retry_after(self, excess: int) -> int:
+        """根据最近的段落耗时估算需要等待的秒数（需持有锁）"""
+        avg_service = sum(self._service_times) / len(self._service_times) if self._service_times else 1.0
+        return max(1, math.ceil(excess * avg_service / self.capacity()))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取调度器状态"""
+        with self._cond:
+            waits = {}
+            for priority, name in PRIORITY_NAMES.items():
+                samples = sorted(self._waits[priority])
+                waits[name] = {
+                    "count": self._wait_counts[priority],
+                    "avg": round(sum(samples) / len(samples), 4) if samples else 0,
+                    "p95": round(samples[min(len(samples) - 1, int(len(samples) * 0.95))], 4) if samples else 0,
+                    "max": round(samples[-1], 4) if samples else 0
+                }
+            return {
+                "capacity": self.capacity(),
+                "running": self.running,
+                "queued": len(self._waiting),
+                "outstanding_segments": self.outstanding,
+                "max_queue": self.max_queue,
+                "rejected": self._rejected,
+                "queue_wait": waits,
+                "tenants": {
+                    name: {
+                        "running": self._tenant_running.get(name, 0),
+                        "queued": sum(1 for entry in self._waiting if entry[2].name == name)
+                    }
+                    for name in self._tenant_vtime
+                }
+            }
+
+
+def classify_priority(text_length: int, stream: bool) -> int:
+    """短文本和流式请求属于交互优先级，其余属于批量优先级"""
+    if stream or text_length <= config.SCHEDULER_INTERACTIVE_MAX_CHARS:
+        return PRIORITY_INTERACTIVE
+    return PRIORITY_BATCH
+
+
+def _upstream_capacity() -> float:
+    """上游自适应并发上限"""
+    import upstream
+    return upstream.concurrency_limiter.limit
+
+
+# 创建全局调度器实例
+synthesis_scheduler = SynthesisScheduler(
+    config.SCHEDULER_MAX_CONCURRENCY,
+    config.SCHEDULER_MAX_QUEUE,
+    capacity_hint=_upstream_capacity
+)
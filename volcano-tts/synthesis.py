@@ -0,0 +1,271 @@
+"""
+段落合成模块
+
+获取单个文本段落的音频：先查缓存，未命中时在合成调度器中排队，
+通过上游客户端获取并规范化MP3数据。相同段落的并发请求只访问一次上游。
+供HTTP接口、后台任务和命令行工具共用。
+"""
+
+import json
+import time
+import logging
+import threading
+from typing import Dict, Generator, Optional, Tuple
+
+from audio_cache import audio_cache
+from cache_telemetry import cache_telemetry, RESULT_HIT, RESULT_STALE, RESULT_COALESCED, RESULT_MISS
+from deadline import Deadline, DeadlineExceeded
+import metrics
+from scheduler import synthesis_scheduler, Ticket
+import upstream
+
+# 获取日志记录器（与应用共用，确保写入日志文件）
+logger = logging.getLogger('volcano_tts')
+
+# MP3帧头和结尾标记
+MP3_HEADER = b'\xFF\xFB\x90\x44\x00'
+MP3_TRAILER = b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'
+
+# 静音MP3，用于所有段落都生成失败时的兜底响应
+SILENT_MP3 = MP3_HEADER + b'\x00' * 1000 + MP3_TRAILER
+
+# 流式响应的分块大小
+STREAM_CHUNK_SIZE = 32768  # 32KB chunks
+
+class _Flight:
+    """一次正在进行的上游获取，相同段落的其他请求等待它的结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.audio_data = b''
+
+    def wait(self, deadline: Optional[Deadline]) -> bytes:
+        """等待获取结束，超过截止时间返回b''"""
+        timeout = deadline.remaining() if deadline is not None else None
+        if timeout == float('inf'):
+            timeout = None
+        if not self.done.wait(None if timeout is None else max(0.0, timeout)):
+            return b''
+        return self.audio_data
+
+# 正在从上游获取的段落
+_flights: Dict[tuple, _Flight] = {}
+_flights_lock = threading.Lock()
+
+def _join_flight(key: tuple) -> Tuple[_Flight, bool]:
+    """返回 (该段落的获取记录, 是否由本请求负责获取)"""
+    with _flights_lock:
+        flight = _flights.get(key)
+        if flight is not None:
+            return flight, False
+        flight = _flights[key] = _Flight()
+        return flight, True
+
+def _finish_flight(key: tuple, flight: _Flight, audio_data: bytes) -> None:
+    """获取结束（音频已写入缓存），唤醒等待的请求"""
+    flight.audio_data = audio_data
+    with _flights_lock:
+        if _flights.get(key) is flight:
+            del _flights[key]
+    flight.done.set()
+
+def _get_cached_audio(key: tuple, deadline: Optional[Deadline] = None, record: bool = True) -> Optional[bytes]:
+    """查找缓存，上游熔断期间未命中时返回过期的缓存；命中时记录统计（record为True时），未命中返回None"""
+    lookup_start = time.time()
+    audio_data, tier = audio_cache.lookup(key)
+    result = RESULT_HIT
+    if audio_data is None and upstream.circuit_breaker.is_open():
+        audio_data, tier = audio_cache.lookup_stale(key)
+        result = RESULT_STALE
+        if audio_data is not None:
+            logger.warning("上游熔断中，返回过期缓存音频")
+    if deadline is not None:
+        deadline.add("cache", time.time() - lookup_start)
+    if audio_data is None:
+        return None
+    if record:
+        cache_telemetry.record(key, result, tier, len(audio_data))
+    metrics.segment_size.observe(len(audio_data))
+    return audio_data
+
+def _fetch_segment(key: tuple, deadline: Optional[Deadline], ticket: Optional[Ticket]) -> bytes:
+    """在调度器中排队从上游获取段落并写入缓存，超过截止时间返回b''"""
+    text, speaker, lang = key
+    try:
+        queued_at = time.time()
+        with synthesis_scheduler.slot(ticket, deadline):
+            if deadline is not None:
+                deadline.add("queue", time.time() - queued_at)
+            audio_data = get_segment_audio(text, speaker, lang, deadline)
+    except DeadlineExceeded as e:
+        logger.warning(f"放弃段落: {str(e)}")
+        return b''
+    if audio_data:
+        metrics.segment_size.observe(len(audio_data))
+    audio_cache.put(key, audio_data)
+    return audio_data
+
+# 使用LRU缓存来缓存TTS结果，提高性能
+def get_segment_audio_cached(text: str, speaker: str, lang: str, deadline: Optional[Deadline] = None,
+                             ticket: Optional[Ticket] = None, record: bool = True) -> bytes:
+    """
+    获取单个文本段落的音频数据（带缓存），未命中时在调度器中排队访问上游
+
+    相同段落正在从上游获取时等待该次获取的结果，不重复请求上游。
+    预热和离线预生成传入 record=False，不计入缓存查找统计和重用距离抽样，
+    避免后台预取影响命中率和 CACHE_MAX_SIZE 的估算。
+    """
+    key = (text, speaker, lang)
+    audio_data = _get_cached_audio(key, deadline, record)
+    if audio_data is not None:
+        return audio_data
+
+    flight, leader = _join_flight(key)
+    if leader:
+        audio_data = b''
+        try:
+            if record:
+                cache_telemetry.record(key, RESULT_MISS)
+            audio_data = _fetch_segment(key, deadline, ticket)
+        finally:
+            _finish_flight(key, flight, audio_data)
+        return audio_data
+
+    waited_at = time.time()
+    audio_data = flight.wait(deadline)
+    if deadline is not None:
+        deadline.add("coalesce", time.time() - waited_at)
+    if audio_data or (deadline is not None and deadline.expired()):
+        if record:
+            cache_telemetry.record(key, RESULT_COALESCED, size=len(audio_data))
+        if audio_data:
+            metrics.segment_size.observe(len(audio_data))
+        return audio_data
+    # 等待的获取没有得到音频（如对方的截止时间已到），自己再获取一次
+    if record:
+        cache_telemetry.record(key, RESULT_MISS)
+    return _fetch_segment(key, deadline, ticket)
+
+def iter_segment_audio_cached(text: str, speaker: str, lang: str, deadline: Optional[Deadline] = None,
+                              ticket: Optional[Ticket] = None) -> Generator[bytes, None, None]:
+    """
+    流式获取单个文本段落的音频数据（带缓存），下载完成后写入缓存
+
+    流式请求不等待其他请求的获取（以免推迟首字节），但会登记自己的获取，
+    相同段落的非流式请求可以等待它的结果。
+    """
+    key = (text, speaker, lang)
+    audio_data = _get_cached_audio(key, deadline)
+    if audio_data is not None:
+        for i in range(0, len(audio_data), STREAM_CHUNK_SIZE):
+            yield audio_data[i:i + STREAM_CHUNK_SIZE]
+        return
+
+    flight, leader = _join_flight(key)
+    cache_telemetry.record(key, RESULT_MISS)
+    audio_data = b''
+    try:
+        collected = bytearray()
+        queued_at = time.time()
+        with synthesis_scheduler.slot(ticket, deadline):
+            if deadline is not None:
+                deadline.add("queue", time.time() - queued_at)
+            for chunk in iter_segment_audio(text, speaker, lang, deadline):
+                collected.extend(chunk)
+                yield chunk
+        # 只有完整下载的音频才写入缓存并交给等待的请求
+        audio_data = bytes(collected)
+        if audio_data:
+            metrics.segment_size.observe(len(audio_data))
+        audio_cache.put(key, audio_data)
+    finally:
+        if leader:
+            _finish_flight(key, flight, audio_data)
+
+# 获取单个文本段落的音频数据
+def get_segment_audio(text: str, speaker: str, lang: str, deadline: Optional[Deadline] = None) -> bytes:
+    """获取单个文本段落的音频数据（完整获取，支持对冲请求）"""
+    # 预处理文本，确保没有特殊字符
+    text = text.strip()
+    if not text:
+        logger.warning("文本为空，返回空音频")
+        return b''
+
+    logger.debug(f"请求负载: {json.dumps({'text': text, 'speaker': speaker, 'language': lang})}")
+
+    start_time = time.time()
+    try:
+        audio_data = upstream.fetch_audio(text, speaker, lang, deadline)
+        return b''.join(_normalize_audio_stream([audio_data], start_time))
+    except DeadlineExceeded as e:
+        logger.warning(f"放弃段落: {str(e)}")
+        return b''
+    except Exception as e:
+        logger.error(f"获取音频数据失败: {str(e)}")
+        return b''
+
+def iter_segment_audio(text: str, speaker: str, lang: str,
+                       deadline: Optional[Deadline] = None) -> Generator[bytes, None, None]:
+    """
+    流式获取单个文本段落的音频数据
+
+    上游响应边下载边解码，解码出的音频字节立即产出。
+    网络或解析错误以异常形式抛出。
+    """
+    start_time = time.time()
+
+    # 预处理文本，确保没有特殊字符
+    text = text.strip()
+    if not text:
+        logger.warning("文本为空，返回空音频")
+        return
+
+    logger.debug(f"请求负载: {json.dumps({'text': text, 'speaker': speaker, 'language': lang})}")
+
+    yield from _normalize_audio_stream(upstream.stream_audio(text, speaker, lang, deadline), start_time)
+
+def _normalize_audio_stream(chunks, start_time: float) -> Generator[bytes, None, None]:
+    """
+    规范化上游音频流
+
+    保证输出以MP3帧头开始、以结尾标记结束，过小的音频替换为静音。
+    """
+    # 缓冲开头的数据，用于检查MP3头和音频大小
+    head = bytearray()
+    tail = b''
+    total_size = 0
+    for chunk in chunks:
+        if head is not None:
+            head.extend(chunk)
+            if len(head) < 100:
+                continue
+            chunk = _fix_mp3_header(bytes(head))
+            head = None
+        total_size += len(chunk)
+        tail = (tail + chunk[-len(MP3_TRAILER):])[-len(MP3_TRAILER):]
+        yield chunk
+
+    if head is not None:
+        # 整段音频不足100字节
+        if head:
+            logger.warning(f"生成的音频数据过小 ({len(head)} 字节)，可能无效")
+        else:
+            logger.warning("上游返回空音频")
+        # 生成一个简单的静音MP3
+        yield SILENT_MP3
+        total_size = len(SILENT_MP3)
+    elif tail != MP3_TRAILER:
+        # 确保音频数据以MP3结尾标记结束
+        logger.warning("添加MP3结尾标记")
+        total_size += len(MP3_TRAILER)
+        yield MP3_TRAILER
+
+    logger.info(f"成功生成音频段落, 大小: {total_size} 字节, 耗时: {time.time() - start_time:.2f}秒")
+
+def _fix_mp3_header(audio_data: bytes) -> bytes:
+    """确保音频数据是有效的MP3格式"""
+    if not audio_data.startswith(b'\xFF\xFB') and not audio_data.startswith(b'ID3'):
+        logger.warning("返回的音频数据不是有效的MP3格式，尝试修复")
+        # 添加MP3头
+        audio_data = MP3_HEADER + audio_data
+    return audio_data
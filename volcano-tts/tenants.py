@@ -0,0 +1,176 @@
+"""
+租户模块
+
+每个API密钥对应一个租户，拥有独立的调度权重、并发上限、
+每分钟字符配额和每分钟上游调用预算。
+未配置 API_KEYS 时只有 API_KEY 对应的默认租户，且不受配额限制。
+"""
+
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import config
+from upstream import TokenBucket
+
+# 获取日志记录器（与应用共用，确保写入日志文件）
+logger = logging.getLogger('volcano_tts')
+
+
+class QuotaExceeded(Exception):
+    """租户超出配额，请求被拒绝"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Tenant:
+    """
+    API密钥对应的租户
+
+    配额为0表示不限制；每分钟配额按令牌桶实现，最多累积一分钟的额度。
+    """
+
+    def __init__(self, key: str, name: str, weight: float = 1.0, max_concurrency: int = 0,
+                 chars_per_minute: int = 0, upstream_calls_per_minute: int = 0):
+        self.key = key
+        self.name = name
+        self.weight = weight if weight > 0 else 1.0
+        self.max_concurrency = max(0, max_concurrency)
+        self.chars_per_minute = max(0, chars_per_minute)
+        self.upstream_calls_per_minute = max(0, upstream_calls_per_minute)
+        self._chars = TokenBucket(chars_per_minute / 60, chars_per_minute) if chars_per_minute > 0 else None
+        self._calls = (TokenBucket(upstream_calls_per_minute / 60, upstream_calls_per_minute)
+                       if upstream_calls_per_minute > 0 else None)
+        self._lock = threading.Lock()
+        self.usage = {
+            "requests": 0,
+            "rejected_requests": 0,
+            "chars": 0,
+            "segments": 0,
+            "upstream_calls": 0,
+            "queue_wait_total": 0.0
+        }
+
+    def charge_chars(self, chars: int, segments: int) -> None:
+        """
+        按文本长度扣除字符配额，配额不足时抛出QuotaExceeded
+
+        参数:
+            chars: 请求的字符数
+            segments: 请求的段落数
+        """
+        with self._lock:
+            if self._chars is not None:
+                if chars > self._chars.burst:
+                    self.usage["rejected_requests"] += 1
+                    raise QuotaExceeded(
+                        f"文本长度 {chars} 超过每分钟字符配额 {self.chars_per_minute}", 60
+                    )
+                self._chars.refill(time.monotonic())
+                if self._chars.tokens < chars:
+                    self.usage["rejected_requests"] += 1
+                    wait = (chars - self._chars.tokens) / self._chars.rate
+                    raise QuotaExceeded(
+                        f"超出每分钟字符配额 {self.chars_per_minute}", max(1, math.ceil(wait))
+                    )
+                self._chars.tokens -= chars
+            self.usage["requests"] += 1
+            self.usage["chars"] += chars
+            self.usage["segments"] += segments
+
+    def refund_chars(self, chars: int, segments: int) -> None:
+        """请求未被受理时归还字符配额"""
+        with self._lock:
+            if self._chars is not None:
+                self._chars.tokens = min(self._chars.burst, self._chars.tokens + chars)
+            self.usage["requests"] -= 1
+            self.usage["rejected_requests"] += 1
+            self.usage["chars"] -= chars
+            self.usage["segments"] -= segments
+
+    def call_wait_time(self) -> float:
+        """获得一次上游调用预算还需等待的时间（秒），不限制时为0"""
+        if self._calls is None:
+            return 0.0
+        with self._lock:
+            self._calls.refill(time.monotonic())
+            return self._calls.wait_time()
+
+    def take_call(self, queue_wait: float) -> None:
+        """扣除一次上游调用预算并记录排队时间"""
+        with self._lock:
+            if self._calls is not None:
+                self._calls.tokens -= 1
+            self.usage["upstream_calls"] += 1
+            self.usage["queue_wait_total"] += queue_wait
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取租户配置和用量（不包含完整密钥）"""
+        with self._lock:
+            usage = dict(self.usage)
+        usage["queue_wait_total"] = round(usage["queue_wait_total"], 4)
+        usage["avg_queue_wait"] = (
+            round(usage["queue_wait_total"] / usage["upstream_calls"], 4) if usage["upstream_calls"] else 0
+        )
+        return {
+            "key": _mask_key(self.key),
+            "weight": self.weight,
+            "max_concurrency": self.max_concurrency,
+            "chars_per_minute": self.chars_per_minute,
+            "upstream_calls_per_minute": self.upstream_calls_per_minute,
+            "usage": usage
+        }
+
+
+class TenantRegistry:
+    """API密钥到租户的映射"""
+
+    def __init__(self, api_keys: Dict[str, Dict[str, Any]], default_key: str):
+        self._tenants: Dict[str, Tenant] = {}
+        if default_key not in api_keys:
+            self._tenants[default_key] = Tenant(default_key, "default")
+        for key, options in api_keys.items():
+            try:
+                self._tenants[key] = Tenant(
+                    key,
+                    str(options.get("name") or _mask_key(key)),
+                    weight=float(options.get("weight", 1)),
+                    max_concurrency=int(options.get("max_concurrency", 0)),
+                    chars_per_minute=int(options.get("chars_per_minute", 0)),
+                    upstream_calls_per_minute=int(options.get("upstream_calls_per_minute", 0))
+                )
+            except (AttributeError, TypeError, ValueError) as e:
+                logger.error(f"租户配置无效，已忽略 {_mask_key(key)}: {str(e)}")
+
+    def get(self, key: str) -> Optional[Tenant]:
+        """根据API密钥查找租户，不存在时返回None"""
+        return self._tenants.get(key)
+
+    def find(self, name: str) -> Optional[Tenant]:
+        """根据租户名称查找租户（用于恢复持久化的后台任务）"""
+        for tenant in self._tenants.values():
+            if tenant.name == name:
+                return tenant
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取所有租户的用量"""
+        return {tenant.name: tenant.snapshot() for tenant in self._tenants.values()}
+
+
+def _mask_key(key: str) -> str:
+    """隐藏密钥中间部分，用于日志和统计"""
+    if len(key) <= 8:
+        return '*' * len(key)
+    return f"{key[:4]}...{key[-4:]}"
+
+
+# 内部任务（如预热）使用的租户，不受配额限制
+SYSTEM_TENANT = Tenant('', 'system')
+
+# 创建全局租户注册表
+tenant_registry = TenantRegistry(config.API_KEYS, config.API_KEY)
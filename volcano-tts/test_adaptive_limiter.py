@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+"""
+上游自适应并发限制测试脚本
+
+验证 AdaptiveLimiter 的 AIMD 行为：成功且延迟正常时上限增加，
+过载时减半（冷却期内只减一次），达到上限时排队等待或超时，不会访问真实上游。
+"""
+
+import threading
+
+import upstream
+from upstream import AdaptiveLimiter, LatencyTracker, UpstreamOverloaded
+
+
+def with_tracker(latency: float) -> LatencyTracker:
+    """替换全局延迟跟踪器，填充足够的样本使延迟基线生效"""
+    tracker = LatencyTracker()
+    for _ in range(upstream.HEDGE_MIN_SAMPLES):
+        tracker.record(latency)
+    upstream.latency_tracker = tracker
+    return tracker
+
+
+def complete(limiter: AdaptiveLimiter, outcome: str, latency: float = 0.1, count: int = 1) -> None:
+    """依次完成count次调用"""
+    for _ in range(count):
+        limiter.acquire(1)
+        limiter.release(outcome, latency)
+
+
+def test_additive_increase():
+    """每次成功增加 1/limit，一轮（limit次）成功约增加1，不超过最大值"""
+    original = upstream.latency_tracker
+    try:
+        with_tracker(0.1)
+        limiter = AdaptiveLimiter(4, 1, 6)
+        complete(limiter, 'success', count=4)
+        assert int(limiter.limit) == 4 and limiter.limit > 4.9
+        complete(limiter, 'success', count=200)
+        assert limiter.limit == 6
+        assert limiter.in_flight == 0
+    finally:
+        upstream.latency_tracker = original
+
+
+def test_slow_success_does_not_increase():
+    """延迟超过基线的 LIMIT_LATENCY_TOLERANCE 倍时成功也不增加上限，其他错误不调整"""
+    original = upstream.latency_tracker
+    try:
+        with_tracker(0.1)
+        limiter = AdaptiveLimiter(4, 1, 64)
+        complete(limiter, 'success', latency=0.1 * upstream.LIMIT_LATENCY_TOLERANCE * 2, count=10)
+        complete(limiter, 'error', count=10)
+        assert limiter.limit == 4
+    finally:
+        upstream.latency_tracker = original
+
+
+def test_multiplicative_decrease():
+    """过载时上限减半，冷却期内的连续过载只减一次，不低于最小值"""
+    original_cooldown = upstream.LIMIT_DECREASE_COOLDOWN
+    try:
+        limiter = AdaptiveLimiter(16, 2, 64)
+        complete(limiter, 'overload', count=5)
+        assert limiter.limit == 8
+        assert limiter.snapshot()["overloads"] == 5
+
+        upstream.LIMIT_DECREASE_COOLDOWN = 0
+        complete(limiter, 'overload', count=5)
+        assert limiter.limit == 2
+    finally:
+        upstream.LIMIT_DECREASE_COOLDOWN = original_cooldown
+
+
+def test_acquire_waits_for_release():
+    """达到上限时等待名额，释放后被唤醒；超时抛出UpstreamOverloaded"""
+    limiter = AdaptiveLimiter(1, 1, 1)
+    limiter.acquire(1)
+    try:
+        limiter.acquire(0.05)
+        raise AssertionError("达到上限时应超时")
+    except UpstreamOverloaded:
+        pass
+
+    acquired = threading.Event()
+
+    def waiter():
+        limiter.acquire(2)
+        acquired.set()
+
+    thread = threading.Thread(target=waiter)
+    thread.start()
+    assert not acquired.wait(0.05)
+    limiter.release('error', 0.1)
+    thread.join(2)
+    assert acquired.is_set()
+    assert limiter.in_flight == 1 and limiter.waiting == 0
+
+
+def main():
+    """运行所有测试"""
+    tests = [test_additive_increase, test_slow_success_does_not_increase, test_multiplicative_decrease,
+             test_acquire_waits_for_release]
+    for test in tests:
+        test()
+        print(f"通过: {test.__name__}")
+    print(f"全部 {len(tests)} 项测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+"""
+上游音频流解码测试脚本
+
+验证 AudioStreamDecoder 在任意位置切分响应（包括切在Base64字符、转义字符和JSON结构中间）时
+解码结果与一次性解析完全相同，不会访问真实上游。
+"""
+
+import base64
+import json
+import random
+
+from upstream import AudioStreamDecoder, UpstreamError
+
+
+_rng = random.Random(1)
+AUDIO = bytes(_rng.randrange(256) for _ in range(3000))
+
+
+def decode_chunks(chunks) -> bytes:
+    """按给定的分块依次输入解码器，返回解码出的全部音频"""
+    decoder = AudioStreamDecoder()
+    decoded = bytearray()
+    for chunk in chunks:
+        decoded.extend(decoder.feed(chunk))
+    decoder.close()
+    return bytes(decoded)
+
+
+def split_at(body: bytes, *positions):
+    """在给定位置切分响应"""
+    bounds = [0, *positions, len(body)]
+    return [body[start:end] for start, end in zip(bounds, bounds[1:])]
+
+
+def test_every_split_point():
+    """在每一个位置切成两块，以及逐字节输入，解码结果都与原始音频相同"""
+    body = json.dumps({"code": 0, "message": "ok", "audio": base64.b64encode(AUDIO[:300]).decode()}).encode()
+    for position in range(1, len(body)):
+        assert decode_chunks(split_at(body, position)) == AUDIO[:300], position
+    assert decode_chunks([body[i:i + 1] for i in range(len(body))]) == AUDIO[:300]
+
+
+def test_escaped_slash_across_chunks():
+    """JSON转义的斜杠（\\/）切在反斜杠之后时仍正确还原"""
+    encoded = base64.b64encode(AUDIO).decode()
+    assert '/' in encoded
+    body = ('{"audio": "' + encoded.replace('/', '\\/') + '"}').encode()
+    slash = body.index(b'\\/')
+    assert decode_chunks(split_at(body, slash + 1)) == AUDIO
+    rng = random.Random(2)
+    for _ in range(50):
+        positions = sorted(rng.sample(range(1, len(body)), 8))
+        assert decode_chunks(split_at(body, *positions)) == AUDIO
+
+
+def test_legacy_nested_format():
+    """旧版格式 {"audio": {"data": ...}}，其他字段中的 "audio" 字符串和同名嵌套键不被误认"""
+    body = json.dumps({
+        "note": "audio",
+        "meta": {"audio": "不是音频"},
+        "audio": {"format": "mp3", "data": base64.b64encode(AUDIO).decode()}
+    }).encode()
+    colon = body.index(b'"data"') + len(b'"data"')
+    assert decode_chunks(split_at(body, colon, colon + 2)) == AUDIO
+    assert decode_chunks([body[i:i + 7] for i in range(0, len(body), 7)]) == AUDIO
+
+
+def test_missing_or_truncated_audio():
+    """没有audio字段或响应提前结束时抛出UpstreamError"""
+    for chunks in ([b'{"code": 3001, "message": "invalid speaker"}'],
+                   [b'{"audio": "', base64.b64encode(AUDIO[:30])]):
+        try:
+            decode_chunks(chunks)
+            raise AssertionError(f"应抛出UpstreamError: {chunks}")
+        except UpstreamError:
+            pass
+
+
+def main():
+    """运行所有测试"""
+    tests = [test_every_split_point, test_escaped_slash_across_chunks, test_legacy_nested_format,
+             test_missing_or_truncated_audio]
+    for test in tests:
+        test()
+        print(f"通过: {test.__name__}")
+    print(f"全部 {len(tests)} 项测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+批量合成测试脚本
+
+替换段落合成函数，验证批量接口在条目间对相同段落去重、每个条目输出一个part，不会访问真实上游。
+"""
+
+import threading
+
+from fastapi.testclient import TestClient
+
+import app
+import config
+from scheduler import synthesis_scheduler
+
+
+class FakeSynthesis:
+    """记录每个段落的合成次数，返回可识别的音频"""
+
+    def __init__(self):
+        self.calls = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, text, speaker, lang, deadline=None, ticket=None):
+        with self._lock:
+            self.calls[(text, speaker, lang)] = self.calls.get((text, speaker, lang), 0) + 1
+        return f"[{speaker}:{text}]".encode('utf-8')
+
+
+def parse_parts(response) -> dict:
+    """解析 multipart/mixed 响应，返回 {条目序号: (part头, 音频)}"""
+    boundary = response.headers["content-type"].split("boundary=")[1]
+    parts = {}
+    body = response.content
+    assert body.endswith(f"--{boundary}--\r\n".encode())
+    for raw in body.split(f"--{boundary}".encode())[1:-1]:
+        head, _, audio_data = raw.strip(b"\r\n").partition(b"\r\n\r\n")
+        headers = dict(line.split(": ", 1) for line in head.decode('utf-8').split("\r\n"))
+        assert int(headers["Content-Length"]) == len(audio_data)
+        parts[int(headers["X-Item-Index"])] = (headers, audio_data)
+    return parts
+
+
+# 超过 MAX_TEXT_LENGTH 的文本按句号切分，两句拼接后得到两个段落
+FIRST = "甲" * (config.MAX_TEXT_LENGTH - 10) + "。"
+SECOND = "乙" * (config.MAX_TEXT_LENGTH - 10) + "。"
+
+
+def test_prepare_deduplicates_segments():
+    """相同文本和声音的段落只保留一个，不同声音的相同文本分别合成，清理后为空的条目没有段落"""
+    items, unique_segments, total_chars, total_segments = app.prepare_batch_items([
+        app.BatchItem(input=FIRST + SECOND, voice="zh_male_xiaoming", id="a"),
+        app.BatchItem(input=SECOND, voice="zh_male_xiaoming", id="b"),
+        app.BatchItem(input=SECOND, voice="en_male_adam", id="c"),
+        app.BatchItem(input="   ", voice="zh_male_xiaoming", id="d")
+    ])
+    assert [item["id"] for item in items] == ["a", "b", "c", "d"]
+    assert items[0]["segments"] == [(FIRST, "zh_male_xiaoming", "zh"), (SECOND, "zh_male_xiaoming", "zh")]
+    assert items[1]["segments"] == [(SECOND, "zh_male_xiaoming", "zh")]
+    assert items[2]["segments"] == [(SECOND, "en_male_adam", "en")]
+    assert items[3]["segments"] == []
+    assert total_segments == 4
+    assert list(unique_segments) == items[0]["segments"] + items[2]["segments"]
+    assert total_chars >= len(FIRST) + 3 * len(SECOND)
+
+
+def test_batch_endpoint_synthesizes_once():
+    """批量接口每个去重后的段落只合成一次，每个条目的音频由自己的段落按顺序拼接"""
+    fake = FakeSynthesis()
+    original = app.get_segment_audio_cached
+    app.get_segment_audio_cached = fake
+    try:
+        client = TestClient(app.app)
+        response = client.post("/v1/audio/batch", headers={"Authorization": f"Bearer {config.API_KEY}"}, json={
+            "items": [
+                {"input": FIRST + SECOND, "voice": "zh_male_xiaoming", "id": "first"},
+                {"input": SECOND, "voice": "zh_male_xiaoming", "id": "second"},
+                {"input": FIRST + SECOND, "voice": "zh_male_xiaoming", "id": "third"}
+            ]
+        })
+    finally:
+        app.get_segment_audio_cached = original
+
+    assert response.status_code == 200
+    assert response.headers["x-batch-segments"] == "5"
+    assert response.headers["x-batch-unique-segments"] == "2"
+    assert fake.calls == {(FIRST, "zh_male_xiaoming", "zh"): 1, (SECOND, "zh_male_xiaoming", "zh"): 1}
+
+    parts = parse_parts(response)
+    assert sorted(parts) == [0, 1, 2]
+    assert [parts[index][0]["X-Item-Id"] for index in range(3)] == ["first", "second", "third"]
+    second = f"[zh_male_xiaoming:{SECOND}]".encode('utf-8')
+    assert parts[1][1] == second
+    assert parts[0][1] == parts[2][1] == f"[zh_male_xiaoming:{FIRST}]".encode('utf-8') + second
+    assert synthesis_scheduler.outstanding == 0
+
+
+def main():
+    """运行所有测试"""
+    tests = [test_prepare_deduplicates_segments, test_batch_endpoint_synthesizes_once]
+    for test in tests:
+        test()
+        print(f"通过: {test.__name__}")
+    print(f"全部 {len(tests)} 项测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+"""
+缓存统计测试脚本
+
+验证查找结果计数、命中率和节省字节，以及重用距离抽样与逐个比较的结果一致。
+"""
+
+import random
+
+import config
+from cache_telemetry import (CacheTelemetry, ReuseSampler, RESULT_HIT, RESULT_STALE,
+                             RESULT_COALESCED, RESULT_MISS, TIER_MEMORY, TIER_DISK)
+
+
+def naive_distances(accesses, max_keys):
+    """逐个比较的重用距离：上次访问之后访问过的不同键数，首次访问（或已被丢弃的键）为无穷大"""
+    recent = []
+    distances = []
+    for key in accesses:
+        if key in recent:
+            index = recent.index(key)
+            distances.append(float(len(recent) - index - 1))
+            recent.pop(index)
+            recent.append(key)
+            continue
+        distances.append(float('inf'))
+        recent.append(key)
+        if len(recent) > max_keys:
+            recent.pop(0)
+    return distances
+
+
+def test_reuse_distances():
+    """全量抽样时的重用距离与逐个比较一致（包括丢弃旧键和位置重新编号）"""
+    rng = random.Random(1)
+    for max_keys, key_space in ((5, 8), (50, 40), (50, 200)):
+        sampler = ReuseSampler(1.0, max_keys)
+        accesses = [f"键{int(rng.paretovariate(1.2)) % key_space}" for _ in range(3000)]
+        for key in accesses:
+            sampler.record(key)
+        assert list(sampler._distances) == naive_distances(accesses, max_keys), (max_keys, key_space)
+        assert sampler.cold == sum(1 for d in sampler._distances if d == float('inf'))
+
+
+def test_reuse_estimates():
+    """循环访问N个键时，容量不小于N的缓存估计全部命中，更小的缓存全部未命中"""
+    sampler = ReuseSampler(1.0, 1000)
+    for _ in range(5):
+        for i in range(100):
+            sampler.record(("文本", i))
+    snapshot = sampler.snapshot()
+    assert snapshot["cold_accesses"] == 100
+    assert snapshot["median_distance"] == 99
+    estimates = snapshot["estimated_hit_ratio"]
+    assert estimates["50"] == 0
+    assert estimates["100"] == 0.8
+    assert estimates["1000"] == 0.8
+    assert snapshot["access_counts"]["3-4"] == 0 and snapshot["access_counts"]["5-8"] == 100
+
+
+def test_lookup_counting():
+    """每次查找只计入一个结果，过期命中和合并等待计入节省字节但不计入命中率"""
+    telemetry = CacheTelemetry(ReuseSampler(0, 10))
+    before = dict(config.PERFORMANCE_METRICS)
+    key = ("你好", "zh_male_xiaoming", "zh")
+    other = ("hello", "en_female_anna", "en")
+    telemetry.record(key, RESULT_MISS)
+    telemetry.record(key, RESULT_HIT, TIER_MEMORY, 100)
+    telemetry.record(key, RESULT_HIT, TIER_DISK, 100)
+    telemetry.record(key, RESULT_STALE, TIER_MEMORY, 50)
+    telemetry.record(other, RESULT_COALESCED, size=30)
+    telemetry.record(other, RESULT_MISS)
+    telemetry.record_eviction(TIER_MEMORY, 2)
+    telemetry.record_eviction(TIER_DISK, 0)
+
+    totals = telemetry.totals()
+    assert totals["lookups"] == 6
+    assert (totals[RESULT_HIT], totals[RESULT_STALE], totals[RESULT_COALESCED], totals[RESULT_MISS]) == (2, 1, 1, 2)
+    assert totals["tier_hits"] == {TIER_MEMORY: 1, TIER_DISK: 1}
+    assert abs(totals["hit_rate"] - 2 / 6) < 1e-9
+    assert totals["bytes_saved"] == 280
+    assert totals["evictions"] == {TIER_MEMORY: 2}
+
+    voices = telemetry.breakdown()
+    assert voices["zh_male_xiaoming/zh"]["hits"] == {TIER_MEMORY: 1, TIER_DISK: 1}
+    assert voices["zh_male_xiaoming/zh"]["hit_rate"] == 0.5
+    assert voices["en_female_anna/en"]["coalesced"] == 1
+    assert voices["en_female_anna/en"]["bytes_saved"] == 30
+
+    after = config.PERFORMANCE_METRICS
+    assert after["cache_hits"] - before["cache_hits"] == 2
+    assert after["cache_misses"] - before["cache_misses"] == 2
+    assert after["stale_cache_hits"] - before["stale_cache_hits"] == 1
+    assert after["cache_coalesced"] - before["cache_coalesced"] == 1
+
+
+def main():
+    """运行所有测试"""
+    tests = [test_reuse_distances, test_reuse_estimates, test_lookup_counting]
+    for test in tests:
+        test()
+        print(f"通过: {test.__name__}")
+    print(f"全部 {len(tests)} 项测试通过")
+
+
+if __name__ == "__main__":
+    main()
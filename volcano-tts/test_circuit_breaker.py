@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+"""
+上游熔断器测试脚本
+
+验证熔断器的状态转换，以及只有反映上游状态的错误才计为失败，不会访问真实上游。
+"""
+
+import threading
+import time
+
+import requests
+
+import config
+import upstream
+from upstream import CircuitBreaker, CircuitOpenError, UpstreamError
+
+
+def wait_until(condition, timeout: float = 2.0) -> bool:
+    """等待条件成立，超时返回False"""
+    end = time.time() + timeout
+    while time.time() < end:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def http_error(status: int) -> requests.HTTPError:
+    """构造带状态码的HTTPError"""
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} Error", response=response)
+
+
+def test_opens_after_consecutive_failures():
+    """连续失败达到阈值才打开，中间的成功请求清零计数"""
+    breaker = CircuitBreaker(3, 60, probe=lambda: None)
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.before_call()
+
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.is_open()
+    try:
+        breaker.before_call()
+        raise AssertionError("熔断器打开时应拒绝请求")
+    except CircuitOpenError:
+        pass
+    snapshot = breaker.snapshot()
+    assert snapshot["opens"] == 1 and snapshot["rejected"] == 1
+
+
+def test_probe_recovery():
+    """打开后后台探测，失败时保持打开，成功后关闭并清零失败计数"""
+    results = [False, False, True]
+    calls = []
+    lock = threading.Lock()
+
+    def probe():
+        with lock:
+            ok = results[len(calls)]
+            calls.append(ok)
+        if not ok:
+            raise ConnectionError("上游不可用")
+
+    breaker = CircuitBreaker(1, 0.05, probe=probe)
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert wait_until(lambda: len(calls) >= 1)
+    assert breaker.is_open()
+    assert wait_until(lambda: breaker.state == 'closed')
+    assert calls == [False, False, True]
+    snapshot = breaker.snapshot()
+    assert snapshot["probes"] == 3
+    assert snapshot["consecutive_failures"] == 0
+    assert snapshot["opened_at"] is None
+    breaker.before_call()
+
+
+def test_only_upstream_errors_count():
+    """4xx和无音频的响应不计入熔断器，连接错误、超时、429和5xx计入"""
+    original_breaker = upstream.circuit_breaker
+    original_request = upstream._request_audio
+    original_retries = config.UPSTREAM_MAX_RETRIES
+    errors = []
+
+    def fake_request(*args, **kwargs):
+        raise errors.pop(0)
+        yield b''
+
+    breaker = CircuitBreaker(100, 60, probe=lambda: None)
+    upstream.circuit_breaker = breaker
+    upstream._request_audio = fake_request
+    config.UPSTREAM_MAX_RETRIES = 0
+    try:
+        for error in (http_error(400), http_error(404), UpstreamError("没有音频数据")):
+            errors.append(error)
+            try:
+                list(upstream.stream_audio("测试", "zh_male_xiaoming", "zh"))
+            except Exception as e:
+                assert e is error
+            assert breaker.consecutive_failures == 0, error
+
+        for error in (http_error(429), http_error(503), requests.ConnectionError("连接被拒绝"),
+                      requests.Timeout("读取超时")):
+            errors.append(error)
+            try:
+                list(upstream.stream_audio("测试", "zh_male_xiaoming", "zh"))
+            except Exception as e:
+                assert e is error
+        assert breaker.consecutive_failures == 4
+    finally:
+        upstream.circuit_breaker = original_breaker
+        upstream._request_audio = original_request
+        config.UPSTREAM_MAX_RETRIES = original_retries
+
+
+def main():
+    """运行所有测试"""
+    tests = [test_opens_after_consecutive_failures, test_probe_recovery, test_only_upstream_errors_count]
+    for test in tests:
+        test()
+        print(f"通过: {test.__name__}")
+    print(f"全部 {len(tests)} 项测试通过")
+
+
+if __name__ == "__main__":
+    main()
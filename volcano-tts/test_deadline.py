@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+"""
+请求截止时间测试脚本
+
+验证 X-Request-Timeout 请求头的解析和 REQUEST_TIMEOUT_MAX 上限，以及剩余时间和阶段耗时的计算。
+"""
+
+import time
+
+import config
+from deadline import Deadline, DeadlineExceeded
+
+
+class TimeoutConfig:
+    """临时修改 REQUEST_TIMEOUT 和 REQUEST_TIMEOUT_MAX，退出时还原"""
+
+    def __init__(self, timeout: float, timeout_max: float):
+        self.values = (timeout, timeout_max)
+
+    def __enter__(self):
+        self.saved = (config.REQUEST_TIMEOUT, config.REQUEST_TIMEOUT_MAX)
+        config.REQUEST_TIMEOUT, config.REQUEST_TIMEOUT_MAX = self.values
+
+    def __exit__(self, *exc_info):
+        config.REQUEST_TIMEOUT, config.REQUEST_TIMEOUT_MAX = self.saved
+
+
+def timeout_of(deadline: Deadline):
+    """截止时间对应的超时秒数，不限制时为None"""
+    if deadline.expires_at is None:
+        return None
+    return round(deadline.expires_at - deadline.started_at, 6)
+
+
+def test_header_clamped_to_max():
+    """请求头超过 REQUEST_TIMEOUT_MAX 时取上限，不超过时按请求头"""
+    with TimeoutConfig(60, 300):
+        assert timeout_of(Deadline.from_header(None)) == 60
+        assert timeout_of(Deadline.from_header("10")) == 10
+        assert timeout_of(Deadline.from_header("2.5")) == 2.5
+        assert timeout_of(Deadline.from_header("1000")) == 300
+        # 0或负数（不限制）同样受上限约束
+        assert timeout_of(Deadline.from_header("0")) == 300
+        assert timeout_of(Deadline.from_header("-1")) == 300
+        # 无效的请求头使用默认值
+        assert timeout_of(Deadline.from_header("abc")) == 60
+
+
+def test_default_clamped_to_max():
+    """REQUEST_TIMEOUT 超过或不限制时同样取上限；上限为0时不限制"""
+    with TimeoutConfig(600, 300):
+        assert timeout_of(Deadline.from_header(None)) == 300
+    with TimeoutConfig(0, 300):
+        assert timeout_of(Deadline.from_header(None)) == 300
+    with TimeoutConfig(0, 0):
+        assert timeout_of(Deadline.from_header(None)) is None
+        assert timeout_of(Deadline.from_header("1000")) == 1000
+
+
+def test_remaining_and_timeout():
+    """剩余时间随时间减少，单次操作的超时不超过cap和剩余时间，过期后check抛出异常"""
+    unlimited = Deadline(None)
+    assert unlimited.remaining() == float('inf')
+    assert unlimited.timeout(5) == 5
+    assert not unlimited.expired()
+
+    deadline = Deadline(0.05)
+    assert deadline.timeout(10) <= 0.05
+    assert deadline.timeout(0.01) == 0.01
+    deadline.check("测试")
+    time.sleep(0.06)
+    assert deadline.expired()
+    assert deadline.timeout(10) == 0
+    try:
+        deadline.check("测试")
+        raise AssertionError("过期后应抛出DeadlineExceeded")
+    except DeadlineExceeded as e:
+        assert "放弃测试" in str(e)
+
+
+def test_stages():
+    """mark 记录顺序阶段，add 累加工作线程中的阶段，同名阶段累加"""
+    deadline = Deadline(None, "test")
+    time.sleep(0.01)
+    deadline.mark("body")
+    deadline.add("queue", 0.5)
+    deadline.add("queue", 0.25)
+    stages = deadline.snapshot()
+    assert list(stages) == ["body", "queue"]
+    assert stages["body"] >= 0.01
+    assert stages["queue"] == 0.75
+    timing = deadline.server_timing()
+    assert timing.startswith("body;dur=") and "queue;dur=750.0" in timing and "total;dur=" in timing
+
+
+def main():
+    """运行所有测试"""
+    tests = [test_header_clamped_to_max, test_default_clamped_to_max, test_remaining_and_timeout, test_stages]
+    for test in tests:
+        test()
+        print(f"通过: {test.__name__}")
+    print(f"全部 {len(tests)} 项测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+"""
+文件响应测试脚本
+
+验证 Range 请求头的解析，以及 RangeFileResponse 返回的状态码、响应头和字节范围。
+"""
+
+import os
+import tempfile
+
+from starlette.applications import Starlette
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from file_response import parse_range, RangeFileResponse
+
+
+def assert_unsatisfiable(range_header: str, file_size: int):
+    """范围无法满足时应抛出ValueError"""
+    try:
+        parse_range(range_header, file_size)
+    except ValueError:
+        return
+    raise AssertionError(f"{range_header} 应无法满足 (文件大小 {file_size})")
+
+
+def test_parse_range():
+    """单个字节范围：起止位置、开放结尾、结尾截断到文件末尾和最后N个字节"""
+    assert parse_range("bytes=0-99", 1000) == (0, 99)
+    assert parse_range("bytes=100-", 1000) == (100, 999)
+    assert parse_range("bytes=900-5000", 1000) == (900, 999)
+    assert parse_range("bytes=999-999", 1000) == (999, 999)
+    assert parse_range("bytes=-100", 1000) == (900, 999)
+    assert parse_range("bytes=-5000", 1000) == (0, 999)
+    assert parse_range(" bytes=10-20 ", 1000) == (10, 20)
+
+
+def test_parse_range_ignored():
+    """没有请求头、多个范围或无法识别的格式返回None（返回完整文件）"""
+    assert parse_range(None, 1000) is None
+    assert parse_range("", 1000) is None
+    assert parse_range("bytes=0-10,20-30", 1000) is None
+    assert parse_range("items=0-10", 1000) is None
+    assert parse_range("bytes=abc-", 1000) is None
+
+
+def test_parse_range_unsatisfiable():
+    """起始位置超出文件、起始大于结束、空范围和空文件的后缀范围无法满足"""
+    assert_unsatisfiable("bytes=1000-", 1000)
+    assert_unsatisfiable("bytes=20-10", 1000)
+    assert_unsatisfiable("bytes=-", 1000)
+    assert_unsatisfiable("bytes=-0", 1000)
+    assert_unsatisfiable("bytes=0-", 0)
+    assert_unsatisfiable("bytes=-10", 0)
+
+
+def test_range_file_response():
+    """完整文件返回200，单个范围返回206和对应字节，无法满足的范围返回416"""
+    content = bytes(range(256)) * 1000
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "speech.mp3")
+        with open(path, "wb") as file:
+            file.write(content)
+
+        async def endpoint(request):
+            return RangeFileResponse(path, request.headers.get("range"), media_type="audio/mpeg",
+                                     filename="speech.mp3")
+
+        client = TestClient(Starlette(routes=[Route("/file", endpoint, methods=["GET", "HEAD"])]))
+
+        response = client.get("/file")
+        assert response.status_code == 200
+        assert response.content == content
+        assert response.headers["accept-ranges"] == "bytes"
+        assert response.headers["content-length"] == str(len(content))
+        assert response.headers["content-disposition"] == 'attachment; filename="speech.mp3"'
+
+        response = client.get("/file", headers={"Range": "bytes=100000-200000"})
+        assert response.status_code == 206
+        assert response.content == content[100000:200001]
+        assert response.headers["content-range"] == f"bytes 100000-200000/{len(content)}"
+
+        response = client.get("/file", headers={"Range": "bytes=-10"})
+        assert response.status_code == 206
+        assert response.content == content[-10:]
+
+        response = client.get("/file", headers={"Range": f"bytes={len(content)}-"})
+        assert response.status_code == 416
+        assert response.content == b''
+        assert response.headers["content-range"] == f"bytes */{len(content)}"
+
+        response = client.head("/file", headers={"Range": "bytes=0-9"})
+        assert response.status_code == 206
+        assert response.headers["content-length"] == "10"
+        assert response.content == b''
+
+
+def main():
+    """运行所有测试"""
+    tests = [test_parse_range, test_parse_range_ignored, test_parse_range_unsatisfiable, test_range_file_response]
+    for test in tests:
+        test()
+        print(f"通过: {test.__name__}")
+    print(f"全部 {len(tests)} 项测试通过")
+
+
+if __name__ == "__main__":
+    main()
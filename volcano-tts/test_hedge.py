@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+"""
+上游请求对冲测试脚本
+
+替换上游请求函数，验证慢的主请求被对冲请求超过时采用对冲结果并取消主请求，
+以及已取消的请求不再消耗速率限制令牌，不会访问真实上游。
+"""
+
+import threading
+import time
+
+import config
+import upstream
+from upstream import CancelToken, HedgeBudget, RequestCancelled, LatencyTracker
+
+
+class FakeUpstream:
+    """第一次请求很慢（直到被取消），之后的请求立即返回"""
+
+    def __init__(self, slow_seconds: float = 2.0):
+        self.slow_seconds = slow_seconds
+        self.calls = 0
+        self.cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self, text, speaker, lang, timeout, acquire_timeout=None, deadline=None, cancel=None):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if call == 1:
+            end = time.time() + self.slow_seconds
+            while time.time() < end:
+                if cancel is not None and cancel.cancelled:
+                    self.cancelled.set()
+                    raise RequestCancelled("请求已取消")
+                time.sleep(0.005)
+            yield b'primary'
+            return
+        yield b'hedge'
+
+
+class Patched:
+    """临时替换 upstream 模块的全局对象，退出时还原"""
+
+    def __init__(self, **values):
+        self.values = values
+        self.saved = {}
+
+    def __enter__(self):
+        for name, value in self.values.items():
+            owner = config if name.isupper() else upstream
+            self.saved[name] = (owner, getattr(owner, name))
+            setattr(owner, name, value)
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, (owner, value) in self.saved.items():
+            setattr(owner, name, value)
+
+
+def warm_tracker(latency: float = 0.02) -> LatencyTracker:
+    """填充足够的延迟样本，使对冲延迟生效"""
+    tracker = LatencyTracker()
+    for _ in range(upstream.HEDGE_MIN_SAMPLES):
+        tracker.record(latency)
+    return tracker
+
+
+def test_hedge_beats_slow_primary():
+    """主请求超过延迟分位数未返回时发送对冲请求，采用对冲结果并取消主请求"""
+    fake = FakeUpstream()
+    before = dict(config.PERFORMANCE_METRICS)
+    with Patched(_request_audio=fake, latency_tracker=warm_tracker(), hedge_budget=HedgeBudget(1.0),
+                 UPSTREAM_HEDGE_ENABLED=True, UPSTREAM_MAX_RETRIES=0):
+        start = time.time()
+        audio_data = upstream.fetch_audio("测试", "zh_male_xiaoming", "zh")
+        elapsed = time.time() - start
+    assert audio_data == b'hedge'
+    assert elapsed < 1.0, elapsed
+    assert fake.cancelled.wait(1.0), "落后的主请求应被取消"
+    after = config.PERFORMANCE_METRICS
+    assert after["hedges_sent"] - before["hedges_sent"] == 1
+    assert after["hedges_won"] - before["hedges_won"] == 1
+    assert after["hedges_cancelled"] - before["hedges_cancelled"] == 1
+
+
+def test_fast_primary_not_hedged():
+    """主请求在对冲延迟内返回时不发送对冲请求"""
+    fake = FakeUpstream(slow_seconds=0)
+    before = config.PERFORMANCE_METRICS["hedges_sent"]
+    with Patched(_request_audio=fake, latency_tracker=warm_tracker(1.0), hedge_budget=HedgeBudget(1.0),
+                 UPSTREAM_HEDGE_ENABLED=True, UPSTREAM_MAX_RETRIES=0):
+        assert upstream.fetch_audio("测试", "zh_male_xiaoming", "zh") == b'primary'
+    assert fake.calls == 1
+    assert config.PERFORMANCE_METRICS["hedges_sent"] == before
+
+
+def test_cancelled_request_skips_rate_limit():
+    """已取消的请求在熔断器检查和获取速率限制令牌之前退出"""
+    acquired = []
+
+    class CountingRateLimiter:
+        def acquire(self, speaker, deadline):
+            acquired.append(speaker)
+
+    cancel = CancelToken()
+    cancel.cancel()
+    with Patched(rate_limiter=CountingRateLimiter(), _request_audio=FakeUpstream(0)):
+        try:
+            list(upstream.stream_audio("测试", "zh_male_xiaoming", "zh", cancel=cancel))
+            raise AssertionError("已取消的请求应抛出RequestCancelled")
+        except RequestCancelled:
+            pass
+    assert acquired == []
+
+
+def main():
+    """运行所有测试"""
+    tests = [test_hedge_beats_slow_primary, test_fast_primary_not_hedged, test_cancelled_request_skips_rate_limit]
+    for test in tests:
+        test()
+        print(f"通过: {test.__name__}")
+    print(f"全部 {len(tests)} 项测试通过")
+
+
+if __name__ == "__main__":
+    main()
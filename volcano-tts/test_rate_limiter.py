@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+"""
+上游速率限制测试脚本
+
+验证令牌桶的补充和等待时间，以及 RateLimiter 的全局桶、话者桶和截止时间处理，不会访问真实上游。
+"""
+
+import time
+
+from upstream import RateLimiter, RateLimitTimeout, TokenBucket
+
+
+def test_token_bucket_wait_time():
+    """令牌按速率补充且不超过 burst，不足一个时返回还需等待的时间"""
+    bucket = TokenBucket(rate=10, burst=2)
+    start = bucket.updated
+    assert bucket.wait_time() == 0
+    bucket.tokens -= 2
+    assert abs(bucket.wait_time() - 0.1) < 1e-9
+    bucket.refill(start + 0.05)
+    assert abs(bucket.tokens - 0.5) < 1e-9
+    assert abs(bucket.wait_time() - 0.05) < 1e-9
+    bucket.refill(start + 10)
+    assert bucket.tokens == 2
+
+
+def test_acquire_waits_for_token():
+    """burst 用完后按速率排队等待令牌"""
+    limiter = RateLimiter(rate=20, burst=2, speaker_rate=0, speaker_burst=0)
+    start = time.time()
+    for _ in range(2):
+        limiter.acquire("zh_male_xiaoming", start + 5)
+    assert time.time() - start < 0.03
+    limiter.acquire("zh_male_xiaoming", start + 5)
+    elapsed = time.time() - start
+    assert 0.04 <= elapsed < 0.5, elapsed
+    assert limiter.snapshot()["waited"] == 1
+
+
+def test_acquire_timeout():
+    """等待令牌会超过截止时间时立即抛出RateLimitTimeout，不消耗令牌"""
+    limiter = RateLimiter(rate=1, burst=1, speaker_rate=0, speaker_burst=0)
+    limiter.acquire("zh_male_xiaoming", time.time() + 5)
+    start = time.time()
+    try:
+        limiter.acquire("zh_male_xiaoming", time.time() + 0.2)
+        raise AssertionError("截止时间不足时应抛出RateLimitTimeout")
+    except RateLimitTimeout:
+        pass
+    assert time.time() - start < 0.1
+    try:
+        limiter.acquire("zh_male_xiaoming", time.time())
+        raise AssertionError("截止时间已过时应抛出RateLimitTimeout")
+    except RateLimitTimeout:
+        pass
+    assert limiter.snapshot()["timeouts"] == 2
+
+
+def test_speaker_buckets():
+    """话者桶相互独立，同时受全局桶限制；速率为0表示不限制"""
+    limiter = RateLimiter(rate=0, burst=0, speaker_rate=1, speaker_burst=1)
+    deadline = time.time() + 0.2
+    limiter.acquire("zh_male_xiaoming", deadline)
+    limiter.acquire("zh_female_cancan", deadline)
+    try:
+        limiter.acquire("zh_male_xiaoming", deadline)
+        raise AssertionError("话者令牌用完时应等待或超时")
+    except RateLimitTimeout:
+        pass
+
+    limiter = RateLimiter(rate=1, burst=1, speaker_rate=100, speaker_burst=10)
+    limiter.acquire("zh_male_xiaoming", deadline)
+    try:
+        limiter.acquire("zh_female_cancan", deadline)
+        raise AssertionError("全局令牌用完时其他话者也应等待")
+    except RateLimitTimeout:
+        pass
+
+    unlimited = RateLimiter(rate=0, burst=0, speaker_rate=0, speaker_burst=0)
+    for _ in range(1000):
+        unlimited.acquire("zh_male_xiaoming", time.time())
+
+
+def main():
+    """运行所有测试"""
+    tests = [test_token_bucket_wait_time, test_acquire_waits_for_token, test_acquire_timeout, test_speaker_buckets]
+    for test in tests:
+        test()
+        print(f"通过: {test.__name__}")
+    print(f"全部 {len(tests)} 项测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+"""
+合成调度器测试脚本
+
+验证准入控制、按优先级分配名额和截止时间处理，不依赖上游服务。
+"""
+
+import threading
+import time
+
+from deadline import Deadline, DeadlineExceeded
+from scheduler import (SynthesisScheduler, SchedulerFull,
+                       PRIORITY_INTERACTIVE, PRIORITY_BATCH)
+
+
+def wait_until(condition, timeout: float = 2.0) -> bool:
+    """等待条件成立，超时返回False"""
+    end = time.time() + timeout
+    while time.time() < end:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_admit_budget():
+    """排队段落超出预算时拒绝，关闭凭据后归还预算"""
+    scheduler = SynthesisScheduler(max_concurrency=2, max_queue=5)
+    # 空闲时即使超出上限也允许一个请求进入，避免长文本永远无法合成
+    first = scheduler.admit(8, PRIORITY_BATCH)
+    assert scheduler.outstanding == 8
+    first.close()
+    assert scheduler.outstanding == 0
+
+    ticket = scheduler.admit(4, PRIORITY_BATCH)
+    try:
+        scheduler.admit(2, PRIORITY_INTERACTIVE)
+        raise AssertionError("超出预算的请求应被拒绝")
+    except SchedulerFull as e:
+        assert e.retry_after >= 1
+    assert scheduler.snapshot()["rejected"] == 1
+    ticket.close()
+    scheduler.admit(2, PRIORITY_INTERACTIVE).close()
+    assert scheduler.outstanding == 0
+
+
+def test_close_idempotent():
+    """重复关闭凭据只归还一次预算，关闭后完成的段落不再扣减"""
+    scheduler = SynthesisScheduler(max_concurrency=2, max_queue=10)
+    other = scheduler.admit(2, PRIORITY_BATCH)
+    ticket = scheduler.admit(3, PRIORITY_BATCH)
+    scheduler.acquire(ticket)
+    ticket.close()
+    ticket.close()
+    assert scheduler.outstanding == 2
+    scheduler.release(ticket, 0.0)
+    assert scheduler.outstanding == 2
+    other.close()
+    assert scheduler.outstanding == 0
+
+
+def test_release_consumes_budget():
+    """每个完成的段落归还一个排队预算"""
+    scheduler = SynthesisScheduler(max_concurrency=2, max_queue=10)
+    ticket = scheduler.admit(3, PRIORITY_BATCH)
+    for _ in range(2):
+        with scheduler.slot(ticket):
+            pass
+    assert scheduler.outstanding == 1
+    assert scheduler.running == 0
+    ticket.close()
+    assert scheduler.outstanding == 0
+
+
+def test_priority_order():
+    """名额释放时交互优先级先于先排队的批量优先级"""
+    scheduler = SynthesisScheduler(max_concurrency=1, max_queue=10)
+    holder = scheduler.ticket(PRIORITY_BATCH)
+    scheduler.acquire(holder)
+    order = []
+
+    def worker(priority: int, name: str):
+        with scheduler.slot(scheduler.ticket(priority)):
+            order.append(name)
+
+    batch = threading.Thread(target=worker, args=(PRIORITY_BATCH, "batch"))
+    batch.start()
+    assert wait_until(lambda: scheduler.snapshot()["queued"] == 1)
+    interactive = threading.Thread(target=worker, args=(PRIORITY_INTERACTIVE, "interactive"))
+    interactive.start()
+    assert wait_until(lambda: scheduler.snapshot()["queued"] == 2)
+
+    scheduler.release(holder, 0.0)
+    batch.join(2)
+    interactive.join(2)
+    assert order == ["interactive", "batch"], order
+
+
+def test_wait_without_deadline():
+    """不限制截止时间（REQUEST_TIMEOUT=0）的请求可以在已满的调度器中排队"""
+    scheduler = SynthesisScheduler(max_concurrency=1, max_queue=10)
+    holder = scheduler.ticket()
+    scheduler.acquire(holder)
+    deadline = Deadline(None)
+    assert deadline.remaining() == float('inf')
+    errors = []
+    acquired = threading.Event()
+
+    def worker():
+        try:
+            with scheduler.slot(scheduler.ticket(), deadline):
+                acquired.set()
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    assert wait_until(lambda: scheduler.snapshot()["queued"] == 1 or errors)
+    assert not errors, errors
+    scheduler.release(holder, 0.0)
+    thread.join(2)
+    assert acquired.is_set()
+    assert not errors, errors
+
+
+def test_deadline_exceeded():
+    """等待名额超过截止时间时抛出DeadlineExceeded并退出队列"""
+    scheduler = SynthesisScheduler(max_concurrency=1, max_queue=10)
+    holder = scheduler.ticket()
+    scheduler.acquire(holder)
+    try:
+        scheduler.acquire(scheduler.ticket(), Deadline(0.05))
+        raise AssertionError("应超过截止时间")
+    except DeadlineExceeded:
+        pass
+    assert scheduler.snapshot()["queued"] == 0
+    scheduler.release(holder, 0.0)
+    assert scheduler.running == 0
+
+
+def main():
+    """运行所有测试"""
+    tests = [test_admit_budget, test_close_idempotent, test_release_consumes_budget, test_priority_order,
+             test_wait_without_deadline, test_deadline_exceeded]
+    for test in tests:
+        test()
+        print(f"通过: {test.__name__}")
+    print(f"全部 {len(tests)} 项测试通过")
+
+
+if __name__ == "__main__":
+    main()
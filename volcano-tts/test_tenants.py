@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+租户测试脚本
+
+验证每分钟字符配额的扣除和归还、上游调用预算的等待时间，
+以及调度器在租户调用预算耗尽时等待补充，不依赖上游服务。
+"""
+
+import time
+
+from scheduler import SynthesisScheduler, PRIORITY_BATCH
+from tenants import Tenant, TenantRegistry, QuotaExceeded
+
+
+def test_char_quota_charge_and_refund():
+    """字符配额不足时拒绝并给出重试间隔，归还后可以再次扣除"""
+    tenant = Tenant("sk-test-key-0001", "alice", chars_per_minute=600)
+    tenant.charge_chars(500, 3)
+    try:
+        tenant.charge_chars(200, 1)
+        raise AssertionError("字符配额不足时应拒绝")
+    except QuotaExceeded as e:
+        # 还差约100个字符，按每秒10个字符补充
+        assert 9 <= e.retry_after <= 11, e.retry_after
+
+    tenant.refund_chars(500, 3)
+    tenant.charge_chars(550, 2)
+    usage = tenant.snapshot()["usage"]
+    assert usage["requests"] == 1
+    assert usage["chars"] == 550 and usage["segments"] == 2
+    assert usage["rejected_requests"] == 2
+
+
+def test_char_quota_limits():
+    """单个请求超过每分钟配额时直接拒绝；配额为0表示不限制"""
+    tenant = Tenant("sk-test-key-0002", "bob", chars_per_minute=100)
+    try:
+        tenant.charge_chars(101, 1)
+        raise AssertionError("超过每分钟配额的请求应被拒绝")
+    except QuotaExceeded as e:
+        assert e.retry_after == 60
+
+    unlimited = Tenant("sk-test-key-0003", "carol")
+    for _ in range(100):
+        unlimited.charge_chars(100000, 10)
+    assert unlimited.call_wait_time() == 0
+
+
+def test_call_wait_time():
+    """上游调用预算用完后按速率计算等待时间"""
+    tenant = Tenant("sk-test-key-0004", "dave", upstream_calls_per_minute=60)
+    for _ in range(60):
+        assert tenant.call_wait_time() == 0
+        tenant.take_call(0.0)
+    wait = tenant.call_wait_time()
+    assert 0.9 < wait <= 1.0, wait
+    assert tenant.snapshot()["usage"]["upstream_calls"] == 60
+
+
+def test_scheduler_waits_for_call_budget():
+    """调度器在租户调用预算耗尽时等待补充后再分配名额"""
+    tenant = Tenant("sk-test-key-0005", "erin", upstream_calls_per_minute=600)
+    for _ in range(600):
+        tenant.take_call(0.0)
+    scheduler = SynthesisScheduler(max_concurrency=4, max_queue=10)
+    start = time.time()
+    with scheduler.slot(scheduler.ticket(PRIORITY_BATCH, tenant)):
+        waited = time.time() - start
+    # 每秒补充10次调用，需要等待约0.1秒
+    assert 0.05 <= waited < 1.0, waited
+    assert tenant.snapshot()["usage"]["upstream_calls"] == 601
+
+
+def test_registry():
+    """配置的租户按密钥查找；默认密钥总有不受限制的默认租户；无效配置被忽略"""
+    registry = TenantRegistry({
+        "sk-alice-key-0001": {"name": "alice", "weight": 2, "chars_per_minute": 1000},
+        "sk-broken-key-002": {"weight": "heavy"}
+    }, "sk-default-key-01")
+    assert registry.get("sk-alice-key-0001").weight == 2
+    assert registry.get("sk-default-key-01").name == "default"
+    assert registry.get("sk-broken-key-002") is None
+    assert registry.get("sk-unknown") is None
+    assert registry.find("alice") is registry.get("sk-alice-key-0001")
+    assert registry.snapshot()["alice"]["key"] == "sk-a...0001"
+
+
+def main():
+    """运行所有测试"""
+    tests = [test_char_quota_charge_and_refund, test_char_quota_limits, test_call_wait_time,
+             test_scheduler_waits_for_call_budget, test_registry]
+    for test in tests:
+        test()
+        print(f"通过: {test.__name__}")
+    print(f"全部 {len(tests)} 项测试通过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+文本处理模块
+
+请求文本的清理、声音解析和分段，供HTTP接口、后台任务和命令行工具共用。
+"""
+
+import re
+import logging
+from typing import List, Tuple
+
+import config
+
+# 获取日志记录器（与应用共用，确保写入日志文件）
+logger = logging.getLogger('volcano_tts')
+
+# 文本分段函数
+def split_text(text: str, max_length: int = config.MAX_TEXT_LENGTH) -> List[str]:
+    """
+    将长文本分割成适合TTS处理的短段落
+
+    参数:
+        text: 要分割的文本
+        max_length: 每段最大长度
+
+    返回:
+        分割后的文本段落列表
+    """
+    # 如果文本长度小于最大长度，直接返回
+    if len(text) <= max_length:
+        return [text]
+
+    # 分段结果
+    segments = []
+
+    # 按标点符号分割
+    # 优先级：句号/问号/感叹号 > 逗号/分号/冒号 > 其他
+    patterns = [
+        r'[.!?。！？]', # 句末标点
+        r'[,;:，；：]', # 句中标点
+        r'[ \n\t]'     # 空格和换行
+    ]
+
+    # 当前处理的文本
+    remaining_text = text
+
+    while len(remaining_text) > max_length:
+        # 在最大长度范围内寻找合适的分割点
+        segment = remaining_text[:max_length]
+        split_pos = -1
+
+        # 按优先级尝试不同的分割模式
+        for pattern in patterns:
+            # 从后向前查找最后一个匹配的标点
+            matches = list(re.finditer(pattern, segment))
+            if matches:
+                # 找到最后一个匹配的位置
+                split_pos = matches[-1].end()
+                break
+
+        # 如果没有找到合适的分割点，强制在最大长度处分割
+        if split_pos == -1:
+            split_pos = max_length
+
+        # 添加分段并更新剩余文本
+        segments.append(remaining_text[:split_pos].strip())
+        remaining_text = remaining_text[split_pos:].strip()
+
+    # 添加最后一段
+    if remaining_text:
+        segments.append(remaining_text)
+
+    return segments
+
+# 文本清理函数
+def clean_text(text: str) -> str:
+    """额外的文本清理步骤，处理特殊字符和格式"""
+    # 1. 移除所有HTML标签
+    cleaned_text = re.sub(r'<[^>]*>', '', text)
+
+    # 2. 规范化换行符
+    cleaned_text = re.sub(r'\r\n', '\n', cleaned_text)
+    cleaned_text = re.sub(r'\r', '\n', cleaned_text)
+
+    # 3. 移除连续的换行符
+    cleaned_text = re.sub(r'\n{3,}', '\n\n', cleaned_text)
+
+    # 4. 移除特殊Unicode字符
+    cleaned_text = re.sub(r'[\u2000-\u206F\u2E00-\u2E7F\\\'!"#$%&()*+,\-.\/:;<=>?@\[\]^_`{|}~]', ' ', cleaned_text)
+
+    # 5. 移除多余的空格
+    cleaned_text = re.sub(r' {2,}', ' ', cleaned_text)
+    return cleaned_text.strip()
+
+# 声音解析函数
+def resolve_voice(voice: str) -> Tuple[str, str]:
+    """
+    将请求中的声音名称或ID解析为 (话者ID, 语言)
+
+    未找到指定的声音时使用默认话者
+    """
+    lang = "zh"  # 默认中文
+    speaker = voice
+
+    # 如果传入的是语音名称而不是ID，尝试查找对应的ID
+    voice_id_found = False
+    for lang_code, voice_dict in config.VOICE_CONFIG.items():
+        # 通过名称查找ID
+        for voice_id, voice_name in voice_dict.items():
+            if voice_name == speaker:
+                speaker = voice_id
+                lang = config.LANGUAGE_MAP.get(lang_code, "zh")
+                voice_id_found = True
+                break
+        # 通过ID查找
+        if not voice_id_found and speaker in voice_dict:
+            lang = config.LANGUAGE_MAP.get(lang_code, "zh")
+            voice_id_found = True
+            break
+        if voice_id_found:
+            break
+
+    # 如果没找到指定的声音，使用默认话者
+    if not voice_id_found:
+        logger.warning(f"未找到声音 {speaker}，使用默认声音")
+        lang = "zh"
+        speaker = config.DEFAULT_SPEAKERS["zh_cn"]
+    return speaker, lang
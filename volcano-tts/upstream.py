@@ -0,0 +1,1028 @@
+"""
+火山引擎上游客户端模块
+
+负责向 translate.volcengine.com（或 UPSTREAM_URL 指定的地址）发送合成请求，并以流式方式增量解析响应：
+响应体边接收边扫描JSON，audio字段中的Base64数据按块解码后立即产出，
+无需等待完整响应，也不会为整段Base64构建额外的字符串副本。
+"""
+
+import base64
+import logging
+import random
+import threading
+import time
+import concurrent.futures
+from collections import deque
+from typing import Any, Dict, Generator, List, Optional
+from urllib.parse import urlsplit
+
+import requests
+import urllib3
+
+import config
+from deadline import Deadline, DeadlineExceeded
+import metrics
+
+# 获取日志记录器（与应用共用，确保写入日志文件）
+logger = logging.getLogger('volcano_tts')
+
+# 禁用不安全请求警告
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# 火山引擎TTS接口地址（可通过 UPSTREAM_URL 指向本地模拟上游）
+UPSTREAM_URL = config.UPSTREAM_URL
+
+# 每次从响应体读取的字节数（Base64文本）
+READ_CHUNK_SIZE = 16384
+
+# 错误信息中保留的非音频响应内容上限
+MAX_META_BYTES = 2048
+
+# 对冲前至少需要的延迟样本数，以及最小对冲等待时间（秒）
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY = 0.05
+
+# 对冲比例的统计窗口（秒）和分桶数
+HEDGE_BUDGET_WINDOW = 60.0
+HEDGE_BUDGET_BUCKETS = 12
+
+# 火山引擎请求头
+HEADERS = {
+    "authority": "translate.volcengine.com",
+    "origin": "chrome-extension://klgfhbdadaspgppeadghjjemk",
+    "accept": "application/json, text/plain, */*",
+    "content-type": "application/json",
+    "sec-fetch-dest": "empty",
+    "sec-fetch-mode": "cors",
+    "sec-fetch-site": "none",
+    "cookie": "hasUserBehavior=1",
+    "user-agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/106.0.0.0 Safari/537.36"
+}
+
+# 等待并发名额的最长时间（秒）
+ACQUIRE_TIMEOUT = 30
+
+# 自适应并发限制：减小后的冷却时间（秒），以及判定延迟稳定的倍数
+LIMIT_DECREASE_COOLDOWN = 1.0
+LIMIT_LATENCY_TOLERANCE = 2.0
+
+# 重试退避的最大等待时间（秒）
+RETRY_BACKOFF_CAP = 5.0
+
+# 熔断器半开探测使用的文本
+PROBE_TEXT = "你好"
+
+# 创建持久会话，连接池大小与并发上限保持一致
+session = requests.Session()
+adapter = requests.adapters.HTTPAdapter(
+    pool_connections=10,
+    pool_maxsize=max(10, config.UPSTREAM_CONCURRENCY_MAX),
+    # 重试由 stream_audio 负责（带退避并计入速率限制），连接池本身不再重试
+    max_retries=0
+)
+session.mount('https://', adapter)
+session.mount('http://', adapter)
+
+
+class UpstreamError(Exception):
+    """上游返回的数据无法解析为音频"""
+
+
+class UpstreamOverloaded(Exception):
+    """等待上游并发名额超时"""
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，上游请求被立即拒绝"""
+
+
+class RateLimitTimeout(UpstreamOverloaded):
+    """在截止时间内未能获得速率限制令牌"""
+
+
+class RequestCancelled(Exception):
+    """请求被取消（对冲中落后的请求）"""
+
+
+class CancelToken:
+    """
+    可取消的上游获取
+
+    取消时关闭正在读取的响应，请求随即结束并释放并发名额；
+    尚未发出的请求（包括重试）不再发出。
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._response = None
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self) -> None:
+        """取消请求，关闭正在读取的响应"""
+        with self._lock:
+            self._cancelled.set()
+            response = self._response
+        if response is not None:
+            response.close()
+
+    def attach(self, response) -> None:
+        """登记正在读取的响应（已取消时立即关闭）"""
+        with self._lock:
+            self._response = response
+        if self.cancelled:
+            response.close()
+
+    def check(self) -> None:
+        """已取消时抛出RequestCancelled"""
+        if self.cancelled:
+            raise RequestCancelled("请求已取消")
+
+
+class AudioStreamDecoder:
+    """
+    增量解析火山引擎的JSON响应，边接收边解码audio字段
+
+    支持两种响应格式：
+        {"audio": "<base64>", ...}
+        {"audio": {"data": "<base64>", ...}, ...}（旧版格式）
+
+    除audio字段外的其他内容只做最小化的词法扫描（字符串、括号、冒号），
+    audio字符串本身按块处理，每次解码4字节对齐的Base64前缀。
+    """
+
+    _WHITESPACE = b' \t\r\n'
+
+    def __init__(self):
+        self._in_string = False
+        self._escape = False
+        self._token = bytearray()
+        self._pending_key: Optional[str] = None
+        self._current_key: Optional[str] = None
+        self._stack: List[Optional[str]] = []
+        self._await_value = False
+        self._in_audio = False
+        self._audio_escape = False
+        self._b64_buffer = bytearray()
+        self._meta = bytearray()
+        self.found = False
+        self.done = False
+
+    def feed(self, chunk: bytes) -> bytes:
+        """输入一块响应数据，返回本次可以解码出的音频字节"""
+        if self.done or not chunk:
+            return b''
+
+        decoded = bytearray()
+        i = 0
+        n = len(chunk)
+        while i < n and not self.done:
+            if self._in_audio:
+                i = self._consume_audio(chunk, i, decoded)
+            else:
+                i = self._scan(chunk, i)
+        return bytes(decoded)
+
+    def close(self) -> None:
+        """响应结束时调用，未找到完整的audio字段时抛出UpstreamError"""
+        if not self.found:
+            meta = self._meta.decode('utf-8', errors='replace')
+            raise UpstreamError(f"响应中没有音频数据: {meta}")
+        if not self.done:
+            raise UpstreamError("音频数据不完整，响应提前结束")
+
+    def _scan(self, chunk: bytes, i: int) -> int:
+        """扫描audio字段之前的JSON结构，返回下一个待处理位置"""
+        n = len(chunk)
+        while i < n:
+            c = chunk[i]
+            if len(self._meta) < MAX_META_BYTES:
+                self._meta.append(c)
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    self._token.append(c)
+                elif c == 0x5C:  # 反斜杠
+                    self._escape = True
+                elif c == 0x22:  # 引号，字符串结束
+                    self._in_string = False
+                    self._pending_key = self._token.decode('utf-8', errors='replace')
+                else:
+                    self._token.append(c)
+                i += 1
+                continue
+
+            if self._await_value and c not in self._WHITESPACE:
+                # 冒号之后的第一个非空白字符决定值的类型
+                self._await_value = False
+                if c == 0x22 and self._is_audio_key():
+                    self.found = True
+                    self._in_audio = True
+                    return i + 1
+
+            if c == 0x22:
+                self._in_string = True
+                self._token = bytearray()
+            elif c == 0x3A:  # 冒号
+                self._current_key = self._pending_key
+                self._pending_key = None
+                self._await_value = True
+            elif c in (0x7B, 0x5B):  # { [
+                self._stack.append(self._current_key)
+                self._current_key = None
+            elif c in (0x7D, 0x5D):  # } ]
+                if self._stack:
+                    self._stack.pop()
+                self._current_key = None
+            elif c == 0x2C:  # 逗号
+                self._current_key = None
+                self._pending_key = None
+            i += 1
+        return i
+
+    def _is_audio_key(self) -> bool:
+        """判断当前值是否为音频数据"""
+        if self._current_key == 'audio' and len(self._stack) == 1:
+            return True
+        return self._current_key == 'data' and self._stack[1:] == ['audio'] and len(self._stack) == 2
+
+    def _consume_audio(self, chunk: bytes, i: int, decoded: bytearray) -> int:
+        """处理audio字符串内容，返回下一个待处理位置"""
+        n = len(chunk)
+        while i < n:
+            if self._audio_escape:
+                # 被转义的字符：\/ 保留斜杠，其余（\n等）丢弃
+                if chunk[i] == 0x2F:
+                    self._b64_buffer.append(0x2F)
+                self._audio_escape = False
+                i += 1
+                continue
+
+            # Base64字符集不含引号和反斜杠，只需定位这两种特殊字符
+            quote = chunk.find(b'"', i)
+            backslash = chunk.find(b'\\', i)
+            stops = [pos for pos in (quote, backslash) if pos != -1]
+            stop = min(stops) if stops else n
+            self._b64_buffer.extend(chunk[i:stop].translate(None, self._WHITESPACE))
+
+            if stop == n:
+                break
+            if stop == backslash:
+                self._audio_escape = True
+                i = stop + 1
+                continue
+
+            # 字符串结束，解码剩余数据
+            decoded.extend(self._decode_available(final=True))
+            self._in_audio = False
+            self.done = True
+            return stop + 1
+
+        decoded.extend(self._decode_available())
+        return n
+
+    def _decode_available(self, final: bool = False) -> bytes:
+        """解码缓冲区中4字节对齐的部分"""
+        if final:
+            data = bytes(self._b64_buffer)
+            self._b64_buffer.clear()
+            if not data:
+                return b''
+            # 补齐缺失的填充
+            data += b'=' * (-len(data) % 4)
+            return base64.b64decode(data)
+
+        usable = len(self._b64_buffer) - len(self._b64_buffer) % 4
+        if usable == 0:
+            return b''
+        data = bytes(self._b64_buffer[:usable])
+        del self._b64_buffer[:usable]
+        return base64.b64decode(data)
+
+
+class LatencyTracker:
+    """记录最近成功请求的耗时，用于计算动态延迟分位数"""
+
+    def __init__(self, window: int = 500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, latency: float) -> None:
+        """记录一次请求耗时（秒）"""
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """返回第p百分位的耗时，样本不足时返回None"""
+        # 持锁只复制样本，排序在锁外进行，不阻塞并发的 record
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            samples = list(self._samples)
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * p / 100))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取延迟分布概览"""
+        with self._lock:
+            samples = list(self._samples)
+        ordered = sorted(samples)
+        if not ordered:
+            return {"samples": 0}
+        pick = lambda p: ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+        return {
+            "samples": len(ordered),
+            "p50": round(pick(50), 4),
+            "p95": round(pick(95), 4),
+            "p99": round(pick(99), 4)
+        }
+
+
+class HedgeBudget:
+    """
+    限制最近 window 秒内对冲请求占总请求的比例
+
+    按时间分桶计数，过期的桶整体丢弃；延迟升高时的对冲数量由最近的请求量决定，
+    不会因为服务长时间运行积累的额度而集中发送。
+    """
+
+    def __init__(self, max_ratio: float, window: float = HEDGE_BUDGET_WINDOW,
+                 buckets: int = HEDGE_BUDGET_BUCKETS):
+        self.max_ratio = max_ratio
+        self.window = window
+        self._bucket_width = window / max(1, buckets)
+        # [桶起始时间, 原始请求数, 对冲请求数]
+        self._buckets = deque()
+        self._lock = threading.Lock()
+
+    def _current(self, now: float) -> list:
+        """丢弃窗口外的桶，返回当前的桶（需持有锁）"""
+        while self._buckets and self._buckets[0][0] + self._bucket_width <= now - self.window:
+            self._buckets.popleft()
+        start = now - now % self._bucket_width
+        if not self._buckets or self._buckets[-1][0] != start:
+            self._buckets.append([start, 0, 0])
+        return self._buckets[-1]
+
+    def record_request(self) -> None:
+        """记录一次原始请求"""
+        with self._lock:
+            self._current(time.monotonic())[1] += 1
+
+    def try_acquire(self) -> bool:
+        """在最近窗口内不超过比例上限时占用一次对冲额度"""
+        with self._lock:
+            current = self._current(time.monotonic())
+            requests_count = sum(bucket[1] for bucket in self._buckets)
+            hedges = sum(bucket[2] for bucket in self._buckets)
+            if hedges + 1 > self.max_ratio * requests_count:
+                return False
+            current[2] += 1
+            return True
+
+
+class AdaptiveLimiter:
+    """
+    上游调用的全局自适应并发限制（AIMD）
+
+    请求成功且延迟稳定时，并发上限每轮增加约1（每次成功增加 1/limit）；
+    遇到超时、429或5xx时上限减半，冷却期内只减小一次，避免同一批失败连续减半。
+    """
+
+    def __init__(self, initial: int, min_limit: int, max_limit: int):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self.waiting = 0
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self._wait_samples = deque(maxlen=500)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._acquired = 0
+        self._overloads = 0
+
+    def acquire(self, timeout: float = ACQUIRE_TIMEOUT) -> None:
+        """获取一个并发名额，超时抛出UpstreamOverloaded"""
+        start_time = time.time()
+        deadline = start_time + timeout
+        with self._cond:
+            self.waiting += 1
+            try:
+                while self.in_flight >= int(self.limit):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        raise UpstreamOverloaded(f"等待上游并发名额超时 ({timeout}秒)")
+                    self._cond.wait(remaining)
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+            waited = time.time() - start_time
+            self._acquired += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+            self._wait_samples.append(waited)
+
+    def release(self, outcome: str, latency: float) -> None:
+        """
+        释放名额并根据结果调整上限
+
+        参数:
+            outcome: 'success'、'overload'（超时/429/5xx）或 'error'（其他错误，不调整）
+            latency: 本次调用耗时（秒）
+        """
+        # 延迟基线需要排序样本，在获取限流器锁之前计算，避免每次完成都在锁内排序
+        baseline = latency_tracker.percentile(50) if outcome == 'success' else None
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == 'overload':
+                self._overloads += 1
+                now = time.time()
+                if now - self._last_decrease >= LIMIT_DECREASE_COOLDOWN:
+                    self.limit = max(self.min_limit, self.limit / 2)
+                    self._last_decrease = now
+                    logger.warning(f"上游过载，并发上限降为 {int(self.limit)}")
+            elif outcome == 'success':
+                if baseline is None or latency <= baseline * LIMIT_LATENCY_TOLERANCE:
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取限流器状态"""
+        with self._cond:
+            waits = list(self._wait_samples)
+            state = {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "overloads": self._overloads,
+                "queue_wait_avg": round(self._wait_total / self._acquired, 4) if self._acquired else 0,
+                "queue_wait_max": round(self._wait_max, 4)
+            }
+        waits.sort()
+        state["queue_wait_p95"] = round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 4) if waits else 0
+        return state
+
+
+class TokenBucket:
+    """令牌桶：以固定速率补充令牌，最多累积 burst 个（非线程安全，由RateLimiter加锁）"""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        """根据经过的时间补充令牌"""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """获得一个令牌还需等待的时间（秒）"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """
+    上游速率限制：全局令牌桶加每个话者独立的令牌桶
+
+    请求需要同时从两个桶中各取一个令牌；令牌不足时排队等待，
+    超过截止时间仍无法获得令牌才抛出RateLimitTimeout。速率为0表示不限制。
+    """
+
+    def __init__(self, rate: float, burst: int, speaker_rate: float, speaker_burst: int):
+        self._global = TokenBucket(rate, burst) if rate > 0 else None
+        self._speaker_rate = speaker_rate
+        self._speaker_burst = speaker_burst
+        self._speakers: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._waited = 0
+        self._wait_total = 0.0
+        self._timeouts = 0
+
+    def acquire(self, speaker: str, deadline: float) -> None:
+        """
+        为指定话者获取一个令牌
+
+        参数:
+            speaker: 话者ID
+            deadline: 截止时间（time.time() 时间戳）
+        """
+        start_time = time.time()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                buckets = [b for b in (self._global, self._speaker_bucket(speaker)) if b is not None]
+                for bucket in buckets:
+                    bucket.refill(now)
+                wait = max([bucket.wait_time() for bucket in buckets], default=0.0)
+                if wait == 0:
+                    for bucket in buckets:
+                        bucket.tokens -= 1
+                    waited = time.time() - start_time
+                    if waited > 0.001:
+                        self._waited += 1
+                        self._wait_total += waited
+                    return
+                remaining = deadline - time.time()
+                if wait > remaining:
+                    self._timeouts += 1
+                    raise RateLimitTimeout(f"速率限制排队超过截止时间 (话者: {speaker})")
+            time.sleep(wait)
+
+    def _speaker_bucket(self, speaker: str) -> Optional[TokenBucket]:
+        """获取话者的令牌桶（需持有锁）"""
+        if self._speaker_rate <= 0:
+            return None
+        bucket = self._speakers.get(speaker)
+        if bucket is None:
+            bucket = TokenBucket(self._speaker_rate, self._speaker_burst)
+            self._speakers[speaker] = bucket
+        return bucket
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取速率限制状态"""
+        with self._lock:
+            return {
+                "rate": self._global.rate if self._global else 0,
+                "speaker_rate": self._speaker_rate,
+                "speakers": len(self._speakers),
+                "waited": self._waited,
+                "wait_avg": round(self._wait_total / self._waited, 4) if self._waited else 0,
+                "timeouts": self._timeouts
+            }
+
+
+class CircuitBreaker:
+    """
+    上游熔断器
+
+    连续失败达到阈值后打开，打开期间所有请求立即失败，不再占用工作线程和连接。
+    打开后由后台线程每隔 reset_timeout 秒发送一次半开探测，探测成功后关闭。
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, probe):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe = probe
+        self._probe_thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._rejected = 0
+        self._probes = 0
+        self._opens = 0
+
+    def is_open(self) -> bool:
+        """熔断器是否处于打开（或半开探测）状态"""
+        return self.state != 'closed'
+
+    def before_call(self) -> None:
+        """请求前检查，熔断器打开时抛出CircuitOpenError"""
+        if self.state == 'closed':
+            return
+        with self._lock:
+            self._rejected += 1
+        raise CircuitOpenError("上游熔断器已打开，请求被拒绝")
+
+    def record_success(self) -> None:
+        """记录一次成功请求"""
+        with self._lock:
+            self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        """记录一次失败请求，达到阈值时打开熔断器"""
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state != 'closed' or self.consecutive_failures < self.failure_threshold:
+                return
+            self._open()
+
+    def _open(self) -> None:
+        """打开熔断器并启动后台探测线程（需持有锁）"""
+        self.state = 'open'
+        self.opened_at = time.time()
+        self._opens += 1
+        logger.error(f"上游连续失败 {self.consecutive_failures} 次，熔断器打开，{self.reset_timeout}秒后开始探测")
+        if self._probe_thread is None or not self._probe_thread.is_alive():
+            self._probe_thread = threading.Thread(target=self._probe_loop, name='upstream-breaker-probe', daemon=True)
+            self._probe_thread.start()
+
+    def _probe_loop(self) -> None:
+        """后台探测，直到上游恢复"""
+        while True:
+            time.sleep(self.reset_timeout)
+            with self._lock:
+                self.state = 'half_open'
+                self._probes += 1
+            try:
+                self._probe()
+            except Exception as e:
+                with self._lock:
+                    self.state = 'open'
+                    self.opened_at = time.time()
+                logger.warning(f"熔断器探测失败: {str(e)}")
+                continue
+            with self._lock:
+                self.state = 'closed'
+                self.consecutive_failures = 0
+                self.opened_at = None
+            logger.info("熔断器探测成功，上游已恢复")
+            return
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取熔断器状态"""
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "opened_at": self.opened_at,
+                "opens": self._opens,
+                "rejected": self._rejected,
+                "probes": self._probes
+            }
+
+
+class ConnectionWarmer:
+    """
+    连接池预热
+
+    服务启动后在后台并行向上游站点发送若干个HEAD请求，提前完成DNS解析和TLS握手，
+    建立的连接保留在会话连接池中供后续合成请求复用。
+    HEAD请求不经过合成接口，不计入并发和速率限制；上游不可达时在超时后结束，不影响服务启动。
+    """
+
+    def __init__(self, connections: int, timeout: float):
+        self.connections = max(0, connections)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self.state: Dict[str, Any] = {
+            "status": "idle",
+            "target": self.connections,
+            "established": 0,
+            "failed": 0,
+            "error": None,
+            "duration": None
+        }
+
+    def start(self) -> None:
+        """启动后台预热线程（立即返回）"""
+        if self.connections == 0:
+            with self._lock:
+                self.state["status"] = "disabled"
+            return
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='upstream-pool-warm', daemon=True)
+        self._thread.start()
+
+    @property
+    def finished(self) -> bool:
+        """预热是否已结束（包括失败和未启用）"""
+        return self.state["status"] in ("completed", "failed", "disabled")
+
+    def _run(self) -> None:
+        """并行建立连接"""
+        parts = urlsplit(UPSTREAM_URL)
+        origin = f"{parts.scheme}://{parts.netloc}/"
+        with self._lock:
+            self.state["status"] = "running"
+        start_time = time.time()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.connections) as executor:
+            futures = [executor.submit(self._connect, origin) for _ in range(self.connections)]
+            concurrent.futures.wait(futures)
+        with self._lock:
+            self.state["duration"] = round(time.time() - start_time, 4)
+            self.state["status"] = "completed" if self.state["established"] else "failed"
+            state = dict(self.state)
+        if state["established"]:
+            logger.info(f"上游连接池预热完成: 已建立 {state['established']}/{self.connections} 个连接, "
+                        f"耗时 {state['duration']}秒")
+        else:
+            logger.warning(f"上游连接池预热失败: {state['error']}")
+
+    def _connect(self, origin: str) -> None:
+        """发送一次HEAD请求，响应读取完毕后连接归还连接池"""
+        try:
+            session.head(origin, headers=HEADERS, timeout=self.timeout, verify=False, allow_redirects=False)
+        except Exception as e:
+            with self._lock:
+                self.state["failed"] += 1
+                self.state["error"] = str(e)
+            return
+        with self._lock:
+            self.state["established"] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """获取预热状态"""
+        with self._lock:
+            return dict(self.state)
+
+
+def is_overload_error(error: Exception) -> bool:
+    """判断错误是否表示上游过载（超时、429或5xx）"""
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+
+# 创建全局实例
+latency_tracker = LatencyTracker()
+hedge_budget = HedgeBudget(config.UPSTREAM_HEDGE_MAX_RATIO)
+concurrency_limiter = AdaptiveLimiter(
+    config.UPSTREAM_CONCURRENCY_INITIAL,
+    config.UPSTREAM_CONCURRENCY_MIN,
+    config.UPSTREAM_CONCURRENCY_MAX
+)
+rate_limiter = RateLimiter(
+    config.UPSTREAM_RATE_LIMIT,
+    config.UPSTREAM_RATE_BURST,
+    config.UPSTREAM_SPEAKER_RATE_LIMIT,
+    config.UPSTREAM_SPEAKER_RATE_BURST
+)
+circuit_breaker = CircuitBreaker(
+    config.UPSTREAM_BREAKER_FAILURES,
+    config.UPSTREAM_BREAKER_RESET_TIMEOUT,
+    probe=lambda: _probe_upstream()
+)
+connection_warmer = ConnectionWarmer(config.UPSTREAM_WARM_CONNECTIONS, config.UPSTREAM_WARM_TIMEOUT)
+
+# 对冲请求使用独立的线程池，避免占用调用方的工作线程。
+# 主请求和对冲请求都在此线程池中执行：调度器最多同时运行 SCHEDULER_MAX_CONCURRENCY 个获取，
+# 每个获取最多两个任务，线程数不足时对冲请求会排在其他请求的主请求之后，无法缩短尾延迟
+_hedge_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=max(config.SCHEDULER_MAX_CONCURRENCY, config.UPSTREAM_CONCURRENCY_MAX, 2) * 2,
+    thread_name_prefix='upstream-hedge'
+)
+
+
+def stream_audio(text: str, speaker: str, lang: str, deadline: Optional[Deadline] = None,
+                 cancel: Optional[CancelToken] = None) -> Generator[bytes, None, None]:
+    """
+    向火山引擎发送合成请求，流式产出解码后的音频字节
+
+    超时、连接错误、429和5xx在尚未产出数据时按带抖动的指数退避重试，
+    每次重试同样需要通过熔断器检查并消耗速率限制令牌。
+    所有等待（排队、请求超时、退避）都不超过请求的截止时间，
+    剩余时间不足以完成一次典型请求时提前放弃。
+
+    参数:
+        text: 要合成的文本
+        speaker: 话者ID
+        lang: 语言代码
+        deadline: 请求的截止时间，None表示只受 UPSTREAM_TIMEOUT 限制
+        cancel: 取消令牌，取消后不再发出请求，正在读取的响应被关闭
+
+    异常:
+        DeadlineExceeded: 剩余时间不足，段落被放弃
+        CircuitOpenError: 熔断器打开，请求被立即拒绝
+        requests.RequestException: 网络错误或HTTP错误状态
+        UpstreamError: 响应中没有有效的音频数据
+        UpstreamOverloaded: 等待并发名额或速率限制令牌超时
+        RequestCancelled: 请求被取消
+    """
+    if deadline is None:
+        deadline = Deadline(None)
+
+    attempt = 0
+    while True:
+        _check_budget(deadline)
+        # 已取消的请求（如落后的对冲请求）不再经过熔断器，也不消耗速率限制令牌
+        if cancel is not None:
+            cancel.check()
+        circuit_breaker.before_call()
+        # 每次尝试（包括重试）都计入速率限制
+        waited_at = time.time()
+        rate_limiter.acquire(speaker, waited_at + deadline.timeout(config.UPSTREAM_RATE_MAX_WAIT))
+        deadline.add("queue", time.time() - waited_at)
+        _check_budget(deadline)
+        if cancel is not None:
+            cancel.check()
+
+        started = False
+        try:
+            for chunk in _request_audio(text, speaker, lang, deadline.timeout(config.UPSTREAM_TIMEOUT),
+                                        acquire_timeout=deadline.timeout(ACQUIRE_TIMEOUT), deadline=deadline,
+                                        cancel=cancel):
+                started = True
+                yield chunk
+        except (UpstreamOverloaded, DeadlineExceeded, RequestCancelled):
+            # 本地排队超时和主动取消不代表上游故障
+            raise
+        except Exception as e:
+            # 只有连接错误、超时、429和5xx反映上游状态；4xx和无音频的响应由请求文本导致，
+            # 既不计为失败也不计为成功，避免一批异常输入为所有租户打开熔断器
+            overloaded = is_overload_error(e)
+            if overloaded:
+                circuit_breaker.record_failure()
+            # 已经产出数据或错误不可重试时直接抛出
+            if started or attempt >= config.UPSTREAM_MAX_RETRIES or not overloaded:
+                raise
+            delay = backoff_delay(attempt)
+            if delay >= deadline.remaining():
+                raise
+            attempt += 1
+            metrics.increment("upstream_retries")
+            logger.warning(f"上游请求失败，{delay:.2f}秒后重试 ({attempt}/{config.UPSTREAM_MAX_RETRIES}): {str(e)}")
+            time.sleep(delay)
+            continue
+        circuit_breaker.record_success()
+        return
+
+
+def _check_budget(deadline: Deadline) -> None:
+    """剩余时间不足以完成一次典型请求（最近的p50耗时）时放弃"""
+    typical = latency_tracker.percentile(50) or 0
+    if deadline.remaining() <= typical:
+        raise DeadlineExceeded(f"剩余时间 {max(0.0, deadline.remaining()):.2f}秒 不足以完成段落请求")
+
+
+def backoff_delay(attempt: int) -> float:
+    """带完全抖动的指数退避时间（秒）"""
+    return random.uniform(0, min(RETRY_BACKOFF_CAP, config.UPSTREAM_RETRY_BACKOFF * (2 ** attempt)))
+
+
+def _request_audio(text: str, speaker: str, lang: str, timeout: float,
+                   acquire_timeout: float = ACQUIRE_TIMEOUT,
+                   deadline: Optional[Deadline] = None,
+                   cancel: Optional[CancelToken] = None) -> Generator[bytes, None, None]:
+    """
+    在并发限制内发送一次上游请求，流式产出解码后的音频字节
+
+    提供 deadline 时把等待并发名额的时间计入 queue 阶段，
+    base64 解码的时间计入 decode 阶段，其余时间计入 upstream 阶段。
+    提供 cancel 时，取消会关闭响应并立即释放并发名额（不调整并发上限）。
+    """
+    payload = {
+        "text": text,
+        "speaker": speaker,
+        "language": lang
+    }
+
+    waited_at = time.time()
+    concurrency_limiter.acquire(acquire_timeout)
+    start_time = time.time()
+    if deadline is not None:
+        deadline.add("queue", start_time - waited_at)
+    decode_time = 0.0
+    outcome = 'error'
+    response = None
+    metrics.increment("upstream_requests")
+    try:
+        if cancel is not None:
+            cancel.check()
+        response = session.post(
+            UPSTREAM_URL,
+            headers=HEADERS,
+            json=payload,
+            timeout=timeout,
+            verify=False,
+            stream=True
+        )
+        logger.debug(f"响应状态: {response.status_code}, 内容类型: {response.headers.get('content-type', 'unknown')}")
+        if cancel is not None:
+            cancel.attach(response)
+            cancel.check()
+        response.raise_for_status()
+
+        decoder = AudioStreamDecoder()
+        for chunk in response.iter_content(chunk_size=READ_CHUNK_SIZE):
+            decode_start = time.time()
+            audio_chunk = decoder.feed(chunk)
+            decode_time += time.time() - decode_start
+            if audio_chunk:
+                yield audio_chunk
+            if decoder.done:
+                break
+        if cancel is not None:
+            # 关闭响应后读取可能直接结束，不能当作完整的音频
+            cancel.check()
+        decode_start = time.time()
+        decoder.close()
+        decode_time += time.time() - decode_start
+        outcome = 'success'
+    except RequestCancelled:
+        outcome = 'cancelled'
+        raise
+    except Exception as e:
+        if cancel is not None and cancel.cancelled:
+            outcome = 'cancelled'
+            raise RequestCancelled("请求已取消") from e
+        if is_overload_error(e):
+            outcome = 'overload'
+        raise
+    finally:
+        if response is not None:
+            response.close()
+        latency = time.time() - start_time
+        concurrency_limiter.release(outcome, latency)
+        metrics.upstream_duration.observe(latency, outcome=outcome)
+        if deadline is not None:
+            deadline.add("upstream", latency - decode_time)
+            deadline.add("decode", decode_time)
+
+
+def _probe_upstream() -> None:
+    """熔断器的半开探测：合成一段短文本，失败时抛出异常"""
+    audio_data = b''.join(_request_audio(PROBE_TEXT, config.DEFAULT_SPEAKERS["zh_cn"], "zh", config.UPSTREAM_TIMEOUT))
+    if not audio_data:
+        raise UpstreamError("探测请求返回空音频")
+
+
+def _fetch_timed(text: str, speaker: str, lang: str, deadline: Optional[Deadline],
+                 cancel: Optional[CancelToken] = None) -> bytes:
+    """完整获取一次音频并记录耗时"""
+    start_time = time.time()
+    audio_data = b''.join(stream_audio(text, speaker, lang, deadline, cancel))
+    latency_tracker.record(time.time() - start_time)
+    return audio_data
+
+
+def fetch_audio(text: str, speaker: str, lang: str, deadline: Optional[Deadline] = None) -> bytes:
+    """
+    获取完整的段落音频，启用对冲时在慢请求上发送重复请求
+
+    若请求在动态跟踪的延迟分位数（UPSTREAM_HEDGE_PERCENTILE）内未返回，
+    且对冲比例未超过 UPSTREAM_HEDGE_MAX_RATIO，则再发送一次相同请求，
+    采用先成功返回的结果，并取消落后的请求（关闭其响应，释放并发名额）。
+    """
+    if not config.UPSTREAM_HEDGE_ENABLED:
+        return _fetch_timed(text, speaker, lang, deadline)
+
+    hedge_budget.record_request()
+    primary_cancel = CancelToken()
+    primary = _hedge_executor.submit(_fetch_timed, text, speaker, lang, deadline, primary_cancel)
+
+    hedge_delay = latency_tracker.percentile(config.UPSTREAM_HEDGE_PERCENTILE)
+    if hedge_delay is None:
+        return primary.result()
+
+    done, _ = concurrent.futures.wait([primary], timeout=max(hedge_delay, HEDGE_MIN_DELAY))
+    if done or (deadline is not None and deadline.expired()) or not hedge_budget.try_acquire():
+        return primary.result()
+
+    logger.info(f"段落请求超过 {hedge_delay:.2f}秒 未返回，发送对冲请求")
+    metrics.increment("hedges_sent")
+    hedge_cancel = CancelToken()
+    hedge = _hedge_executor.submit(_fetch_timed, text, speaker, lang, deadline, hedge_cancel)
+
+    # 采用先成功返回的结果，取消落后的请求，避免它继续占用上游并发名额
+    last_error = None
+    for future in concurrent.futures.as_completed([primary, hedge]):
+        try:
+            audio_data = future.result()
+        except Exception as e:
+            last_error = e
+            continue
+        other, other_cancel = (primary, primary_cancel) if future is hedge else (hedge, hedge_cancel)
+        if not other.done():
+            # 仍在线程池中排队的任务直接撤销，已开始的通过取消令牌关闭响应
+            other.cancel()
+            other_cancel.cancel()
+            metrics.increment("hedges_cancelled")
+        if future is hedge:
+            metrics.increment("hedges_won")
+        return audio_data
+    raise last_error
+
+
+def get_upstream_stats() -> Dict[str, Any]:
+    """获取上游客户端统计信息"""
+    return {
+        "latency": latency_tracker.snapshot(),
+        "limiter": concurrency_limiter.snapshot(),
+        "rate_limiter": rate_limiter.snapshot(),
+        "requests": config.PERFORMANCE_METRICS["upstream_requests"],
+        "retries": config.PERFORMANCE_METRICS["upstream_retries"],
+        "breaker": circuit_breaker.snapshot(),
+        "warm_pool": connection_warmer.snapshot(),
+        "hedge": {
+            "enabled": config.UPSTREAM_HEDGE_ENABLED,
+            "percentile": config.UPSTREAM_HEDGE_PERCENTILE,
+            "max_ratio": config.UPSTREAM_HEDGE_MAX_RATIO,
+            "sent": config.PERFORMANCE_METRICS["hedges_sent"],
+            "won": config.PERFORMANCE_METRICS["hedges_won"]
+        }
+    }
+
+
+metrics.registry.gauge("tts_upstream_in_flight", "正在进行的上游请求数", lambda: concurrency_limiter.in_flight)
+metrics.registry.gauge("tts_upstream_waiting", "等待上游并发名额的请求数", lambda: concurrency_limiter.waiting)
+metrics.registry.gauge("tts_upstream_concurrency_limit", "上游自适应并发上限", lambda: int(concurrency_limiter.limit))
+metrics.registry.gauge("tts_upstream_circuit_open", "上游熔断器是否打开", lambda: int(circuit_breaker.is_open()))
+metrics.registry.gauge("tts_hedge_executor_queue_depth", "对冲线程池中等待执行的任务数",
+                       lambda: metrics.executor_queue_depth(_hedge_executor))